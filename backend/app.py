@@ -7,11 +7,17 @@ from datetime import timedelta
 
 # Import internal modules
 from config import Config
-from database import init_redis_connection, redis_connection
+from database import init_redis_connection
 from models import init_models
 from routes import register_blueprints
 from routes.websocket import register_socket_events
+from routes.metrics import register_metric_collectors
 from services.scheduler import register_scheduled_tasks
+from services.socket_codec import CodecManager
+from services.redis_stats import register_redis_stats
+from services.profiler import register_profiler
+from utils.serialization import FastJSONProvider, SocketJSON
+from utils.compression import compress_response
 
 # Initialize Flask app
 app = Flask(__name__,
@@ -23,11 +29,25 @@ app.config.from_object(Config)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev_secret_key')
 app.permanent_session_lifetime = timedelta(days=7)
 
+# Encode JSON with the fastest available backend and compress large responses
+app.json = FastJSONProvider(app)
+app.after_request(compress_response)
+
+# Count the Redis commands of each request and socket event
+register_redis_stats(app)
+
+# Sample requests with the profiler when profiling is switched on
+register_profiler(app)
+
 # Initialize CORS
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
 # Initialize Socket.IO with CORS support
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet',
+                    json=SocketJSON,
+                    client_manager=CodecManager(),
+                    http_compression=Config.COMPRESSION_ENABLED,
+                    compression_threshold=Config.COMPRESSION_MIN_SIZE)
 
 # Initialize APScheduler
 scheduler = BackgroundScheduler()
@@ -45,8 +65,11 @@ register_blueprints(app)
 # Register WebSocket events
 register_socket_events(socketio)
 
+# Report socket, Redis and cache metrics on /metrics
+register_metric_collectors(socketio)
+
 # Register scheduled tasks
-register_scheduled_tasks(scheduler)
+register_scheduled_tasks(scheduler, socketio)
 
 
 # Default route to serve Vue.js SPA
@@ -69,4 +92,4 @@ if __name__ == '__main__':
     initialize_game_world()
 
     # Run the app with Socket.IO
-    socketio.run(app, host='0.0.0.0', port=5000, debug=debug)
\ No newline at end of file
+    socketio.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=debug)
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""Character hash size and decode time per encoding.
+
+Sizes count the bytes of field names and values, which is what a small
+hash stores. With --redis the hashes are also written to the configured
+Redis server under a scratch key and MEMORY USAGE is reported. Run from the
+backend directory:
+
+    python -m benchmarks.character_encoding [--redis]
+"""
+import random
+import sys
+
+import database
+from config import Config
+from models.character import Character, encode_character, unpack_character_fields, make_effect
+from benchmarks.serialization import time_per_round
+
+ENCODINGS = ('hash', 'packed')
+SCRATCH_KEY = 'benchmark:character'
+
+
+def build_character(rng):
+    """A character partway through the game"""
+    return Character(
+        id=rng.randrange(1, 100000), user_id=rng.randrange(1, 100000), name='Runner',
+        money=rng.randrange(100000), experience=rng.randrange(5000), level=rng.randrange(1, 20),
+        x=rng.randrange(12), y=rng.randrange(12),
+        stats={'strength': 7, 'agility': 6, 'intelligence': 5, 'charisma': 5, 'perception': 8, 'tech': 9},
+        skills={'combat': 2, 'stealth': 4, 'hacking': 3, 'engineering': 0, 'persuasion': 1, 'medicine': 0},
+        effects=[make_effect('stat_boost', 300, {'strength': 2})],
+        equipment={'weapon': '3'}
+    )
+
+
+def hash_size(mapping):
+    """Bytes of field names and values, as stored by Redis"""
+    errors = database.REDIS_ENCODING_ERRORS
+    return sum(len(field.encode()) + len(value.encode('utf-8', errors)) for field, value in mapping.items())
+
+
+def decode(mapping):
+    """Decode a stored hash into a character, as get_character_by_id does"""
+    data = database.redis_hash_to_dict(mapping)
+    unpack_character_fields(data)
+    return Character.from_hash(data)
+
+
+def redis_memory(mapping):
+    """MEMORY USAGE of the hash on the configured Redis server"""
+    database.redis_connection.delete(SCRATCH_KEY)
+    database.redis_connection.hset(SCRATCH_KEY, mapping=mapping)
+    try:
+        return database.redis_connection.memory_usage(SCRATCH_KEY, samples=0)
+    finally:
+        database.redis_connection.delete(SCRATCH_KEY)
+
+
+def main():
+    use_redis = '--redis' in sys.argv
+    if use_redis:
+        database.init_redis_connection()
+
+    character = build_character(random.Random(42))
+    default_encoding = Config.CHARACTER_ENCODING
+    decoded = []
+
+    print(f"{'encoding':>8} {'fields':>7} {'bytes':>7} {'decode us':>10}" + (f" {'memory':>7}" if use_redis else ''))
+    try:
+        for encoding in ENCODINGS:
+            Config.CHARACTER_ENCODING = encoding
+            mapping = encode_character(character.to_hash())
+            decoded.append(decode(mapping).to_hash())
+
+            elapsed = time_per_round(lambda: decode(mapping))
+            line = f"{encoding:>8} {len(mapping):>7} {hash_size(mapping):>7} {elapsed * 1000000:>10.1f}"
+            if use_redis:
+                line += f" {redis_memory(mapping):>7}"
+            print(line)
+    finally:
+        Config.CHARACTER_ENCODING = default_encoding
+
+    # Every encoding must decode to the same character
+    assert all(fields == decoded[0] for fields in decoded)
+
+
+if __name__ == '__main__':
+    main()
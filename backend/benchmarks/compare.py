@@ -0,0 +1,102 @@
+"""Compare two saved model-layer benchmark runs.
+
+A benchmark regressed when its median time grew by more than the
+threshold, or when it makes more Redis round-trips or commands than in the
+baseline, since those counts are exact. Timings are only compared between
+runs on the same backend. Exits with status 1 when anything regressed, so
+it can gate a CI job. Run from the backend directory:
+
+    python -m benchmarks.compare baseline.json results.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+
+def change(new, old):
+    """Relative change from old to new, or None without a baseline value"""
+    if new is None or not old:
+        return None
+    return (new - old) / old
+
+
+def compare(baseline, results, threshold):
+    """Rows comparing each benchmark with the baseline, flagging regressions"""
+    same_backend = baseline.get('backend') == results.get('backend')
+    rows = []
+    for name, result in results['benchmarks'].items():
+        old = baseline['benchmarks'].get(name)
+        if not old:
+            continue
+
+        time_change = change(result['median_us'], old['median_us']) if same_backend else None
+        reasons = []
+        if time_change is not None and time_change * 100 > threshold:
+            reasons.append('time')
+        if result['round_trips'] > old['round_trips']:
+            reasons.append('round-trips')
+        if result['commands'] > old['commands']:
+            reasons.append('commands')
+
+        rows.append({
+            'name': name,
+            'old_us': old['median_us'],
+            'new_us': result['median_us'],
+            'time_change': time_change,
+            'old_round_trips': old['round_trips'],
+            'new_round_trips': result['round_trips'],
+            'old_commands': old['commands'],
+            'new_commands': result['commands'],
+            'regression': bool(reasons),
+            'reasons': reasons
+        })
+    return rows
+
+
+def print_comparison(rows, baseline, results, threshold):
+    """Print the comparison table and a summary line"""
+    if baseline.get('backend') != results.get('backend'):
+        print(f"The baseline ran on {baseline.get('backend')} and these results on {results.get('backend')}, "
+              "only Redis usage is compared")
+
+    print(f"{'benchmark':>32} {'old us':>12} {'new us':>12} {'change':>8} {'rt/call':>12} {'cmd/call':>14}")
+    for row in rows:
+        time_change = '' if row['time_change'] is None else f"{row['time_change']:+.1%}"
+        round_trips = f"{row['old_round_trips']:g}->{row['new_round_trips']:g}"
+        commands = f"{row['old_commands']:g}->{row['new_commands']:g}"
+        line = (f"{row['name']:>32} {row['old_us']:>12.1f} {row['new_us']:>12.1f} {time_change:>8} "
+                f"{round_trips:>12} {commands:>14}")
+        if row['regression']:
+            line += f"  REGRESSION ({', '.join(row['reasons'])})"
+        print(line)
+
+    regressions = sum(1 for row in rows if row['regression'])
+    missing = sorted(set(baseline['benchmarks']) - set(results['benchmarks']))
+    print(f"\n{regressions} of {len(rows)} benchmarks regressed beyond {threshold:g}%")
+    if missing:
+        print(f"Not in these results: {', '.join(missing)}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('baseline', help='results saved earlier')
+    parser.add_argument('results', help='results to check against the baseline')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='slowdown in percent reported as a regression (default %(default)s)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.results) as f:
+        results = json.load(f)
+
+    rows = compare(baseline, results, args.threshold)
+    print_comparison(rows, baseline, results, args.threshold)
+    return 1 if any(row['regression'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
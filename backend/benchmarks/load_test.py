@@ -0,0 +1,506 @@
+"""End-to-end load test with simulated players.
+
+Starts the app on a scratch Redis database, or targets a running server
+with --url, and has simulated players sign up and play over the real REST
+and Socket.IO endpoints: moving, entering and leaving buildings, searching,
+chatting and polling the game state in a configurable mix. Reports the
+throughput and p50/p95/p99 latency of each operation, and the Redis
+round-trips and commands per operation from the server's Redis accounting,
+which it serves to admins. A started server gets a scratch admin account,
+a running one needs --admin-user and --admin-password.
+
+Results can be saved and later runs compared with them, to measure a change
+against a stable baseline. Run from the backend directory, with a Redis
+server running and the Socket.IO client extras installed
+(pip install requests websocket-client):
+
+    python -m benchmarks.load_test --players 20 --duration 30 --save baseline.json
+    python -m benchmarks.load_test --players 20 --duration 30 --baseline baseline.json
+
+The scratch database (--redis-db, 15 by default) is flushed when the test
+starts its own server.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import redis
+
+from config import Config
+
+try:
+    import requests
+    import socketio
+    import websocket
+except ImportError:
+    requests = None
+
+DEFAULT_MIX = 'move=40,enter=10,search=20,chat=10,state=20'
+DIRECTIONS = {
+    'north': (0, -1), 'east': (1, 0), 'south': (0, 1), 'west': (-1, 0),
+    'northeast': (1, -1), 'southeast': (1, 1), 'southwest': (-1, 1), 'northwest': (-1, -1)
+}
+PASSWORD = 'loadtest-password'
+
+# Account promoted to admin on a started server to read its Redis accounting
+ADMIN_USERNAME = 'loadtestadmin'
+
+# Enough AP for any run, within what the packed character encoding stores
+LOAD_TEST_MAX_AP = 60000
+
+
+def parse_mix(text):
+    """Parse 'move=40,chat=10' into operation weights"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in Player.OPERATIONS:
+            raise ValueError(f"Unknown operation {name}, use one of {', '.join(Player.OPERATIONS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of sorted values"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Player:
+    """A simulated player with its own HTTP session and socket"""
+
+    OPERATIONS = ('move', 'enter', 'search', 'chat', 'state')
+
+    def __init__(self, index, url, transport, seed):
+        self.index = index
+        self.url = url
+        self.transport = transport
+        self.rng = random.Random(seed)
+        self.http = requests.Session()
+        self.socket = None
+        self.character = {}
+        self.location = {}
+        self.errors = 0
+        self.exceptions = 0
+        self.stale_location = False
+
+        # Operation name to latencies in seconds, and to failed counts
+        self.latencies = {}
+        self.failures = {}
+
+    def record(self, name, started, ok):
+        self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+        if not ok:
+            self.failures[name] = self.failures.get(name, 0) + 1
+
+    def login(self):
+        """Sign up, or log in if the player exists from an earlier run"""
+        started = time.perf_counter()
+        username = f'loadtest{self.index}'
+        response = self.http.post(f'{self.url}/api/auth/signup', json={
+            'username': username, 'password': PASSWORD, 'character_name': f'Runner {self.index}'
+        })
+        if response.status_code != 200:
+            response = self.http.post(f'{self.url}/api/auth/login', json={
+                'username': username, 'password': PASSWORD
+            })
+        self.record('login', started, response.status_code == 200)
+        response.raise_for_status()
+
+        self.poll_state()
+
+        self.socket = socketio.Client(http_session=self.http, reconnection=False)
+        self.socket.on('error', self.on_error)
+        self.socket.on('character_update', self.on_character)
+        self.socket.on('location_update', self.on_location)
+        self.socket.connect(self.url, transports=['websocket'], wait_timeout=10)
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.disconnect()
+
+    def on_error(self, data):
+        self.errors += 1
+
+    def on_character(self, data):
+        self.character = data
+
+    def on_location(self, data):
+        self.location = data
+
+    def poll_state(self):
+        """Load the character and location over REST, as a polling client does"""
+        response = self.http.get(f'{self.url}/api/game/state', params={'fields': 'character,location'})
+        if response.status_code == 200:
+            state = response.json()
+            self.character = state.get('character') or self.character
+            self.location = state.get('location') or self.location
+        return response.status_code == 200
+
+    def act(self, action_type, action_data=None):
+        """Perform an action over the chosen transport, returning success"""
+        payload = {'action_type': action_type, 'action_data': action_data or {}}
+        if self.transport == 'rest':
+            response = self.http.post(f'{self.url}/api/game/action', json=payload)
+            result = response.json() if response.status_code == 200 else {}
+            character = result.get('character')
+            if character:
+                # REST results carry the character but not the new location
+                self.stale_location = any(
+                    character[field] != self.character.get(field) for field in ('x', 'y', 'inside_building')
+                )
+                self.character = character
+            return bool(result.get('success'))
+
+        # The acknowledgement arrives once the handler has sent its updates
+        errors = self.errors
+        self.socket.call('action', payload, timeout=10)
+        return self.errors == errors
+
+    def choose_move(self):
+        """A direction that stays inside the world"""
+        x, y = self.character.get('x', 0), self.character.get('y', 0)
+        directions = [
+            name for name, (dx, dy) in DIRECTIONS.items()
+            if 0 <= x + dx < Config.WORLD_SIZE_X and 0 <= y + dy < Config.WORLD_SIZE_Y
+        ]
+        return self.rng.choice(directions)
+
+    def step(self, operation):
+        """Run one operation and record it under what was actually done"""
+        try:
+            self.run_operation(operation, time.perf_counter())
+        except Exception:
+            # Timeouts and dropped connections, reported with the totals
+            self.exceptions += 1
+
+        if self.stale_location:
+            self.stale_location = False
+            self.poll_state()
+
+    def run_operation(self, operation, started):
+        """Perform an operation, choosing the action from where the player is"""
+        if operation == 'move':
+            if self.character.get('inside_building'):
+                self.record('EXIT_BUILDING', started, self.act('EXIT_BUILDING'))
+            else:
+                self.record('MOVE', started, self.act('MOVE', {'direction': self.choose_move()}))
+
+        elif operation == 'enter':
+            buildings = self.location.get('buildings') or []
+            if self.character.get('inside_building'):
+                self.record('EXIT_BUILDING', started, self.act('EXIT_BUILDING'))
+            elif buildings:
+                building = self.rng.choice(buildings)
+                self.record('ENTER_BUILDING', started, self.act('ENTER_BUILDING', {'building_id': building['id']}))
+            else:
+                self.record('MOVE', started, self.act('MOVE', {'direction': self.choose_move()}))
+
+        elif operation == 'search':
+            self.record('SEARCH', started, self.act('SEARCH'))
+
+        elif operation == 'chat':
+            errors = self.errors
+            self.socket.call('chat', {'message': f'hello from {self.index}', 'channel': 'location'}, timeout=10)
+            self.record('chat', started, self.errors == errors)
+
+        elif operation == 'state':
+            ok = self.http.get(f'{self.url}/api/game/state').status_code == 200
+            self.record('state', started, ok)
+
+
+def endpoint_for(operation, transport):
+    """Name of the server's Redis summary entry for an operation"""
+    if operation == 'login':
+        return None
+    if operation == 'chat':
+        return 'socket chat'
+    if operation == 'state':
+        return 'GET /api/game/state'
+    if transport == 'rest':
+        return f'POST /api/game/action {operation}'
+    return f'socket action {operation}'
+
+
+def admin_session(args, started):
+    """Log in an admin account to read the server's Redis accounting.
+
+    On a started server a scratch account is signed up and promoted in its
+    database, a running server needs --admin-user. Returns None without an
+    admin account.
+    """
+    if args.admin_user:
+        username, password = args.admin_user, args.admin_password
+    elif started:
+        username, password = ADMIN_USERNAME, PASSWORD
+        requests.post(f'{args.url}/api/auth/signup', json={'username': username, 'password': password})
+        database = redis.Redis(host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=args.redis_db,
+                               password=Config.REDIS_PASSWORD, decode_responses=True)
+        user_id = database.get(f'username:{username}')
+        if not user_id:
+            return None
+        database.hset(f'user:{user_id}', 'is_admin', 1)
+    else:
+        return None
+
+    session = requests.Session()
+    response = session.post(f'{args.url}/api/auth/login', json={'username': username, 'password': password})
+    return session if response.status_code == 200 else None
+
+
+def redis_usage(admin, url):
+    """The server's Redis summary per endpoint, or None without admin access"""
+    if admin is None:
+        return None
+    response = admin.get(f'{url}/api/game/debug/redis')
+    if response.status_code != 200:
+        return None
+    return response.json()['redis']['endpoints']
+
+
+def run_players(args, mix, admin):
+    """Run the players and collect their latencies and the Redis usage"""
+    players = [Player(index, args.url, args.transport, args.seed + index) for index in range(args.players)]
+    operations = list(mix)
+    weights = [mix[name] for name in operations]
+
+    # Once everyone is in, the Redis usage so far is noted and the clock starts
+    phase = {}
+    errors = []
+
+    def start_clock():
+        phase['before'] = redis_usage(admin, args.url)
+        phase['started'] = time.perf_counter()
+        phase['deadline'] = phase['started'] + args.duration
+
+    ready = threading.Barrier(args.players + 1, action=start_clock)
+
+    def play(player):
+        try:
+            player.login()
+        except Exception as e:
+            errors.append(f"Player {player.index} could not log in: {e}")
+            ready.abort()
+            return
+        ready.wait()
+        while time.perf_counter() < phase['deadline']:
+            player.step(player.rng.choices(operations, weights)[0])
+            if args.think:
+                time.sleep(player.rng.uniform(0, 2 * args.think))
+
+    threads = [threading.Thread(target=play, args=(player,), daemon=True) for player in players]
+    for thread in threads:
+        thread.start()
+
+    try:
+        ready.wait(timeout=120)
+    except threading.BrokenBarrierError:
+        raise RuntimeError('; '.join(errors) or 'Players did not log in in time')
+
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - phase['started']
+    after = redis_usage(admin, args.url)
+
+    for player in players:
+        player.close()
+
+    return players, elapsed, phase['before'], after
+
+
+def summarize(players, elapsed, before, after, transport):
+    """Throughput, latency percentiles and Redis usage per operation"""
+    latencies = {}
+    failures = {}
+    for player in players:
+        for name, values in player.latencies.items():
+            latencies.setdefault(name, []).extend(values)
+        for name, count in player.failures.items():
+            failures[name] = failures.get(name, 0) + count
+
+    operations = {}
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        # Logins happen before the timed phase
+        timed = name != 'login'
+        result = {
+            'count': len(values),
+            'errors': failures.get(name, 0),
+            'throughput': round(len(values) / elapsed, 2) if timed else None,
+            'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+            'redis_round_trips': None,
+            'redis_commands': None
+        }
+
+        endpoint = endpoint_for(name, transport)
+        if endpoint and before is not None and after is not None and endpoint in after:
+            end = after[endpoint]
+            start = before.get(endpoint, {'requests': 0, 'round_trips': 0, 'commands': 0})
+            requests_made = end['requests'] - start['requests']
+            if requests_made:
+                result['redis_round_trips'] = round((end['round_trips'] - start['round_trips']) / requests_made, 2)
+                result['redis_commands'] = round((end['commands'] - start['commands']) / requests_made, 2)
+
+        operations[name] = result
+
+    timed_count = sum(result['count'] for name, result in operations.items() if name != 'login')
+    total = {
+        'operations': timed_count,
+        'seconds': round(elapsed, 2),
+        'throughput': round(timed_count / elapsed, 2),
+        'exceptions': sum(player.exceptions for player in players)
+    }
+    return {'operations': operations, 'total': total}
+
+
+def print_results(results, baseline=None):
+    """Print the results, with the change from a baseline if given"""
+    header = (f"{'operation':>15} {'count':>7} {'errors':>7} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'rt/op':>6} {'cmd/op':>7}")
+    if baseline:
+        header += f" {'ops/s chg':>10} {'p95 chg':>8} {'cmd chg':>8}"
+    print(header)
+
+    def change(new, old):
+        if new is None or not old:
+            return ''
+        return f"{(new - old) / old:+.0%}"
+
+    def show(value):
+        return '' if value is None else value
+
+    for name, result in results['operations'].items():
+        line = (f"{name:>15} {result['count']:>7} {result['errors']:>7} {show(result['throughput']):>8} "
+                f"{result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8} "
+                f"{show(result['redis_round_trips']):>6} {show(result['redis_commands']):>7}")
+        old = (baseline or {}).get('operations', {}).get(name)
+        if old:
+            line += (f" {change(result['throughput'], old['throughput']):>10} "
+                     f"{change(result['p95_ms'], old['p95_ms']):>8} "
+                     f"{change(result['redis_commands'], old['redis_commands']):>8}")
+        print(line)
+
+    total = results['total']
+    line = f"\n{total['operations']} operations in {total['seconds']}s, {total['throughput']} ops/s"
+    if total['exceptions']:
+        line += f", {total['exceptions']} timed out or failed"
+    if baseline:
+        line += f" ({change(total['throughput'], baseline['total']['throughput'])} from the baseline)"
+    print(line)
+
+
+def wait_for_server(url, process, timeout=60):
+    """Wait until the server answers, failing if it exits first"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The server exited with status {process.returncode}")
+        try:
+            requests.get(f'{url}/api/auth/status', timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.25)
+    raise RuntimeError(f"The server did not start within {timeout}s")
+
+
+def start_server(args):
+    """Start the app on a flushed scratch database"""
+    redis.Redis(host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=args.redis_db,
+                password=Config.REDIS_PASSWORD).flushdb()
+
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(args.port),
+        'REDIS_DB': str(args.redis_db),
+        'FLASK_DEBUG': 'True',
+        'MAX_AP': str(LOAD_TEST_MAX_AP),
+        'RATE_LIMIT_ENABLED': 'False',
+        'REDIS_STATS_ENABLED': 'True',
+        'REDIS_STATS_HEADER': 'False',
+        'PROFILING_ENABLED': 'False'
+    })
+    process = subprocess.Popen(
+        [sys.executable, 'app.py'], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env, stdout=subprocess.DEVNULL if not args.server_output else None, stderr=subprocess.STDOUT
+    )
+    try:
+        wait_for_server(args.url, process, args.startup_timeout)
+    except Exception:
+        process.terminate()
+        raise
+    return process
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--players', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30, help='seconds of play after everyone logged in')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'operation weights (default {DEFAULT_MIX})')
+    parser.add_argument('--transport', choices=('socket', 'rest'), default='socket', help='how actions are sent')
+    parser.add_argument('--think', type=float, default=0, help='average pause between operations in seconds')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--url', help='target a running server instead of starting one')
+    parser.add_argument('--port', type=int, default=5055, help='port of the started server')
+    parser.add_argument('--redis-db', type=int, default=15, help='scratch database of the started server')
+    parser.add_argument('--server-output', action='store_true', help="show the started server's output")
+    parser.add_argument('--startup-timeout', type=float, default=60, help='seconds to wait for the started server')
+    parser.add_argument('--admin-user', help="admin account of a running server, to read its Redis usage")
+    parser.add_argument('--admin-password', help='password of --admin-user')
+    parser.add_argument('--save', help='write the results to a JSON file')
+    parser.add_argument('--baseline', help='compare with results saved earlier')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if requests is None:
+        print("The load test needs the Socket.IO client extras: pip install requests websocket-client")
+        return 1
+
+    mix = parse_mix(args.mix)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    process = None
+    if not args.url:
+        args.url = f'http://127.0.0.1:{args.port}'
+        process = start_server(args)
+
+    try:
+        admin = admin_session(args, process is not None)
+        players, elapsed, before, after = run_players(args, mix, admin)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    if before is None:
+        print("Redis usage is only reported with an admin account, "
+              "pass --admin-user and --admin-password for a running server\n")
+
+    results = summarize(players, elapsed, before, after, args.transport)
+    results['config'] = {
+        'players': args.players, 'duration': args.duration, 'mix': mix,
+        'transport': args.transport, 'think': args.think, 'seed': args.seed
+    }
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
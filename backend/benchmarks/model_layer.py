@@ -0,0 +1,382 @@
+"""Model-layer microbenchmarks on a seeded world.
+
+Times the Redis hash codec, character and location reads, map slices at
+each radius, the available actions, every implemented action, world
+initialization at several sizes and the AP regeneration sweep. Each
+benchmark reports the median, mean and p95 time per call along with the
+Redis round-trips and commands it makes, counted by the Redis
+instrumentation.
+
+By default the benchmarks run against fakeredis in the same process
+(pip install "fakeredis[lua]"), which needs no server but is slower than
+Redis, so its timings are only comparable with other fakeredis runs. The
+round-trip and command counts do not depend on the backend. With --redis
+they run against the configured Redis server instead, on a scratch
+database (--redis-db, 15 by default) that is flushed first. Run from the
+backend directory:
+
+    python -m benchmarks.model_layer --save baseline.json
+    python -m benchmarks.model_layer --baseline baseline.json
+
+Results saved with --save can also be compared later with
+benchmarks.compare.
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import statistics
+import sys
+import time
+
+import database
+from config import Config
+from models.actions import ACTION_TYPES, get_available_actions, process_action
+from models.action_engine import get_action_handler
+from models.character import Character, create_character, get_character_by_id, save_character, encode_character
+from models.loot import loot_rng
+from models.world import get_tile, get_building, get_tile_with_contents, get_map_slice
+from services import redis_stats
+from services.game_service import initialize_game_world
+from services.redis_stats import InstrumentedRedis
+from services.scheduler import regenerate_ap_for_all_characters
+from benchmarks.compare import compare, print_comparison
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+# World the read and action benchmarks run on
+WORLD_SIZE = 12
+MAP_RADII = (1, 2, 3, 4, 5)
+WORLD_SIZES = (5, 10, 20)
+AP_REGEN_SIZES = (10000, 100000)
+
+# Enough AP for every round, within what the packed character encoding stores
+BENCHMARK_MAX_AP = 60000
+
+# Characters are written this many at a time when seeding the AP sweep
+SEED_BATCH_SIZE = 1000
+
+
+class Benchmark:
+    """A named call to time, with an untimed step run before each call"""
+
+    __slots__ = ('name', 'func', 'prepare')
+
+    def __init__(self, name, func, prepare=None):
+        self.name = name
+        self.func = func
+        self.prepare = prepare
+
+
+def connect(args):
+    """Point the models at a flushed benchmark database"""
+    if args.redis:
+        connection = InstrumentedRedis(
+            host=Config.REDIS_HOST,
+            port=Config.REDIS_PORT,
+            db=args.redis_db,
+            password=Config.REDIS_PASSWORD,
+            decode_responses=True,
+            encoding_errors=database.REDIS_ENCODING_ERRORS
+        )
+    else:
+        # Reuse the fakeredis connection pool, so its commands are counted
+        fake = fakeredis.FakeRedis(decode_responses=True, encoding_errors=database.REDIS_ENCODING_ERRORS)
+        connection = InstrumentedRedis(connection_pool=fake.connection_pool)
+
+    connection.flushdb()
+    database.redis_connection = connection
+
+
+@contextlib.contextmanager
+def quiet():
+    """Hide the progress the seeding functions print"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def redis_counts():
+    """Round-trips and commands made by this process so far"""
+    return redis_stats.process_stats.round_trips, redis_stats.process_stats.totals()[0]
+
+
+def measure(benchmark, rounds):
+    """Time a benchmark over some rounds, counting its Redis usage"""
+    times = []
+    round_trips = commands = 0
+    for _ in range(rounds):
+        if benchmark.prepare:
+            benchmark.prepare()
+
+        before = redis_counts()
+        started = time.perf_counter()
+        benchmark.func()
+        times.append(time.perf_counter() - started)
+        after = redis_counts()
+
+        round_trips += after[0] - before[0]
+        commands += after[1] - before[1]
+
+    times.sort()
+    return {
+        'calls': rounds,
+        'median_us': round(statistics.median(times) * 1000000, 2),
+        'mean_us': round(statistics.mean(times) * 1000000, 2),
+        'p95_us': round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000000, 2),
+        'round_trips': round(round_trips / rounds, 2),
+        'commands': round(commands / rounds, 2)
+    }
+
+
+def seed_world(size, seed):
+    """Initialize a world of size x size tiles with a fixed seed"""
+    Config.WORLD_SIZE_X = Config.WORLD_SIZE_Y = size
+    random.seed(seed)
+    with quiet():
+        initialize_game_world()
+
+
+def pick_location(size):
+    """A tile and one of its buildings with objects, as close to the centre as possible"""
+    centre = size // 2
+    tiles = sorted(
+        ((x, y) for y in range(size) for x in range(size)),
+        key=lambda tile: abs(tile[0] - centre) + abs(tile[1] - centre)
+    )
+    for x, y in tiles:
+        tile = get_tile(x, y)
+        for building_id in tile.buildings:
+            building = get_building(building_id)
+            if building and building.objects:
+                return tile, building
+    raise RuntimeError("No building with objects, try another --seed")
+
+
+def reset_character(character_id, **fields):
+    """Restore a character's AP and set the fields an action depends on"""
+    character = get_character_by_id(character_id)
+    character.ap = character.max_ap
+    for name, value in fields.items():
+        setattr(character, name, value)
+    save_character(character)
+
+
+def codec_benchmarks(rng):
+    """The Redis hash codec on a character"""
+    character = Character(
+        id=rng.randrange(1, 100000), user_id=1, name='Runner',
+        stats={'strength': 7, 'agility': 6, 'intelligence': 5, 'charisma': 5, 'perception': 8, 'tech': 9},
+        skills={'hacking': 3, 'stealth': 2, 'combat': 4},
+        equipment={'weapon': '3', 'armor': '7'}
+    ).to_hash()
+    mapping = database.dict_to_redis_hash(character)
+
+    return [
+        Benchmark('dict_to_redis_hash', lambda: database.dict_to_redis_hash(character)),
+        Benchmark('redis_hash_to_dict', lambda: database.redis_hash_to_dict(mapping))
+    ]
+
+
+def read_benchmarks(character_id, tile):
+    """Character, location, map and available action reads"""
+    benchmarks = [
+        Benchmark('get_character_by_id', lambda: get_character_by_id(character_id)),
+        Benchmark('get_tile_with_contents', lambda: get_tile_with_contents(tile.x, tile.y))
+    ]
+    for radius in MAP_RADII:
+        benchmarks.append(Benchmark(
+            f'get_map_slice[r={radius}]', lambda radius=radius: get_map_slice(tile.x, tile.y, radius)
+        ))
+    benchmarks.append(Benchmark('get_available_actions', lambda: get_available_actions(character_id)))
+    return benchmarks
+
+
+def action_benchmarks(character_id, tile, building):
+    """Every implemented action, from the state it needs"""
+    outside = {'x': tile.x, 'y': tile.y, 'inside_building': False, 'building_id': None}
+    inside = {'x': tile.x, 'y': tile.y, 'inside_building': True, 'building_id': building.id}
+    setups = {
+        'MOVE': (outside, {'direction': 'east'}),
+        'ENTER_BUILDING': (outside, {'building_id': building.id}),
+        'EXIT_BUILDING': (inside, {}),
+        'REST': (dict(outside, health=1, stamina=1), {}),
+        'SEARCH': (outside, {}),
+        'INTERACT': (inside, {'object_id': building.objects[0]})
+    }
+
+    benchmarks = []
+    for action_type in ACTION_TYPES:
+        if not get_action_handler(action_type):
+            continue
+        if action_type not in setups:
+            print(f"No setup for {action_type}, skipping it")
+            continue
+
+        fields, action_data = setups[action_type]
+
+        def run(action_type=action_type, action_data=action_data):
+            result = process_action(character_id, action_type, dict(action_data))
+            if not result['success']:
+                raise RuntimeError(f"{action_type} failed: {result['message']}")
+
+        benchmarks.append(Benchmark(
+            f'process_action[{action_type}]', run, lambda fields=fields: reset_character(character_id, **fields)
+        ))
+    return benchmarks
+
+
+def world_benchmarks(sizes, seed):
+    """World initialization at each size, on an empty database"""
+    def fresh():
+        database.redis_connection.flushdb()
+        random.seed(seed)
+
+    benchmarks = []
+    for size in sizes:
+        def run(size=size):
+            Config.WORLD_SIZE_X = Config.WORLD_SIZE_Y = size
+            with quiet():
+                initialize_game_world()
+
+        benchmarks.append(Benchmark(f'initialize_game_world[{size}x{size}]', run, fresh))
+    return benchmarks
+
+
+def seed_characters(count):
+    """Write characters with spent AP directly, in batches"""
+    database.redis_connection.flushdb()
+    for start in range(1, count + 1, SEED_BATCH_SIZE):
+        pipe = database.redis_connection.pipeline(transaction=False)
+        for character_id in range(start, min(start + SEED_BATCH_SIZE, count + 1)):
+            character = Character(id=character_id, user_id=character_id, name=f'Runner {character_id}', ap=0)
+            pipe.hset(f'character:{character_id}', mapping=encode_character(character.to_hash()))
+        pipe.execute()
+
+
+def ap_regen_benchmarks(sizes):
+    """The AP regeneration sweep over every character"""
+    benchmarks = []
+    for size in sizes:
+        def run():
+            with quiet():
+                regenerate_ap_for_all_characters()
+
+        benchmarks.append(Benchmark(f'ap_regen[{size}]', run, lambda size=size: seed_characters(size)))
+    return benchmarks
+
+
+def selected(benchmarks, patterns):
+    """Benchmarks whose name contains one of the patterns"""
+    if not patterns:
+        return benchmarks
+    return [benchmark for benchmark in benchmarks if any(pattern in benchmark.name for pattern in patterns)]
+
+
+def run_benchmarks(args):
+    """Run the benchmarks group by group, each on the data it needs"""
+    results = {}
+
+    def run_group(benchmarks, rounds):
+        for benchmark in selected(benchmarks, args.only):
+            # Searches roll loot, reseed so every run makes the same calls
+            random.seed(args.seed)
+            loot_rng.seed(args.seed)
+            results[benchmark.name] = measure(benchmark, rounds)
+            print_result(benchmark.name, results[benchmark.name])
+
+    rng = random.Random(args.seed)
+    run_group(codec_benchmarks(rng), args.rounds)
+
+    # Reads and actions share one world and character
+    seed_world(WORLD_SIZE, args.seed)
+    tile, building = pick_location(WORLD_SIZE)
+    character_id = create_character(1, 'Runner')
+    reset_character(character_id, max_ap=BENCHMARK_MAX_AP, x=tile.x, y=tile.y)
+    run_group(read_benchmarks(character_id, tile), args.rounds)
+    run_group(action_benchmarks(character_id, tile, building), args.rounds)
+
+    # The rest start from an empty database every round
+    run_group(world_benchmarks(args.world_sizes, args.seed), args.slow_rounds)
+    run_group(ap_regen_benchmarks(args.ap_regen_sizes), args.slow_rounds)
+
+    return results
+
+
+def print_result(name, result):
+    """Print one benchmark's line of the results table"""
+    print(f"{name:>32} {result['median_us']:>12.1f} {result['mean_us']:>12.1f} {result['p95_us']:>12.1f} "
+          f"{result['round_trips']:>8} {result['commands']:>8}")
+
+
+def parse_sizes(text):
+    """Parse comma-separated sizes"""
+    return tuple(int(size) for size in text.split(',') if size.strip())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rounds', type=int, default=200, help='calls per benchmark')
+    parser.add_argument('--slow-rounds', type=int, default=1,
+                        help='calls per world initialization and AP sweep benchmark')
+    parser.add_argument('--world-sizes', type=parse_sizes, default=WORLD_SIZES,
+                        help='comma-separated world widths (default %(default)s)')
+    parser.add_argument('--ap-regen-sizes', type=parse_sizes, default=AP_REGEN_SIZES,
+                        help='comma-separated character counts (default %(default)s)')
+    parser.add_argument('--only', action='append', help='only run benchmarks whose name contains this')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--redis', action='store_true', help='use the configured Redis server')
+    parser.add_argument('--redis-db', type=int, default=15, help='scratch database used with --redis')
+    parser.add_argument('--save', help='write the results to a JSON file')
+    parser.add_argument('--baseline', help='compare with results saved earlier')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='slowdown in percent reported as a regression (default %(default)s)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.redis and fakeredis is None:
+        print('The benchmarks need fakeredis without --redis: pip install "fakeredis[lua]"')
+        return 1
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    connect(args)
+    world_size = (Config.WORLD_SIZE_X, Config.WORLD_SIZE_Y)
+    print(f"{'benchmark':>32} {'median us':>12} {'mean us':>12} {'p95 us':>12} {'rt/call':>8} {'cmd/call':>8}")
+    try:
+        benchmarks = run_benchmarks(args)
+    finally:
+        Config.WORLD_SIZE_X, Config.WORLD_SIZE_Y = world_size
+        database.redis_connection.flushdb()
+
+    results = {
+        'backend': 'redis' if args.redis else 'fakeredis',
+        'config': {
+            'rounds': args.rounds, 'slow_rounds': args.slow_rounds, 'seed': args.seed,
+            'world_sizes': list(args.world_sizes), 'ap_regen_sizes': list(args.ap_regen_sizes)
+        },
+        'benchmarks': benchmarks
+    }
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if baseline:
+        print()
+        rows = compare(baseline, results, args.threshold)
+        print_comparison(rows, baseline, results, args.threshold)
+        return 1 if any(row['regression'] for row in rows) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
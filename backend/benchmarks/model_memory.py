@@ -0,0 +1,67 @@
+"""In-memory footprint of the model classes.
+
+Each model is compared with a plain class holding the same fields in an
+instance __dict__, which is how the models were stored before they were
+slotted. Sizes are per instance and leave out the field values, which are
+shared by both. Run from the backend directory:
+
+    python -m benchmarks.model_memory
+"""
+import random
+import sys
+
+from models.character import Character
+from models.user import User
+from models.world import WorldTile, Building, WorldObject
+from benchmarks.character_encoding import build_character
+
+INSTANCES = 100000
+
+
+class Unslotted:
+    """The same fields kept in an instance __dict__"""
+
+    def __init__(self, fields):
+        for field, value in fields.items():
+            setattr(self, field, value)
+
+
+def build_models(rng):
+    """Builders returning a fresh instance of each model, by name"""
+    return {
+        'Character': lambda: build_character(rng),
+        'User': lambda: User(id=rng.randrange(100000), username='runner', email='runner@example.com',
+                             password_hash='pbkdf2:sha256:600000$salt$hash'),
+        'WorldTile': lambda: WorldTile(rng.randrange(100), rng.randrange(100), tile_type='street',
+                                       description='A rain-slicked street under neon signs.'),
+        'Building': lambda: Building(x=rng.randrange(100), y=rng.randrange(100),
+                                     name='Noodle Bar', building_type='shop'),
+        'WorldObject': lambda: WorldObject(name='Terminal', object_type='terminal',
+                                           interaction_data={'hack_difficulty': 3})
+    }
+
+
+def instance_size(instance):
+    """Bytes of an instance and its __dict__, if it has one"""
+    size = sys.getsizeof(instance)
+    if hasattr(instance, '__dict__'):
+        size += sys.getsizeof(instance.__dict__)
+    return size
+
+
+def main():
+    models = build_models(random.Random(42))
+
+    print(f"{'model':>12} {'fields':>7} {'dict bytes':>11} {'slots bytes':>12} {'saved':>7} "
+          f"{f'{INSTANCES} saved KiB':>18}")
+    for name, build in models.items():
+        instances = [build() for _ in range(INSTANCES)]
+        slotted = sum(map(instance_size, instances)) / INSTANCES
+        unslotted = sum(instance_size(Unslotted(instance.to_hash())) for instance in instances) / INSTANCES
+        saved = (unslotted - slotted) * INSTANCES / 1024
+        print(f"{name:>12} {len(instances[0].__slots__):>7} {unslotted:>11.0f} {slotted:>12.0f} "
+              f"{1 - slotted / unslotted:>7.0%} {saved:>18.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Pathfinding benchmarks on open and obstructed grids.
+
+Run from the backend directory:
+
+    python -m benchmarks.pathfinding
+"""
+import random
+import time
+
+from services.pathfinding import Grid, RouteCache, find_path
+
+GRID_SIZES = [100, 500]
+ROUTES_PER_SIZE = 20
+OBSTACLE_DENSITY = 0.2
+
+
+def random_tiles(grid, count, rng):
+    """Pick random passable tiles"""
+    tiles = []
+    while len(tiles) < count:
+        tile = (rng.randrange(grid.width), rng.randrange(grid.height))
+        if grid.passable(*tile):
+            tiles.append(tile)
+    return tiles
+
+
+def bench_grid(grid, rng):
+    """Time uncached and cached lookups of random routes on a grid"""
+    starts = random_tiles(grid, ROUTES_PER_SIZE, rng)
+    goals = random_tiles(grid, ROUTES_PER_SIZE, rng)
+    cache = RouteCache(ROUTES_PER_SIZE)
+
+    found = 0
+    started = time.perf_counter()
+    for start, goal in zip(starts, goals):
+        path = find_path(grid, start, goal)
+        if path:
+            found += 1
+        cache.put((start, goal), path)
+    uncached = (time.perf_counter() - started) / ROUTES_PER_SIZE
+
+    started = time.perf_counter()
+    for start, goal in zip(starts, goals):
+        cache.get((start, goal))
+    cached = (time.perf_counter() - started) / ROUTES_PER_SIZE
+
+    return found, uncached, cached
+
+
+def main():
+    rng = random.Random(42)
+
+    print(f"{'grid':>10} {'obstacles':>10} {'found':>6} {'A* ms':>10} {'cached us':>10}")
+    for size in GRID_SIZES:
+        open_grid = Grid(size, size)
+        blocked = {
+            (x, y) for x in range(size) for y in range(size)
+            if rng.random() < OBSTACLE_DENSITY
+        }
+        obstructed_grid = Grid(size, size, blocked)
+
+        for grid, density in ((open_grid, 0.0), (obstructed_grid, OBSTACLE_DENSITY)):
+            found, uncached, cached = bench_grid(grid, rng)
+            print(f"{size}x{size:<6} {density:>10.0%} {found:>3}/{ROUTES_PER_SIZE:<2} "
+                  f"{uncached * 1000:>10.2f} {cached * 1000000:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
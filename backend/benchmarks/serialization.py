@@ -0,0 +1,151 @@
+"""JSON backend and compression benchmarks on game-shaped payloads.
+
+The standard library row is the baseline the other backends are compared
+against. Run from the backend directory:
+
+    python -m benchmarks.serialization
+"""
+import random
+import time
+from datetime import datetime
+
+import database
+from models.character import Character, make_effect
+from models.inventory import with_definition
+from models.items import ITEM_DEFINITIONS
+from models.world import WorldTile, Building
+from utils import serialization
+from utils.compression import supported_encodings, compress
+
+ROUNDS = 200
+MAP_RADIUS = 5
+INVENTORY_SIZE = 40
+LOG_COUNT = 100
+
+
+def build_character(rng):
+    """A character with effects and equipment"""
+    character = Character(
+        id=rng.randrange(1, 100000), user_id=1, name='Runner',
+        stats={'strength': 7, 'agility': 6, 'intelligence': 5, 'charisma': 5, 'perception': 8, 'tech': 9},
+        skills={'hacking': 3, 'stealth': 2, 'firearms': 4},
+        attributes={'faction': 'none', 'reputation': 12},
+        effects=[make_effect('stat_boost', 30, {'strength': 2}) for _ in range(3)],
+        equipment={'weapon': '3', 'armor': '7'},
+        created_at=datetime.now().isoformat()
+    )
+    return character.to_dict()
+
+
+def build_inventory(rng):
+    """Inventory items with their definitions embedded"""
+    codes = list(ITEM_DEFINITIONS)
+    return [
+        with_definition({
+            'id': str(item_id),
+            'item_code': rng.choice(codes),
+            'quantity': rng.randrange(1, 5),
+            'acquired_at': datetime.now().isoformat()
+        })
+        for item_id in range(INVENTORY_SIZE)
+    ]
+
+
+def build_map(rng):
+    """Map slice tiles, some with buildings"""
+    tiles = []
+    for y in range(-MAP_RADIUS, MAP_RADIUS + 1):
+        for x in range(-MAP_RADIUS, MAP_RADIUS + 1):
+            tile = WorldTile(x, y, tile_type=rng.choice(['street', 'plaza', 'alley'])).to_dict()
+            if rng.random() < 0.3:
+                building = Building(x=x, y=y, name='Noodle Bar', building_type='shop').to_dict()
+                tile['buildings'] = [{'id': building['id'], 'name': building['name'],
+                                      'building_type': building['building_type']}]
+            tiles.append(tile)
+    return tiles
+
+
+def build_logs(rng):
+    """Recent action logs"""
+    return [
+        {
+            'id': log_id,
+            'character_id': 1,
+            'action_type': rng.choice(['MOVE', 'SEARCH', 'REST']),
+            'message': 'Moved north to Tile (4, 5)',
+            'data': {'x': rng.randrange(12), 'y': rng.randrange(12), 'ap_cost': 1},
+            'timestamp': datetime.now().isoformat()
+        }
+        for log_id in range(LOG_COUNT)
+    ]
+
+
+def build_payloads(rng):
+    """Payloads by name, the state payload combines the others"""
+    payloads = {
+        'character': build_character(rng),
+        'inventory': build_inventory(rng),
+        'map': build_map(rng),
+        'logs': build_logs(rng)
+    }
+    payloads['state'] = dict(payloads)
+    return payloads
+
+
+def time_per_round(func):
+    """Average seconds per call over ROUNDS calls"""
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        func()
+    return (time.perf_counter() - started) / ROUNDS
+
+
+def bench_backends(payloads):
+    """Encode and decode times per backend and payload"""
+    print(f"{'backend':>8} {'payload':>10} {'bytes':>8} {'dumps us':>10} {'loads us':>10} {'hash us':>10}")
+    for backend in serialization.available_backends():
+        serialization.set_json_backend(backend)
+        for name, payload in payloads.items():
+            encoded = serialization.dumps_bytes(payload)
+            dumps_time = time_per_round(lambda: serialization.dumps_bytes(payload))
+            loads_time = time_per_round(lambda: serialization.loads(encoded))
+            print(f"{backend:>8} {name:>10} {len(encoded):>8} {dumps_time * 1000000:>10.1f} "
+                  f"{loads_time * 1000000:>10.1f}", end='')
+
+            # The Redis codec only applies to flat entity hashes
+            if name == 'character':
+                packed = database.dict_to_redis_hash(payload)
+                hash_time = time_per_round(lambda: database.redis_hash_to_dict(database.dict_to_redis_hash(payload)))
+                assert database.redis_hash_to_dict(packed)['stats'] == payload['stats']
+                print(f" {hash_time * 1000000:>10.1f}")
+            else:
+                print(f" {'':>10}")
+
+
+def bench_compression(payloads):
+    """Compressed size and time of each payload per encoding"""
+    print(f"\n{'encoding':>8} {'payload':>10} {'bytes':>8} {'ratio':>8} {'us':>10}")
+    for name, payload in payloads.items():
+        encoded = serialization.dumps_bytes(payload)
+        for encoding in supported_encodings():
+            compressed = compress(encoded, encoding)
+            elapsed = time_per_round(lambda: compress(encoded, encoding))
+            print(f"{encoding:>8} {name:>10} {len(compressed):>8} {len(compressed) / len(encoded):>8.2f} "
+                  f"{elapsed * 1000000:>10.1f}")
+
+
+def main():
+    rng = random.Random(42)
+    payloads = build_payloads(rng)
+    default_backend = serialization.json_backend
+
+    try:
+        bench_backends(payloads)
+    finally:
+        serialization.set_json_backend(default_backend)
+
+    bench_compression(payloads)
+
+
+if __name__ == '__main__':
+    main()
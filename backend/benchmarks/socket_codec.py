@@ -0,0 +1,87 @@
+"""Socket.IO event encoding with JSON and MessagePack.
+
+Times the full packet encode of common events, to one client and to a room,
+where JSON is encoded once per client and MessagePack once per event. Run
+from the backend directory:
+
+    python -m benchmarks.socket_codec
+"""
+import json
+import random
+import time
+
+from socketio import packet
+
+from benchmarks.serialization import build_character, build_map, build_logs, time_per_round
+from services.socket_codec import msgpack, pack_payload
+from utils.serialization import SocketJSON
+
+ROOM_SIZE = 20
+
+
+class StdlibJSON:
+    """python-socketio's default JSON encoding"""
+
+    dumps = staticmethod(json.dumps)
+    loads = staticmethod(json.loads)
+
+
+def build_events(rng):
+    """Event payloads by name"""
+    return {
+        'character_update': build_character(rng),
+        'map_update': {'map': build_map(rng), 'character_position': {'x': 0, 'y': 0, 'inside_building': False}},
+        'logs_update': build_logs(rng),
+        'chat_message': {'character_id': 1, 'character_name': 'Runner', 'message': 'anyone at the bar?',
+                         'timestamp': None, 'channel': 'location'}
+    }
+
+
+def encoded_size(encoded):
+    """Bytes on the wire for an encoded packet and its attachments"""
+    if isinstance(encoded, list):
+        return sum(len(part) if isinstance(part, bytes) else len(part.encode()) for part in encoded)
+    return len(encoded.encode())
+
+
+def json_event(event, data, json_module):
+    """Encode an event the way the server does for a JSON client"""
+    pkt = packet.Packet(packet.EVENT, data=[event, data])
+    pkt.json = json_module
+    return pkt.encode()
+
+
+def msgpack_event(event, packed):
+    """Encode an event carrying a packed payload"""
+    return packet.Packet(packet.EVENT, data=[event, packed]).encode()
+
+
+def main():
+    if msgpack is None:
+        print("msgpack is not installed")
+        return
+
+    events = build_events(random.Random(42))
+    codecs = (('stdlib', StdlibJSON), ('json', SocketJSON))
+
+    print(f"{'event':>18} {'codec':>8} {'bytes':>8} {'1 client us':>12} {f'{ROOM_SIZE} clients us':>14}")
+    for event, data in events.items():
+        for name, json_module in codecs:
+            size = encoded_size(json_event(event, data, json_module))
+            single = time_per_round(lambda: json_event(event, data, json_module))
+            print(f"{event:>18} {name:>8} {size:>8} {single * 1000000:>12.1f} {single * ROOM_SIZE * 1000000:>14.1f}")
+
+        size = encoded_size(msgpack_event(event, pack_payload(data)))
+        single = time_per_round(lambda: msgpack_event(event, pack_payload(data)))
+
+        # A room packs once and only wraps the packed bytes per client
+        packed = pack_payload(data)
+        started = time.perf_counter()
+        for _ in range(ROOM_SIZE):
+            msgpack_event(event, packed)
+        room = single + time.perf_counter() - started
+        print(f"{event:>18} {'msgpack':>8} {size:>8} {single * 1000000:>12.1f} {room * 1000000:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,40 @@ class Config:
     REDIS_DB = int(os.environ.get('REDIS_DB', 0))
     REDIS_PASSWORD = os.environ.get('REDIS_PASSWORD', None)
 
+    # Redis instrumentation settings. Commands are counted per request and
+    # socket event; REDIS_STATS_HEADER adds an X-Redis-Stats header to every
+    # response (off by default, every client can read it), and requests
+    # making more round-trips than their budget (0 for none) are logged, or
+    # fail in REDIS_STATS_STRICT mode
+    REDIS_STATS_ENABLED = os.environ.get('REDIS_STATS_ENABLED', 'True') == 'True'
+    REDIS_STATS_HEADER = os.environ.get('REDIS_STATS_HEADER', 'False') == 'True'
+    REDIS_STATS_STRICT = os.environ.get('REDIS_STATS_STRICT', str(TESTING)) == 'True'
+    REDIS_ROUND_TRIP_BUDGET = int(os.environ.get('REDIS_ROUND_TRIP_BUDGET', 0))
+    REDIS_ROUND_TRIP_BUDGETS = {}  # per endpoint, e.g. 'GET /api/game/state' or 'socket action'
+
+    # Metrics settings, /metrics serves action, socket, Redis, scheduler and
+    # cache metrics in the Prometheus text format to clients in
+    # METRICS_ALLOWED_NETWORKS (comma separated, loopback only by default;
+    # behind a proxy this is the proxy's address)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+    METRICS_ALLOWED_NETWORKS = tuple(
+        network.strip()
+        for network in os.environ.get('METRICS_ALLOWED_NETWORKS', '127.0.0.0/8,::1/128').split(',')
+        if network.strip()
+    )
+
+    # Profiling settings, PROFILING_SAMPLE_RATE percent of requests and socket
+    # events are profiled while enabled. Requests over PROFILING_SLOW_MS are
+    # always listed, and with PROFILING_CAPTURE_SLOW every request is profiled
+    # so slow ones come with a profile. All but the directory can be changed
+    # at runtime through /api/game/debug/profiling
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False') == 'True'
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 1))
+    PROFILING_SLOW_MS = float(os.environ.get('PROFILING_SLOW_MS', 500))
+    PROFILING_CAPTURE_SLOW = os.environ.get('PROFILING_CAPTURE_SLOW', 'False') == 'True'
+    PROFILING_DIR = os.environ.get('PROFILING_DIR', os.path.join(os.path.dirname(__file__), 'profiles'))
+    PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', 200))  # captures kept
+
     # Game configuration
     WORLD_SIZE_X = int(os.environ.get('WORLD_SIZE_X', 12))
     WORLD_SIZE_Y = int(os.environ.get('WORLD_SIZE_Y', 12))
@@ -21,7 +55,7 @@ class Config:
     # Character starting stats
     STARTING_HEALTH = 100
     STARTING_STAMINA = 100
-    MAX_AP = 10
+    MAX_AP = int(os.environ.get('MAX_AP', 10))
     STARTING_AP = MAX_AP
     STARTING_MONEY = 500
 
@@ -33,6 +67,58 @@ class Config:
     MOVEMENT_AP_COST = 1
     ACTION_DEFAULT_AP_COST = 1
 
+    # Run MOVE, ENTER_BUILDING, EXIT_BUILDING and REST as server-side scripts
+    ACTION_SCRIPTS_ENABLED = os.environ.get('ACTION_SCRIPTS_ENABLED', 'True') == 'True'
+
+    # Character hash encoding, 'packed' stores rarely written numbers and the
+    # nested maps as binary fields, 'hash' stores every field on its own.
+    # Characters move to the configured encoding when they are next read
+    CHARACTER_ENCODING = os.environ.get('CHARACTER_ENCODING', 'packed')
+
+    # Action queue settings
+    ACTION_QUEUE_MAX_LENGTH = 50  # queued steps per character
+    ACTION_QUEUE_INTERVAL = 5  # seconds
+    ACTION_QUEUE_STEPS_PER_TICK = 5
+
+    # Effect settings
+    EFFECT_EXPIRY_INTERVAL = 5  # seconds
+    EFFECT_EXPIRY_BATCH_SIZE = 500  # index entries per batch
+    STATS_CACHE_SIZE = int(os.environ.get('STATS_CACHE_SIZE', 10000))  # cached stat snapshots
+
+    # Password hashing settings. 'tpool' uses eventlet's thread pool (sized by
+    # EVENTLET_THREADPOOL_SIZE), 'thread' a pool of PASSWORD_HASH_WORKERS threads
+    # for callers outside eventlet green threads, which always use tpool
+    PASSWORD_HASH_POOL = os.environ.get('PASSWORD_HASH_POOL', 'tpool')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 4))
+    PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', 32))  # queued and running hashes
+
+    # Session settings
+    SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 10000))  # cached users and user to character IDs
+
+    # Rate limit settings, each limit allows a burst of requests that refills
+    # over the period (in seconds)
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True') == 'True'
+    RATE_LIMITS = {
+        'auth': (10, 60),  # per address and route
+        'action': (10, 5),  # per user, actions and queueing
+        'chat': (5, 10)  # per user
+    }
+    RATE_LIMIT_CACHE_SIZE = 10000  # throttled clients remembered in-process
+
+    # Serialization settings. JSON_BACKEND is 'auto', 'orjson', 'msgspec' or
+    # 'json'; REST responses and socket packets over COMPRESSION_MIN_SIZE bytes
+    # are compressed when the client accepts it
+    JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto')
+    COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'True') == 'True'
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+    COMPRESSION_GZIP_LEVEL = 6
+    COMPRESSION_BROTLI_QUALITY = 4
+
+    # Pathfinding settings
+    PATH_CACHE_SIZE = int(os.environ.get('PATH_CACHE_SIZE', 1024))  # cached routes
+    PATH_LANDMARK_TYPES = ('corp_office', 'clinic', 'black_market')  # routes between these are cached at startup
+
     # WebSocket configuration
     SOCKET_PING_INTERVAL = 25
-    SOCKET_PING_TIMEOUT = 60
\ No newline at end of file
+    SOCKET_PING_TIMEOUT = 60
+    SOCKET_MSGPACK_ENABLED = os.environ.get('SOCKET_MSGPACK_ENABLED', 'True') == 'True'  # offer MessagePack to clients
\ No newline at end of file
@@ -1,22 +1,32 @@
 import redis
-import json
 from datetime import datetime
 from flask import g
 from config import Config
+from utils import serialization
+from services.redis_stats import InstrumentedRedis
 
 # Global Redis connection (can be accessed from anywhere)
 redis_connection = None
 
+# Responses are decoded as UTF-8 with this error handler, so binary values
+# (the packed character fields) come back as lone surrogates and are written
+# back as the same bytes
+REDIS_ENCODING_ERRORS = 'surrogateescape'
+
 
 def init_redis_connection():
     """Initialize the Redis connection"""
     global redis_connection
-    redis_connection = redis.Redis(
+
+    # Count commands per request and socket event when instrumentation is on
+    redis_class = InstrumentedRedis if Config.REDIS_STATS_ENABLED else redis.Redis
+    redis_connection = redis_class(
         host=Config.REDIS_HOST,
         port=Config.REDIS_PORT,
         db=Config.REDIS_DB,
         password=Config.REDIS_PASSWORD,
-        decode_responses=True  # Return strings instead of bytes
+        decode_responses=True,  # Return strings instead of bytes
+        encoding_errors=REDIS_ENCODING_ERRORS
     )
 
     # Check connection
@@ -58,7 +68,7 @@ def dict_to_redis_hash(dictionary):
     result = {}
     for key, value in dictionary.items():
         if isinstance(value, (dict, list)):
-            result[key] = json.dumps(value)
+            result[key] = serialization.dumps(value)
         elif isinstance(value, datetime):
             result[key] = value.isoformat()
         elif isinstance(value, bool):
@@ -80,7 +90,7 @@ def redis_hash_to_dict(hash_dict):
         # Handle numeric fields
         if (key.endswith('_id') and key != 'building_id' and key != 'id') or key in ('x', 'y', 'health', 'max_health',
                                       'stamina', 'max_stamina', 'ap', 'max_ap',
-                                      'money', 'experience', 'level'):
+                                      'money', 'experience', 'level', 'version'):
             result[key] = int(value) if value else 0
         # Handle UUID fields
         elif key == 'id' or key == 'building_id':
@@ -91,8 +101,8 @@ def redis_hash_to_dict(hash_dict):
         # Handle JSON strings
         elif value and (value.startswith('{') or value.startswith('[')):
             try:
-                result[key] = json.loads(value)
-            except (json.JSONDecodeError, TypeError):
+                result[key] = serialization.loads(value)
+            except (ValueError, TypeError):
                 result[key] = value
         # Handle everything else as strings
         else:
@@ -100,11 +110,29 @@ def redis_hash_to_dict(hash_dict):
     return result
 
 
+# Hash of per-entity version counters, fields are 'entity_type:entity_id'
+VERSIONS_KEY = 'versions'
+
+
+def bump_version(entity_type, entity_id, client=None):
+    """Increment an entity's version counter, client may be a pipeline"""
+    return (client or redis_connection).hincrby(VERSIONS_KEY, f"{entity_type}:{entity_id}", 1)
+
+
+def get_versions(refs):
+    """Get the version counters of (entity_type, entity_id) pairs in one lookup"""
+    values = redis_connection.hmget(VERSIONS_KEY, [f"{entity_type}:{entity_id}" for entity_type, entity_id in refs])
+    return [int(value or 0) for value in values]
+
+
 # Specialized Redis data access functions
 def save_entity(entity_type, entity_id, data):
-    """Save an entity to Redis"""
+    """Save an entity to Redis and bump its version"""
     key = f"{entity_type}:{entity_id}"
-    redis_connection.hmset(key, dict_to_redis_hash(data))
+    pipe = redis_connection.pipeline()
+    pipe.hmset(key, dict_to_redis_hash(data))
+    bump_version(entity_type, entity_id, pipe)
+    pipe.execute()
     return entity_id
 
 
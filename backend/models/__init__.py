@@ -24,5 +24,13 @@ def init_models():
     # Import models here to avoid circular imports
     from models.user import User
     from models.character import Character
+    from models.loot import compile_loot_tables
+
+    # Compile loot tables into samplers once, at startup
+    compile_loot_tables()
+
+    # Plan the routes between landmark buildings before players ask for them
+    from services.pathfinding import landmark_tiles, warm_route_cache
+    print(f"Cached {warm_route_cache(landmark_tiles())} landmark routes")
 
     print("Models initialized successfully")
\ No newline at end of file
@@ -0,0 +1,168 @@
+import database
+from models.character import build_character, encode_character
+from models.inventory import InventoryTransaction
+from models.world import WorldTile, Building, WorldObject
+
+# Registered action handlers keyed by action type
+ACTION_HANDLERS = {}
+
+# Entities a handler can declare as reads. Each entry maps the read name to a
+# function returning the Redis key to fetch (or None if it does not apply) and
+# a function building the entity from the decoded hash.
+READ_SOURCES = {
+    # Tile at the character's current position
+    'tile': (
+        lambda character, data: f"tile:{character.x}:{character.y}",
+        WorldTile.from_hash
+    ),
+    # Building the character is currently inside
+    'current_building': (
+        lambda character, data: f"building:{character.building_id}"
+        if character.inside_building and character.building_id else None,
+        Building.from_hash
+    ),
+    # Building referenced by the action data
+    'building': (
+        lambda character, data: f"building:{data['building_id']}" if data.get('building_id') else None,
+        Building.from_hash
+    ),
+    # Object referenced by the action data
+    'object': (
+        lambda character, data: f"object:{data['object_id']}" if data.get('object_id') else None,
+        WorldObject.from_hash
+    ),
+    # Character referenced by the action data
+    'target': (
+        lambda character, data: f"character:{data['target_id']}" if data.get('target_id') else None,
+        build_character
+    )
+}
+
+
+class ActionHandler:
+    """Registered handler for an action type"""
+
+    def __init__(self, action_type, handler, ap_cost, reads=None, writes=None, validate=None,
+                 script=None, script_args=None):
+        self.action_type = action_type
+        self.handler = handler
+        self.ap_cost = ap_cost
+        self.reads = tuple(reads or ())
+        self.writes = tuple(writes or ())
+        self.validate = validate
+        self.script = script
+        self.script_args = script_args
+
+        # Fail at registration time rather than on the first request
+        for read in self.reads:
+            if read not in READ_SOURCES:
+                raise ValueError(f"Unknown read '{read}' for action {action_type}")
+
+
+class ActionContext:
+    """Everything a handler needs to run, fetched before the handler is called"""
+
+    def __init__(self, character, action_data):
+        self.character = character
+        self.action_data = action_data
+        self.tile = None
+        self.current_building = None
+        self.building = None
+        self.object = None
+        self.target = None
+        self.inventory = None
+
+    def inventory_transaction(self):
+        """Inventory changes saved together with the character writes"""
+        if self.inventory is None:
+            self.inventory = InventoryTransaction(self.character.id)
+        return self.inventory
+
+
+def register_action(action_type, ap_cost, reads=None, writes=None, validate=None,
+                    script=None, script_args=None):
+    """Decorator registering a handler for an action type.
+
+    reads lists the entities (see READ_SOURCES) prefetched into the context,
+    writes lists the character fields the handler changes. The engine saves
+    those fields together with the AP cost, so handlers only mutate
+    ctx.character in memory and queue inventory changes on
+    ctx.inventory_transaction(). validate is called with the context before
+    the handler and returns an error message or None.
+
+    script names a server-side script (see models.action_scripts) that runs
+    the whole action in one round-trip instead of the handler. script_args
+    builds its arguments from the action data and raises ValueError for
+    invalid input.
+    """
+
+    def decorator(handler):
+        ACTION_HANDLERS[action_type] = ActionHandler(
+            action_type, handler, ap_cost, reads, writes, validate, script, script_args
+        )
+        return handler
+
+    return decorator
+
+
+def get_action_handler(action_type):
+    """Get the registered handler for an action type"""
+    return ACTION_HANDLERS.get(action_type)
+
+
+def prefetch(action_handler, character, action_data):
+    """Fetch every entity declared by the handler in one pipeline"""
+    context = ActionContext(character, action_data)
+
+    # Resolve keys first so entities that do not apply cost nothing
+    fetches = []
+    for read in action_handler.reads:
+        key_func, build = READ_SOURCES[read]
+        key = key_func(character, action_data)
+        if key:
+            fetches.append((read, key, build))
+
+    if not fetches:
+        return context
+
+    pipe = database.redis_connection.pipeline(transaction=False)
+    for _, key, _ in fetches:
+        pipe.hgetall(key)
+    results = pipe.execute()
+
+    for (read, key, build), data in zip(fetches, results):
+        entity_data = database.redis_hash_to_dict(data)
+        if entity_data:
+            setattr(context, read, build(entity_data))
+
+    return context
+
+
+def commit(action_handler, context, pipe):
+    """Queue the declared character writes and the AP cost on a pipeline.
+
+    The character must have been read under WATCH on the same pipeline,
+    which must be in its MULTI block, so absolute values are only written
+    if nothing changed the character since.
+    """
+    character = context.character
+    character.ap -= action_handler.ap_cost
+
+    fields = ['ap', *action_handler.writes]
+
+    pipe.hset(
+        f"character:{character.id}",
+        mapping=encode_character(character.to_hash(), fields)
+    )
+    database.bump_version('character', character.id, pipe)
+
+
+def character_state(character):
+    """Compact position and AP summary returned with action results"""
+    return {
+        'ap': character.ap,
+        'x': character.x,
+        'y': character.y,
+        'inside_building': character.inside_building,
+        'building_id': character.building_id if character.inside_building else None
+    }
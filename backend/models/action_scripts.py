@@ -0,0 +1,235 @@
+from datetime import datetime
+
+import database
+from utils import serialization
+
+# Server-side scripts for the common actions. Each script loads the character,
+# checks AP, validates the action, applies the new state, spends AP and
+# appends the action log atomically, so an action costs a single round-trip.
+#
+# KEYS[1] character hash, KEYS[2] character log set, KEYS[3] global log set,
+# KEYS[4] action log id counter, KEYS[5] entity version counters
+# ARGV[1] character id, ARGV[2] AP cost, ARGV[3] action type,
+# ARGV[4] ISO timestamp, ARGV[5] timestamp score, ARGV[6..] action arguments
+#
+# Tile and building keys are derived inside the scripts from the character's
+# position, which is fine for a single Redis server but not for a cluster.
+
+SCRIPT_PRELUDE = """
+local function fail(message)
+    return cjson.encode({success = false, message = message})
+end
+
+local function decode_list(value)
+    if value and string.sub(value, 1, 1) == '[' then
+        return cjson.decode(value)
+    end
+    return {}
+end
+
+local function contains(list, value)
+    for _, item in ipairs(list) do
+        if item == value then
+            return true
+        end
+    end
+    return false
+end
+
+local fields = redis.call('HMGET', KEYS[1], 'ap', 'x', 'y', 'inside_building', 'building_id',
+                          'health', 'max_health', 'stamina', 'max_stamina')
+if not fields[1] then
+    return fail('Character not found')
+end
+
+local character = {
+    ap = tonumber(fields[1]),
+    x = tonumber(fields[2]),
+    y = tonumber(fields[3]),
+    inside_building = fields[4] == '1',
+    building_id = fields[5] or '',
+    health = tonumber(fields[6]),
+    max_health = tonumber(fields[7]),
+    stamina = tonumber(fields[8]),
+    max_stamina = tonumber(fields[9])
+}
+
+local ap_cost = tonumber(ARGV[2])
+if character.ap < ap_cost then
+    return fail('Not enough AP. Need ' .. ARGV[2] .. ' AP.')
+end
+
+local updates = {}
+local message
+local log_data
+"""
+
+SCRIPT_EPILOGUE = """
+character.ap = character.ap - ap_cost
+updates['ap'] = tostring(character.ap)
+
+local flat = {}
+for field, value in pairs(updates) do
+    table.insert(flat, field)
+    table.insert(flat, value)
+end
+redis.call('HSET', KEYS[1], unpack(flat))
+redis.call('HINCRBY', KEYS[5], 'character:' .. ARGV[1], 1)
+
+local log_id = redis.call('INCR', KEYS[4])
+local log_json = cjson.encode({
+    id = log_id,
+    character_id = tonumber(ARGV[1]),
+    action_type = ARGV[3],
+    message = message,
+    data = log_data,
+    timestamp = ARGV[4]
+})
+redis.call('ZADD', KEYS[2], ARGV[5], log_json)
+redis.call('ZADD', KEYS[3], ARGV[5], log_json)
+
+local building_id = cjson.null
+if character.inside_building and character.building_id ~= '' then
+    building_id = character.building_id
+end
+
+return cjson.encode({
+    success = true,
+    message = message,
+    log_data = log_data,
+    character_state = {
+        ap = character.ap,
+        x = character.x,
+        y = character.y,
+        inside_building = character.inside_building,
+        building_id = building_id
+    }
+})
+"""
+
+# ARGV[6] direction, ARGV[7] dx, ARGV[8] dy, ARGV[9] world size x, ARGV[10] world size y
+MOVE_SCRIPT = """
+local direction = ARGV[6]
+local new_x = character.x + tonumber(ARGV[7])
+local new_y = character.y + tonumber(ARGV[8])
+
+if new_x < 0 or new_x >= tonumber(ARGV[9]) or new_y < 0 or new_y >= tonumber(ARGV[10]) then
+    return fail('Cannot move outside the world boundaries')
+end
+
+local tile_name = redis.call('HGET', 'tile:' .. new_x .. ':' .. new_y, 'name')
+if not tile_name then
+    tile_name = 'Unknown (' .. new_x .. ', ' .. new_y .. ')'
+end
+
+character.x = new_x
+character.y = new_y
+character.inside_building = false
+character.building_id = ''
+updates['x'] = tostring(new_x)
+updates['y'] = tostring(new_y)
+updates['inside_building'] = '0'
+updates['building_id'] = ''
+
+message = 'Moved ' .. direction .. ' to ' .. tile_name
+log_data = {x = new_x, y = new_y, direction = direction, tile_name = tile_name}
+"""
+
+# ARGV[6] building id
+ENTER_BUILDING_SCRIPT = """
+local building_id = ARGV[6]
+local building_name = redis.call('HGET', 'building:' .. building_id, 'name')
+if not building_name then
+    return fail('Building not found')
+end
+
+local tile_buildings = redis.call('HGET', 'tile:' .. character.x .. ':' .. character.y, 'buildings')
+if not contains(decode_list(tile_buildings), building_id) then
+    return fail('Building not found at current location')
+end
+
+character.inside_building = true
+character.building_id = building_id
+updates['inside_building'] = '1'
+updates['building_id'] = building_id
+
+message = 'Entered ' .. building_name
+log_data = {building_id = building_id, building_name = building_name}
+"""
+
+EXIT_BUILDING_SCRIPT = """
+if not character.inside_building then
+    return fail('Not inside a building')
+end
+
+local building_id = character.building_id
+local building_name = redis.call('HGET', 'building:' .. building_id, 'name') or 'building'
+
+character.inside_building = false
+character.building_id = ''
+updates['inside_building'] = '0'
+updates['building_id'] = ''
+
+message = 'Exited ' .. building_name
+log_data = {building_id = building_id, building_name = building_name}
+"""
+
+REST_SCRIPT = """
+local health_recovery = math.min(10, character.max_health - character.health)
+local stamina_recovery = math.min(10, character.max_stamina - character.stamina)
+
+if health_recovery > 0 then
+    updates['health'] = tostring(character.health + health_recovery)
+end
+if stamina_recovery > 0 then
+    updates['stamina'] = tostring(character.stamina + stamina_recovery)
+end
+
+local location_type = 'area'
+if character.inside_building then
+    location_type = 'building'
+end
+
+message = 'Rested and recovered ' .. health_recovery .. ' Health and ' .. stamina_recovery .. ' Stamina'
+log_data = {
+    health_recovery = health_recovery,
+    stamina_recovery = stamina_recovery,
+    location_type = location_type
+}
+"""
+
+ACTION_SCRIPTS = {
+    'MOVE': MOVE_SCRIPT,
+    'ENTER_BUILDING': ENTER_BUILDING_SCRIPT,
+    'EXIT_BUILDING': EXIT_BUILDING_SCRIPT,
+    'REST': REST_SCRIPT
+}
+
+# Registered script objects, created on first use. They are always called
+# with the current connection, so they survive the connection being replaced.
+_scripts = {}
+
+
+def get_action_script(name):
+    """Get the compiled script for an action"""
+    if name not in _scripts:
+        source = SCRIPT_PRELUDE + ACTION_SCRIPTS[name] + SCRIPT_EPILOGUE
+        _scripts[name] = database.redis_connection.register_script(source)
+    return _scripts[name]
+
+
+def run_action_script(name, character_id, action_type, ap_cost, args):
+    """Run an action script and return the decoded result"""
+    script = get_action_script(name)
+    now = datetime.now()
+
+    keys = [
+        f'character:{character_id}',
+        f'character:logs:{character_id}',
+        'global:logs',
+        'id:action_logs',
+        database.VERSIONS_KEY
+    ]
+    argv = [character_id, ap_cost, action_type, now.isoformat(), repr(now.timestamp())] + list(args)
+
+    return serialization.loads(script(keys=keys, args=argv, client=database.redis_connection))
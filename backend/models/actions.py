@@ -1,9 +1,10 @@
-import json
+import time
 from datetime import datetime
-import random
 
+from redis.exceptions import WatchError
+
+import database
 from database import (
-    redis_connection,
     get_entity,
     save_entity,
     get_next_id,
@@ -11,20 +12,36 @@ from database import (
     get_from_sorted_set
 )
 from config import Config
+from utils import serialization
 from models.character import (
     get_character_by_id,
-    update_character_position,
-    update_character_stats,
-    consume_ap,
-    add_experience
+    build_character,
+    apply_experience
 )
 from models.world import (
     get_tile,
     get_building,
     get_tile_with_contents,
     get_building_with_contents,
-    get_object
+    get_object,
+    get_location_entities
+)
+from models.action_engine import (
+    register_action,
+    get_action_handler,
+    prefetch,
+    commit,
+    character_state
 )
+from models.action_scripts import run_action_script
+from models.inventory import get_item_definition
+from models.loot import get_loot_table, loot_rng
+from models.stats import get_effective_stats
+from services.metrics import prepare_action_metrics, record_action
+
+# Attempts at running a handler before giving up on a character that keeps
+# changing underneath it
+ACTION_RETRIES = 5
 
 # Action definitions
 ACTION_TYPES = {
@@ -86,6 +103,21 @@ ACTION_TYPES = {
     }
 }
 
+# Movement directions and their coordinate deltas
+DIRECTIONS = {
+    'north': (0, -1),
+    'east': (1, 0),
+    'south': (0, 1),
+    'west': (-1, 0),
+    'northeast': (1, -1),
+    'southeast': (1, 1),
+    'southwest': (-1, 1),
+    'northwest': (-1, -1)
+}
+
+# Report every action type from the start, with unknown types as 'invalid'
+prepare_action_metrics([*ACTION_TYPES, 'invalid'])
+
 
 def get_available_actions(character_id):
     """Get available actions for a character"""
@@ -93,11 +125,17 @@ def get_available_actions(character_id):
     if not character:
         return []
 
+    location = get_location_entities(character.x, character.y, character.inside_building, character.building_id)
+    return build_available_actions(character, location)
+
+
+def build_available_actions(character, location):
+    """Build the available actions of a character at a loaded location"""
     available_actions = []
 
     # Character is in a building
     if character.inside_building:
-        building = get_building(character.building_id)
+        building = location['building']
         if building:
             # Always add exit building
             available_actions.append({
@@ -128,7 +166,7 @@ def get_available_actions(character_id):
 
             # Add interactions for objects in building
             for object_id in building.objects:
-                obj = get_object(object_id)
+                obj = location['objects'].get(object_id)
                 if obj:
                     available_actions.append({
                         'type': 'INTERACT',
@@ -143,7 +181,7 @@ def get_available_actions(character_id):
     # Character is outside
     else:
         # Get current tile
-        tile = get_tile(character.x, character.y)
+        tile = location['tile']
         if not tile:
             return []
 
@@ -151,16 +189,7 @@ def get_available_actions(character_id):
         movement_options = []
 
         # Check each direction
-        for direction, delta in {
-            'north': (0, -1),
-            'east': (1, 0),
-            'south': (0, 1),
-            'west': (-1, 0),
-            'northeast': (1, -1),
-            'southeast': (1, 1),
-            'southwest': (-1, 1),
-            'northwest': (-1, -1)
-        }.items():
+        for direction, delta in DIRECTIONS.items():
             dx, dy = delta
             new_x, new_y = character.x + dx, character.y + dy
 
@@ -188,7 +217,7 @@ def get_available_actions(character_id):
         if tile.buildings:
             building_options = []
             for building_id in tile.buildings:
-                building = get_building(building_id)
+                building = location['buildings'].get(building_id)
                 if building:
                     building_options.append({
                         'building_id': building_id,
@@ -227,7 +256,7 @@ def get_available_actions(character_id):
 
         # Add interactions for objects in tile
         for object_id in tile.objects:
-            obj = get_object(object_id)
+            obj = location['objects'].get(object_id)
             if obj:
                 available_actions.append({
                     'type': 'INTERACT',
@@ -246,88 +275,151 @@ def get_available_actions(character_id):
 
 
 def process_action(character_id, action_type, action_data=None):
+    """Process a character action, recording its result and duration"""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        result = run_action(character_id, action_type, action_data)
+        outcome = 'success' if result['success'] else 'failure'
+        return result
+    finally:
+        record_action(action_type if action_type in ACTION_TYPES else 'invalid', outcome,
+                      time.perf_counter() - started)
+
+
+def run_action(character_id, action_type, action_data=None):
     """Process a character action"""
     if not action_data:
         action_data = {}
 
-    # Get character
-    character = get_character_by_id(character_id)
-    if not character:
-        return {'success': False, 'message': 'Character not found'}
-
     # Get action details
     action_details = ACTION_TYPES.get(action_type)
     if not action_details:
         return {'success': False, 'message': 'Invalid action type'}
 
-    # Check if character has enough AP
-    ap_cost = action_details['ap_cost']
-    if character.ap < ap_cost:
-        return {'success': False, 'message': f'Not enough AP. Need {ap_cost} AP.'}
-
-    # Process different action types
-    result = {'success': False, 'message': 'Action failed'}
-
-    if action_type == 'MOVE':
-        result = process_move(character, action_data)
-    elif action_type == 'ENTER_BUILDING':
-        result = process_enter_building(character, action_data)
-    elif action_type == 'EXIT_BUILDING':
-        result = process_exit_building(character)
-    elif action_type == 'REST':
-        result = process_rest(character)
-    elif action_type == 'SEARCH':
-        result = process_search(character)
-    elif action_type == 'INTERACT':
-        result = process_interact(character, action_data)
-
-    # If action succeeded, consume AP and add action log
-    if result['success']:
-        consume_ap(character_id, ap_cost)
-        add_action_log(character_id, action_type, result['message'], result.get('log_data'))
+    # Declared actions without a handler are rejected before any I/O
+    action_handler = get_action_handler(action_type)
+    if not action_handler:
+        return {'success': False, 'message': f"{action_details['name']} is not available yet"}
+
+    # Scripted actions run entirely on the Redis server in one round-trip
+    if action_handler.script and Config.ACTION_SCRIPTS_ENABLED:
+        try:
+            script_args = action_handler.script_args(action_data) if action_handler.script_args else []
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+
+        return run_action_script(action_handler.script, character_id, action_type,
+                                 action_handler.ap_cost, script_args)
+
+    # The handler runs against a copy of the character read under WATCH, so
+    # its writes are dropped and it runs again if anything else changes the
+    # character first
+    key = f'character:{character_id}'
+    inventory_ids = []
+    with database.redis_connection.pipeline() as pipe:
+        for _ in range(ACTION_RETRIES):
+            try:
+                pipe.watch(key)
+                data = database.redis_hash_to_dict(pipe.hgetall(key))
+                if not data:
+                    pipe.reset()
+                    return {'success': False, 'message': 'Character not found'}
+                character = build_character(data)
+
+                # Check if character has enough AP
+                ap_cost = action_handler.ap_cost
+                if character.ap < ap_cost:
+                    pipe.reset()
+                    return {'success': False, 'message': f'Not enough AP. Need {ap_cost} AP.'}
+
+                # Fetch everything the handler declared in one round-trip
+                context = prefetch(action_handler, character, action_data)
+
+                if action_handler.validate:
+                    error = action_handler.validate(context)
+                    if error:
+                        pipe.reset()
+                        return {'success': False, 'message': error}
+
+                result = action_handler.handler(context)
+                if not result['success']:
+                    pipe.reset()
+                    return result
+
+                # Inventory changes are checked under WATCH on the same pipeline
+                write_inventory = None
+                if context.inventory is not None:
+                    write_inventory = context.inventory.stage(pipe, inventory_ids)
+                    if write_inventory is None:
+                        pipe.reset()
+                        return {'success': False, 'message': 'Inventory could not be updated'}
+
+                # Save the character writes, AP, inventory and action log together
+                pipe.multi()
+                commit(action_handler, context, pipe)
+                if write_inventory:
+                    write_inventory(pipe)
+                add_action_log(character_id, action_type, result['message'], result.get('log_data'), pipe=pipe)
+                pipe.execute()
+
+                result['character_state'] = character_state(context.character)
+                return result
+            except WatchError:
+                continue
+
+    return {'success': False, 'message': 'Character is busy, try again'}
+
+
+def validate_move(ctx):
+    """Validate move action data"""
+    if 'direction' not in ctx.action_data:
+        return 'No direction specified'
+
+    delta = DIRECTIONS.get(str(ctx.action_data['direction']).lower())
+    if not delta:
+        return 'Invalid direction'
+
+    new_x = ctx.character.x + delta[0]
+    new_y = ctx.character.y + delta[1]
 
-    return result
+    # Check if new coordinates are within world boundaries
+    if not (0 <= new_x < Config.WORLD_SIZE_X and 0 <= new_y < Config.WORLD_SIZE_Y):
+        return 'Cannot move outside the world boundaries'
 
+    return None
 
-def process_move(character, action_data):
-    """Process move action"""
+
+def move_script_args(action_data):
+    """Build move script arguments from action data"""
     if 'direction' not in action_data:
-        return {'success': False, 'message': 'No direction specified'}
-
-    # Parse direction
-    direction = action_data['direction'].lower()
-
-    # Calculate new position
-    dx, dy = 0, 0
-    if direction == 'north':
-        dy = -1
-    elif direction == 'east':
-        dx = 1
-    elif direction == 'south':
-        dy = 1
-    elif direction == 'west':
-        dx = -1
-    elif direction == 'northeast':
-        dx, dy = 1, -1
-    elif direction == 'southeast':
-        dx, dy = 1, 1
-    elif direction == 'southwest':
-        dx, dy = -1, 1
-    elif direction == 'northwest':
-        dx, dy = -1, -1
-    else:
-        return {'success': False, 'message': 'Invalid direction'}
+        raise ValueError('No direction specified')
 
-    # Calculate new coordinates
-    new_x = character.x + dx
-    new_y = character.y + dy
+    direction = str(action_data['direction']).lower()
+    delta = DIRECTIONS.get(direction)
+    if not delta:
+        raise ValueError('Invalid direction')
 
-    # Check if new coordinates are within world boundaries
-    if not (0 <= new_x < Config.WORLD_SIZE_X and 0 <= new_y < Config.WORLD_SIZE_Y):
-        return {'success': False, 'message': 'Cannot move outside the world boundaries'}
+    return [direction, delta[0], delta[1], Config.WORLD_SIZE_X, Config.WORLD_SIZE_Y]
+
+
+@register_action('MOVE', ACTION_TYPES['MOVE']['ap_cost'],
+                 writes=('x', 'y', 'inside_building', 'building_id'),
+                 validate=validate_move,
+                 script='MOVE', script_args=move_script_args)
+def process_move(ctx):
+    """Process move action"""
+    character = ctx.character
+    direction = ctx.action_data['direction'].lower()
+    dx, dy = DIRECTIONS[direction]
 
     # Update character position
-    update_character_position(character.id, new_x, new_y, False, None)
+    new_x = character.x + dx
+    new_y = character.y + dy
+    character.x = new_x
+    character.y = new_y
+    character.inside_building = False
+    character.building_id = None
 
     # Get new tile info
     new_tile = get_tile(new_x, new_y)
@@ -345,75 +437,101 @@ def process_move(character, action_data):
     }
 
 
-def process_enter_building(character, action_data):
-    """Process enter building action"""
-    if 'building_id' not in action_data:
-        return {'success': False, 'message': 'No building specified'}
-
-    building_id = action_data['building_id']
+def validate_enter_building(ctx):
+    """Validate enter building action data"""
+    if 'building_id' not in ctx.action_data:
+        return 'No building specified'
 
-    # Get building
-    building = get_building(building_id)
-    if not building:
-        return {'success': False, 'message': 'Building not found'}
+    if not ctx.building:
+        return 'Building not found'
 
     # Check if building is in character's current location
-    tile = get_tile(character.x, character.y)
-    if not tile or building_id not in tile.buildings:
-        return {'success': False, 'message': 'Building not found at current location'}
+    if not ctx.tile or ctx.building.id not in ctx.tile.buildings:
+        return 'Building not found at current location'
+
+    return None
+
 
-    # Check access requirements (to be implemented)
+def enter_building_script_args(action_data):
+    """Build enter building script arguments from action data"""
+    if not action_data.get('building_id'):
+        raise ValueError('No building specified')
+
+    return [action_data['building_id']]
+
+
+@register_action('ENTER_BUILDING', ACTION_TYPES['ENTER_BUILDING']['ap_cost'],
+                 reads=('building', 'tile'),
+                 writes=('inside_building', 'building_id'),
+                 validate=validate_enter_building,
+                 script='ENTER_BUILDING', script_args=enter_building_script_args)
+def process_enter_building(ctx):
+    """Process enter building action"""
+    building = ctx.building
 
     # Update character position
-    update_character_position(character.id, character.x, character.y, True, building_id)
+    ctx.character.inside_building = True
+    ctx.character.building_id = building.id
 
     return {
         'success': True,
         'message': f'Entered {building.name}',
         'log_data': {
-            'building_id': building_id,
+            'building_id': building.id,
             'building_name': building.name
         }
     }
 
 
-def process_exit_building(character):
-    """Process exit building action"""
-    if not character.inside_building:
-        return {'success': False, 'message': 'Not inside a building'}
+def validate_exit_building(ctx):
+    """Validate exit building action"""
+    if not ctx.character.inside_building:
+        return 'Not inside a building'
 
-    # Get building
-    building = get_building(character.building_id)
-    building_name = building.name if building else 'building'
+    return None
+
+
+@register_action('EXIT_BUILDING', ACTION_TYPES['EXIT_BUILDING']['ap_cost'],
+                 reads=('current_building',),
+                 writes=('inside_building', 'building_id'),
+                 validate=validate_exit_building,
+                 script='EXIT_BUILDING')
+def process_exit_building(ctx):
+    """Process exit building action"""
+    character = ctx.character
+    building_id = character.building_id
+    building_name = ctx.current_building.name if ctx.current_building else 'building'
 
     # Update character position
-    update_character_position(character.id, character.x, character.y, False, None)
+    character.inside_building = False
+    character.building_id = None
 
     return {
         'success': True,
         'message': f'Exited {building_name}',
         'log_data': {
-            'building_id': character.building_id,
+            'building_id': building_id,
             'building_name': building_name
         }
     }
 
 
-def process_rest(character):
+@register_action('REST', ACTION_TYPES['REST']['ap_cost'],
+                 writes=('health', 'stamina'),
+                 script='REST')
+def process_rest(ctx):
     """Process rest action"""
+    character = ctx.character
+
     # Calculate recovery amounts
     health_recovery = min(10, character.max_health - character.health)
     stamina_recovery = min(10, character.max_stamina - character.stamina)
 
     # Update character stats
-    updates = {}
     if health_recovery > 0:
-        updates['health'] = character.health + health_recovery
+        character.health += health_recovery
     if stamina_recovery > 0:
-        updates['stamina'] = character.stamina + stamina_recovery
-
-    if updates:
-        update_character_stats(character.id, updates)
+        character.stamina += stamina_recovery
 
     location_type = 'building' if character.inside_building else 'area'
 
@@ -428,40 +546,42 @@ def process_rest(character):
     }
 
 
-def process_search(character):
+@register_action('SEARCH', ACTION_TYPES['SEARCH']['ap_cost'],
+                 reads=('tile', 'current_building'),
+                 writes=('experience', 'level'))
+def process_search(ctx):
     """Process search action"""
-    from models.inventory import add_item_to_inventory
+    character = ctx.character
 
     # Determine search location
     location_type = 'building' if character.inside_building else 'area'
 
     # Chance to find something based on perception
-    perception = character.stats.get('perception', 5)
+    perception = get_effective_stats(character)['stats'].get('perception', 5)
     search_chance = min(0.5, 0.1 + (perception * 0.02))  # 20% base + 2% per perception
 
-    if random.random() < search_chance:
-        # Found something!
-        # In a real game, this would be based on location loot tables
-        possible_items = ['medkit', 'stim_pack', 'credits_chip']
-        item_code = random.choice(possible_items)
+    if loot_rng.random() < search_chance:
+        # Found something! Roll the loot table of the building or tile type
+        if character.inside_building:
+            loot_source = ctx.current_building.building_type if ctx.current_building else None
+        else:
+            loot_source = ctx.tile.tile_type if ctx.tile else None
+
+        drop = get_loot_table(loot_source).roll()
+        item_code = drop['item_code']
+        quantity = drop['quantity']
+        ctx.inventory_transaction().add_item(item_code, quantity, drop['custom_data'])
 
         # Special case for credits
-        if item_code == 'credits_chip':
-            quantity = 1
-            amount = random.randint(10, 50)
-            custom_data = {'amount': amount}
-            add_item_to_inventory(character.id, item_code, quantity, custom_data)
-            message = f'Found {amount} credits'
+        if item_code == 'credits_chip' and drop['custom_data']:
+            message = f"Found {drop['custom_data']['amount']} credits"
         else:
-            quantity = 1
-            add_item_to_inventory(character.id, item_code, quantity)
-            from models.inventory import get_item_definition
             item_def = get_item_definition(item_code)
             item_name = item_def['name'] if item_def else item_code
-            message = f'Found {item_name}'
+            message = f'Found {item_name}' if quantity == 1 else f'Found {quantity}x {item_name}'
 
         # Add a little experience
-        add_experience(character.id, 5)
+        apply_experience(character, 5)
 
         return {
             'success': True,
@@ -483,29 +603,35 @@ def process_search(character):
         }
 
 
-def process_interact(character, action_data):
-    """Process interact action"""
-    if 'object_id' not in action_data:
-        return {'success': False, 'message': 'No object specified'}
+def validate_interact(ctx):
+    """Validate interact action data"""
+    if 'object_id' not in ctx.action_data:
+        return 'No object specified'
 
-    object_id = action_data['object_id']
+    if not ctx.object:
+        return 'Object not found'
 
-    # Get object
-    obj = get_object(object_id)
-    if not obj:
-        return {'success': False, 'message': 'Object not found'}
+    object_id = ctx.object.id
 
     # Check if object is in character's location
-    if character.inside_building:
+    if ctx.character.inside_building:
         # Check if object is in the building
-        building = get_building(character.building_id)
-        if not building or object_id not in building.objects:
-            return {'success': False, 'message': 'Object not found in this building'}
+        if not ctx.current_building or object_id not in ctx.current_building.objects:
+            return 'Object not found in this building'
     else:
         # Check if object is in the tile
-        tile = get_tile(character.x, character.y)
-        if not tile or object_id not in tile.objects:
-            return {'success': False, 'message': 'Object not found in this area'}
+        if not ctx.tile or object_id not in ctx.tile.objects:
+            return 'Object not found in this area'
+
+    return None
+
+
+@register_action('INTERACT', ACTION_TYPES['INTERACT']['ap_cost'],
+                 reads=('object', 'tile', 'current_building'),
+                 validate=validate_interact)
+def process_interact(ctx):
+    """Process interact action"""
+    obj = ctx.object
 
     # Process interaction based on object type
     # This would be expanded in a real game with more complex interactions
@@ -514,7 +640,7 @@ def process_interact(character, action_data):
         'success': True,
         'message': f'Interacted with {obj.name}',
         'log_data': {
-            'object_id': object_id,
+            'object_id': obj.id,
             'object_name': obj.name,
             'object_type': obj.object_type
         }
@@ -534,8 +660,8 @@ def process_interact(character, action_data):
     return result
 
 
-def add_action_log(character_id, action_type, message, data=None):
-    """Add an action log entry"""
+def add_action_log(character_id, action_type, message, data=None, pipe=None):
+    """Add an action log entry, queued on pipe if one is given"""
     # Create log entry
     log_id = get_next_id('action_logs')
     log_data = {
@@ -548,14 +674,18 @@ def add_action_log(character_id, action_type, message, data=None):
     }
 
     # Convert to JSON string
-    log_json = json.dumps(log_data)
+    log_json = serialization.dumps(log_data)
 
     # Add to sorted set with current timestamp as score
     timestamp = datetime.now().timestamp()
-    add_to_sorted_set(f'character:logs:{character_id}', log_json, timestamp)
+    if pipe is not None:
+        pipe.zadd(f'character:logs:{character_id}', {log_json: timestamp})
+        pipe.zadd('global:logs', {log_json: timestamp})
+    else:
+        add_to_sorted_set(f'character:logs:{character_id}', log_json, timestamp)
 
-    # Also add to global logs (for admin/monitoring)
-    add_to_sorted_set('global:logs', log_json, timestamp)
+        # Also add to global logs (for admin/monitoring)
+        add_to_sorted_set('global:logs', log_json, timestamp)
 
     return log_id
 
@@ -566,7 +696,7 @@ def get_action_logs(character_id, limit=20):
     log_jsons = get_from_sorted_set(f'character:logs:{character_id}', 0, limit - 1)
 
     # Parse JSON strings
-    logs = [json.loads(log) for log in log_jsons]
+    logs = [serialization.loads(log) for log in log_jsons]
 
     return logs
 
@@ -577,6 +707,6 @@ def get_global_logs(limit=100):
     log_jsons = get_from_sorted_set('global:logs', 0, limit - 1)
 
     # Parse JSON strings
-    logs = [json.loads(log) for log in log_jsons]
+    logs = [serialization.loads(log) for log in log_jsons]
 
     return logs
\ No newline at end of file
@@ -0,0 +1,28 @@
+class Model:
+    """Base class of the slotted model classes.
+
+    Subclasses list their fields in __slots__, in the order they are stored
+    and sent. Fields in PRIVATE_FIELDS are stored but left out of to_dict,
+    which is what routes and socket events send to clients.
+    """
+
+    __slots__ = ()
+
+    PRIVATE_FIELDS = ()
+
+    @classmethod
+    def from_hash(cls, data):
+        """Build an instance from a decoded Redis hash, ignoring unknown fields"""
+        return cls(**{field: data[field] for field in cls.__slots__ if field in data})
+
+    def to_hash(self):
+        """Get every stored field, for saving to Redis"""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def to_dict(self):
+        """Get the public fields, for payloads"""
+        return {
+            field: getattr(self, field)
+            for field in self.__slots__
+            if field not in self.PRIVATE_FIELDS
+        }
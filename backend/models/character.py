@@ -1,20 +1,70 @@
-from datetime import datetime
-import json
+from datetime import datetime, timedelta
+import struct
+import uuid
 
+import database
 from database import (
     get_next_id,
-    save_entity,
     get_entity,
-    redis_connection,
     add_to_set,
     redis_hash_to_dict,
     dict_to_redis_hash
 )
 from config import Config
+from models.base import Model
+from utils import serialization
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Sorted set of active effects, members are 'character_id:effect_id' scored
+# by expiry timestamp
+EFFECT_EXPIRY_KEY = 'effects:expiry'
+
+# Packed character encoding. Fields only ever read and written through this
+# module are stored in two binary fields: 'n' holds the numbers packed with
+# struct, led by the encoding version, and 'm' the nested maps and creation
+# time packed with MessagePack as value lists in a fixed key order. Both are
+# stored as raw bytes, see to_binary_text. Fields
+# the action scripts, action engine, inventory transactions and effect
+# expiry read or write one by one stay plain hash fields, since packed ones
+# can only be written safely through update_character.
+CHARACTER_ENCODING_VERSION = 4
+PACKED_NUMBER_FIELDS = ('user_id', 'max_ap', 'money')
+PACKED_NUMBERS = struct.Struct('<BIHq')
+
+# Number layouts of earlier versions, still decoded until the character is
+# rewritten. Version 2 also packed experience and level, versions before 4
+# carried the bytes as latin-1 text.
+PACKED_NUMBER_LAYOUTS = {
+    2: (('user_id', 'max_ap', 'money', 'experience', 'level'), struct.Struct('<BIHqqH')),
+    3: (PACKED_NUMBER_FIELDS, PACKED_NUMBERS),
+    CHARACTER_ENCODING_VERSION: (PACKED_NUMBER_FIELDS, PACKED_NUMBERS)
+}
+LATIN_1_VERSIONS = (2, 3)
+PACKED_MAP_FIELDS = {
+    'stats': ('strength', 'agility', 'intelligence', 'charisma', 'perception', 'tech'),
+    'skills': ('combat', 'stealth', 'hacking', 'engineering', 'persuasion', 'medicine'),
+    'attributes': ('reputation', 'karma')
+}
+PACKED_FIELDS = PACKED_NUMBER_FIELDS + tuple(PACKED_MAP_FIELDS) + ('created_at',)
+
+# Every field a migration may move between the packed pair and plain fields
+MIGRATED_FIELDS = PACKED_FIELDS + ('experience', 'level')
+
+
+class Character(Model):
+    """Character model with stats and attributes"""
 
+    __slots__ = ('id', 'user_id', 'name', 'health', 'max_health', 'stamina', 'max_stamina',
+                 'ap', 'max_ap', 'money', 'experience', 'level', 'x', 'y', 'inside_building',
+                 'building_id', 'stats', 'skills', 'attributes', 'effects', 'equipment',
+                 'version', 'created_at')
 
-class Character:
-    """Character model with stats and attributes"""
+    # The version only keys server-side caches
+    PRIVATE_FIELDS = ('version',)
 
     def __init__(self, id=None, user_id=None, name=None,
                  health=Config.STARTING_HEALTH, max_health=Config.STARTING_HEALTH,
@@ -23,7 +73,7 @@ class Character:
                  money=Config.STARTING_MONEY, experience=0, level=1,
                  x=6, y=6, inside_building=False, building_id=None,
                  stats=None, skills=None, attributes=None, effects=None,
-                 equipment=None, inventory=None, created_at=None):
+                 equipment=None, version=0, created_at=None):
         self.id = id
         self.user_id = user_id
         self.name = name
@@ -67,10 +117,157 @@ class Character:
 
         self.effects = effects or []
         self.equipment = equipment or {}
-        self.inventory = inventory or []
+
+        # Bumped whenever stats, effects or equipment change
+        self.version = version
         self.created_at = created_at or datetime.now().isoformat()
 
 
+def character_encoding():
+    """Get the encoding new character writes use, 'packed' or 'hash'"""
+    if Config.CHARACTER_ENCODING == 'packed' and msgpack is not None:
+        return 'packed'
+    return 'hash'
+
+
+def to_binary_text(data):
+    """Carry bytes through the string-decoding Redis connection.
+
+    The connection encodes and decodes with surrogateescape (see
+    database.REDIS_ENCODING_ERRORS), so Redis stores the bytes themselves.
+    """
+    return data.decode('utf-8', 'surrogateescape')
+
+
+def from_binary_text(text, version=CHARACTER_ENCODING_VERSION):
+    """Recover bytes stored with to_binary_text by an encoding version"""
+    if version in LATIN_1_VERSIONS:
+        return text.encode('latin-1')
+    return text.encode('utf-8', 'surrogateescape')
+
+
+def pack_character_fields(values):
+    """Pack the packed fields of a character dict into 'n' and 'm'"""
+    numbers = PACKED_NUMBERS.pack(
+        CHARACTER_ENCODING_VERSION,
+        *(int(values.get(field) or 0) for field in PACKED_NUMBER_FIELDS)
+    )
+
+    # Keys outside the fixed order are kept as a map next to the value list
+    maps = [values.get('created_at')]
+    for field, keys in PACKED_MAP_FIELDS.items():
+        value = values.get(field) or {}
+        extra = {key: item for key, item in value.items() if key not in keys}
+        maps.append([value.get(key) for key in keys])
+        maps.append(extra or None)
+
+    return {
+        'n': to_binary_text(numbers),
+        'm': to_binary_text(msgpack.packb(maps))
+    }
+
+
+def unpack_character_fields(data):
+    """Replace 'n' and 'm' in a decoded character hash with the fields they hold.
+
+    Returns the encoding version of a packed hash, None for a plain one.
+    """
+    if 'n' not in data:
+        return None
+
+    # The version byte reads the same however the rest was carried
+    version = ord(data['n'][0])
+    layout = PACKED_NUMBER_LAYOUTS.get(version)
+    if layout is None:
+        raise ValueError(f"Unknown character encoding {version}")
+    fields, number_struct = layout
+    numbers = from_binary_text(data.pop('n'), version)
+
+    # Fields packed by an earlier version may since have been written plain
+    for field, value in zip(fields, number_struct.unpack(numbers)[1:]):
+        if field in PACKED_NUMBER_FIELDS:
+            data[field] = value
+        else:
+            data.setdefault(field, value)
+
+    maps = msgpack.unpackb(from_binary_text(data.pop('m'), version))
+    data['created_at'] = maps[0]
+    for index, (field, keys) in enumerate(PACKED_MAP_FIELDS.items()):
+        values, extra = maps[1 + index * 2], maps[2 + index * 2]
+        value = {key: item for key, item in zip(keys, values) if item is not None}
+        value.update(extra or {})
+        data[field] = value
+
+    return version
+
+
+def encode_character(values, fields=None):
+    """Encode character fields as hash fields in the current encoding.
+
+    fields limits the encoding to some fields, any packed one among them
+    writes the whole packed pair.
+    """
+    fields = fields or list(values)
+
+    if character_encoding() == 'hash':
+        return database.dict_to_redis_hash({field: values[field] for field in fields})
+
+    plain = {field: values[field] for field in fields if field not in PACKED_FIELDS}
+    mapping = database.dict_to_redis_hash(plain)
+    if len(plain) < len(fields):
+        mapping.update(pack_character_fields(values))
+    return mapping
+
+
+def stale_character_fields():
+    """Hash fields the current encoding replaces"""
+    return PACKED_FIELDS if character_encoding() == 'packed' else ('n', 'm')
+
+
+def save_character(character):
+    """Save a whole character in the current encoding and bump its version.
+
+    Only for characters nothing else can be writing yet, updates of existing
+    characters go through update_character.
+    """
+    key = f'character:{character.id}'
+    pipe = database.redis_connection.pipeline()
+    pipe.hset(key, mapping=encode_character(character.to_hash()))
+    pipe.hdel(key, *stale_character_fields())
+    database.bump_version('character', character.id, pipe)
+    pipe.execute()
+    return character.id
+
+
+def is_current_encoding(version):
+    """Check a hash unpacked as the given version is in the current encoding"""
+    if character_encoding() == 'packed':
+        return version == CHARACTER_ENCODING_VERSION
+    return version is None
+
+
+def migrate_character_encoding(character_id):
+    """Rewrite a character stored in another encoding in the current one.
+
+    The character is read again under WATCH and only the fields that move
+    between encodings are written, so concurrent writes to the others are
+    kept and the write is retried if one of the moved fields changes first.
+    """
+    key = f'character:{character_id}'
+
+    def write(pipe):
+        data = redis_hash_to_dict(pipe.hgetall(key))
+        if not data or is_current_encoding(unpack_character_fields(data)):
+            return
+
+        values = Character.from_hash(data).to_hash()
+        pipe.multi()
+        pipe.hset(key, mapping=encode_character(values, MIGRATED_FIELDS))
+        pipe.hdel(key, *stale_character_fields())
+
+    database.redis_connection.transaction(write, key)
+
+
 def create_character(user_id, name):
     """Create a new character for a user"""
 
@@ -85,10 +282,10 @@ def create_character(user_id, name):
     )
 
     # Save character to Redis
-    save_entity('character', character_id, character.__dict__)
+    save_character(character)
 
     # Link user to character
-    redis_connection.set(f'user:character:{user_id}', character_id)
+    database.redis_connection.set(f'user:character:{user_id}', character_id)
 
     # Add starting inventory items
     from models.inventory import add_item_to_inventory
@@ -98,136 +295,259 @@ def create_character(user_id, name):
     return character_id
 
 
+def build_character(data):
+    """Build a character from its decoded hash"""
+    # Inventories used to be embedded in the character hash, move them out
+    # the first time such a character is read
+    if 'inventory' in data:
+        from models.inventory import migrate_legacy_inventory
+        inventory = data.pop('inventory')
+        migrate_legacy_inventory(data['id'], inventory if isinstance(inventory, list) else [])
+
+    version = unpack_character_fields(data)
+
+    # Effects from before the expiry index have no ID, so nothing would
+    # ever remove them; index them the first time such a character is read
+    if any('id' not in effect for effect in data.get('effects') or []):
+        data['effects'] = migrate_legacy_effects(data['id'])
+
+    # Expired effects may not have been cleaned up yet
+    if data.get('effects'):
+        data['effects'] = active_effects(data['effects'])
+
+    character = Character.from_hash(data)
+
+    # Switch characters stored in another encoding the first time they are read
+    if not is_current_encoding(version):
+        migrate_character_encoding(character.id)
+
+    return character
+
+
 def get_character_by_id(character_id):
     """Get a character by ID"""
     data = get_entity('character', character_id)
     if not data:
         return None
 
-    return Character(**data)
+    return build_character(data)
 
 
 def get_character_by_user_id(user_id):
     """Get a character by user ID"""
-    character_id = redis_connection.get(f'user:character:{user_id}')
+    character_id = database.redis_connection.get(f'user:character:{user_id}')
     if not character_id:
         return None
 
     return get_character_by_id(character_id)
 
 
+def update_character(character_id, fields, change, bump_version=False):
+    """Change some fields of a character without overwriting the others.
+
+    The character is read under WATCH and change(character) is applied to
+    that copy, then only the listed fields are written, so whatever an
+    inventory transaction, action or other update wrote in the meantime is
+    kept. The write is retried if the character changes first. change may
+    return False to leave the character as it is. bump_version increments
+    the version field in Redis instead of writing it from the copy.
+
+    Returns True if the character exists and change did not refuse.
+    """
+    key = f'character:{character_id}'
+
+    def write(pipe):
+        data = redis_hash_to_dict(pipe.hgetall(key))
+        if not data:
+            return False
+
+        character = build_character(data)
+        if change(character) is False:
+            return False
+
+        pipe.multi()
+        pipe.hset(key, mapping=encode_character(character.to_hash(), fields))
+        if bump_version:
+            pipe.hincrby(key, 'version', 1)
+        database.bump_version('character', character_id, pipe)
+        return True
+
+    return database.redis_connection.transaction(write, key, value_from_callable=True)
+
+
 def update_character_stats(character_id, updates):
     """Update specific character stats"""
-    character = get_character_by_id(character_id)
-    if not character:
-        return False
+    fields = [key for key in updates if key in Character.__slots__ and key != 'version']
 
-    # Update character attributes
-    for key, value in updates.items():
-        if hasattr(character, key):
-            setattr(character, key, value)
+    def change(character):
+        for key in fields:
+            setattr(character, key, updates[key])
 
-    # Save character
-    save_entity('character', character_id, character.__dict__)
-    return True
+    return update_character(character_id, fields, change, bump_version=True)
 
 
 def update_character_position(character_id, x, y, inside_building=False, building_id=None):
     """Update a character's position"""
-    character = get_character_by_id(character_id)
-    if not character:
-        return False
+    def change(character):
+        character.x = x
+        character.y = y
+        character.inside_building = inside_building
+        character.building_id = building_id
 
-    character.x = x
-    character.y = y
-    character.inside_building = inside_building
-    character.building_id = building_id
-
-    # Save character
-    save_entity('character', character_id, character.__dict__)
-    return True
+    return update_character(character_id, ['x', 'y', 'inside_building', 'building_id'], change)
 
 
 def update_character_attribute(character_id, attribute, value):
     """Update a character's attribute (skills, stats, etc.)"""
-    character = get_character_by_id(character_id)
-    if not character:
+    if attribute not in Character.__slots__ or attribute == 'version':
         return False
 
-    # Handle complex attributes stored as JSON
-    if attribute in ['stats', 'skills', 'attributes']:
-        attr_dict = getattr(character, attribute)
-        for key, val in value.items():
-            attr_dict[key] = val
-        setattr(character, attribute, attr_dict)
-    else:
-        setattr(character, attribute, value)
-
-    # Save character
-    save_entity('character', character_id, character.__dict__)
-    return True
+    def change(character):
+        # Handle complex attributes stored as JSON
+        if attribute in ['stats', 'skills', 'attributes']:
+            getattr(character, attribute).update(value)
+        else:
+            setattr(character, attribute, value)
 
+    return update_character(character_id, [attribute], change, bump_version=True)
 
-def add_effect_to_character(character_id, effect_type, duration, data=None):
-    """Add a temporary effect to a character"""
-    character = get_character_by_id(character_id)
-    if not character:
-        return False
 
-    # Create effect
-    effect = {
+def make_effect(effect_type, duration, data=None):
+    """Create a temporary effect entry"""
+    now = datetime.now()
+    return {
+        'id': uuid.uuid4().hex,
         'type': effect_type,
-        'start_time': datetime.now().isoformat(),
+        'start_time': now.isoformat(),
         'duration': duration,  # in seconds
+        'expires_at': (now + timedelta(seconds=duration)).timestamp(),
         'data': data or {}
     }
 
-    # Add to effects list
-    character.effects.append(effect)
 
-    # Save character
-    save_entity('character', character_id, character.__dict__)
-    return True
+def effect_expires_at(effect):
+    """Get the expiry timestamp of an effect"""
+    if 'expires_at' in effect:
+        return effect['expires_at']
 
+    # Effects created before expires_at was stored
+    return datetime.fromisoformat(effect['start_time']).timestamp() + effect['duration']
 
-def consume_ap(character_id, amount):
-    """Consume AP from a character"""
-    character = get_character_by_id(character_id)
-    if not character:
-        return False
 
-    # Check if character has enough AP
-    if character.ap < amount:
-        return False
+def active_effects(effects, now=None):
+    """Filter out expired effects"""
+    now = now or datetime.now().timestamp()
+    return [effect for effect in effects or [] if effect_expires_at(effect) > now]
 
-    # Consume AP
-    character.ap -= amount
 
-    # Save character
-    save_entity('character', character_id, character.__dict__)
-    return True
+def index_effect(client, character_id, effect):
+    """Add an effect to the expiry index, client may be a pipeline"""
+    client.zadd(EFFECT_EXPIRY_KEY, {f"{character_id}:{effect['id']}": effect_expires_at(effect)})
 
 
-def regen_ap(character_id, amount=1):
-    """Regenerate AP for a character"""
-    character = get_character_by_id(character_id)
-    if not character:
-        return False
+def migrate_legacy_effects(character_id):
+    """Give a character's effects without an ID one and index them.
 
-    # Add AP up to max
-    character.ap = min(character.max_ap, character.ap + amount)
+    The effects are read again under WATCH so concurrent changes are kept.
+    Already expired ones are indexed too, the next expiry pass removes them.
+    Returns the stored effects.
+    """
+    key = f'character:{character_id}'
 
-    # Save character
-    save_entity('character', character_id, character.__dict__)
-    return True
+    def write(pipe):
+        effects = serialization.loads(pipe.hget(key, 'effects') or '[]')
+        legacy = [effect for effect in effects if 'id' not in effect]
+        if not legacy:
+            return effects
 
+        for effect in legacy:
+            effect['id'] = uuid.uuid4().hex
 
-def add_experience(character_id, amount):
-    """Add experience to a character and level up if needed"""
-    character = get_character_by_id(character_id)
-    if not character:
+        pipe.multi()
+        pipe.hset(key, 'effects', serialization.dumps(effects))
+        for effect in legacy:
+            index_effect(pipe, character_id, effect)
+        return effects
+
+    return database.redis_connection.transaction(write, key, value_from_callable=True)
+
+
+def add_effect_to_character(character_id, effect_type, duration, data=None):
+    """Add a temporary effect to a character"""
+    effect = make_effect(effect_type, duration, data)
+
+    def change(character):
+        character.effects.append(effect)
+
+    if not update_character(character_id, ['effects'], change, bump_version=True):
         return False
 
+    # Index the effect so the expiry worker removes it
+    index_effect(database.redis_connection, character_id, effect)
+    return True
+
+
+def expire_effects(now=None, batch_size=None):
+    """Remove one batch of due effects from their characters.
+
+    Only effects in the expiry index with a score up to now are touched, so
+    the cost follows the number of expiring effects rather than the number of
+    characters. Returns the number of index entries processed.
+    """
+    now = now or datetime.now().timestamp()
+    batch_size = batch_size or Config.EFFECT_EXPIRY_BATCH_SIZE
+
+    members = database.redis_connection.zrangebyscore(EFFECT_EXPIRY_KEY, '-inf', now, start=0, num=batch_size)
+    if not members:
+        return 0
+
+    # Prune every affected character once
+    character_ids = {member.split(':')[0] for member in members}
+    for character_id in character_ids:
+        key = f'character:{character_id}'
+
+        def prune(pipe):
+            effects_json = pipe.hget(key, 'effects')
+            if effects_json is None:
+                return
+
+            effects = serialization.loads(effects_json or '[]')
+            remaining = active_effects(effects, now)
+            pipe.multi()
+            if len(remaining) != len(effects):
+                pipe.hset(key, 'effects', serialization.dumps(remaining))
+                pipe.hincrby(key, 'version', 1)
+                database.bump_version('character', character_id, pipe)
+
+        database.redis_connection.transaction(prune, key)
+
+    database.redis_connection.zrem(EFFECT_EXPIRY_KEY, *members)
+
+    return len(members)
+
+
+def consume_ap(character_id, amount):
+    """Consume AP from a character"""
+    def change(character):
+        # Check if character has enough AP
+        if character.ap < amount:
+            return False
+        character.ap -= amount
+
+    return update_character(character_id, ['ap'], change)
+
+
+def regen_ap(character_id, amount=1):
+    """Regenerate AP for a character"""
+    def change(character):
+        # Add AP up to max
+        character.ap = min(character.max_ap, character.ap + amount)
+
+    return update_character(character_id, ['ap'], change)
+
+
+def apply_experience(character, amount):
+    """Add experience to a loaded character and level up if needed"""
     # Add experience
     character.experience += amount
 
@@ -238,6 +558,8 @@ def add_experience(character_id, amount):
         character.level += 1
         # Could add bonuses for level up here
 
-    # Save character
-    save_entity('character', character_id, character.__dict__)
-    return True
\ No newline at end of file
+
+def add_experience(character_id, amount):
+    """Add experience to a character and level up if needed"""
+    return update_character(character_id, ['experience', 'level'],
+                            lambda character: apply_experience(character, amount))
\ No newline at end of file
@@ -1,393 +1,492 @@
-import json
 from datetime import datetime
 
-from database import (
-    redis_connection,
-    get_entity,
-    save_entity,
-    get_next_id,
-    redis_hash_to_dict
-)
-
-# Item definitions - in a real game, this would be in a separate database,
-# but for simplicity, we'll define them here
-ITEM_DEFINITIONS = {
-    # Communication
-    "basic_phone": {
-        "name": "Basic Phone",
-        "description": "A simple communication device.",
-        "type": "equipment",
-        "slot": "comm",
-        "value": 50,
-        "effects": {
-            "can_communicate": True
-        },
-        "icon": "phone"
-    },
-    "cyberdeck_basic": {
-        "name": "Basic Cyberdeck",
-        "description": "Entry-level hacking device.",
-        "type": "equipment",
-        "slot": "deck",
-        "value": 500,
-        "effects": {
-            "hacking_bonus": 1
-        },
-        "icon": "laptop-code"
-    },
-    # Weapons
-    "pistol": {
-        "name": "Pistol",
-        "description": "Standard semi-automatic pistol.",
-        "type": "weapon",
-        "slot": "weapon",
-        "value": 200,
-        "damage": 10,
-        "effects": {},
-        "icon": "gun"
-    },
-    "stun_baton": {
-        "name": "Stun Baton",
-        "description": "Non-lethal melee weapon.",
-        "type": "weapon",
-        "slot": "weapon",
-        "value": 150,
-        "damage": 5,
-        "effects": {
-            "stun_chance": 0.25
-        },
-        "icon": "bolt"
-    },
-    # Armor
-    "light_armor": {
-        "name": "Light Armor Jacket",
-        "description": "Provides basic protection.",
-        "type": "armor",
-        "slot": "body",
-        "value": 300,
-        "defense": 5,
-        "effects": {},
-        "icon": "vest"
-    },
-    # Consumables
-    "medkit": {
-        "name": "Medkit",
-        "description": "Heals injuries.",
-        "type": "consumable",
-        "value": 100,
-        "use_effect": {
-            "health": 25
-        },
-        "icon": "medkit"
-    },
-    "stim_pack": {
-        "name": "Stim Pack",
-        "description": "Temporarily boosts capabilities.",
-        "type": "consumable",
-        "value": 75,
-        "use_effect": {
-            "temporary_boost": {
-                "duration": 300,  # 5 minutes in seconds
-                "stats": {
-                    "strength": 2,
-                    "agility": 2
-                }
-            }
-        },
-        "icon": "syringe"
-    },
-    # Currency
-    "credits_chip": {
-        "name": "Credits Chip",
-        "description": "Digital currency storage.",
-        "type": "currency",
-        "value": 0,  # Value is stored in the quantity field
-        "icon": "credit-card"
-    },
-    # Quest/Special Items
-    "access_card": {
-        "name": "Access Card",
-        "description": "Grants access to restricted areas.",
-        "type": "key",
-        "value": 250,
-        "effects": {
-            "access_level": 1
-        },
-        "icon": "id-card"
-    },
-    "data_chip": {
-        "name": "Data Chip",
-        "description": "Contains encrypted data.",
-        "type": "quest",
-        "value": 500,
-        "effects": {},
-        "icon": "microchip"
-    }
-}
+from redis.exceptions import WatchError
 
+import database
+from models.character import make_effect, active_effects, index_effect, PACKED_FIELDS
+from models.items import BONUS_FIELDS, get_item, compute_equipment_bonuses
+from utils import serialization
 
-def get_item_definition(item_code):
-    """Get the definition for an item"""
-    return ITEM_DEFINITIONS.get(item_code, None)
+# Attempts at committing an inventory transaction before giving up
+TRANSACTION_RETRIES = 5
 
 
-def add_item_to_inventory(character_id, item_code, quantity=1, custom_data=None):
-    """Add an item to a character's inventory"""
-    # Get item definition
-    item_def = get_item_definition(item_code)
-    if not item_def:
-        return False
+def get_item_definition(item_code):
+    """Get a copy of the definition for an item, as a plain dict"""
+    item = get_item(item_code)
+    return dict(item.definition) if item else None
 
-    # Get character data
-    character_data = get_entity('character', character_id)
-    if not character_data:
-        return False
 
-    # Load inventory
-    inventory = character_data.get('inventory', [])
-
-    # Check if item can be stacked (consumables and currency can be stacked)
-    if item_def['type'] in ['consumable', 'currency'] and not custom_data:
-        # Look for existing stack
-        for i, item in enumerate(inventory):
-            if item['item_code'] == item_code:
-                # Update quantity
-                inventory[i]['quantity'] += quantity
-                # Save inventory
-                save_entity('character', character_id, {'inventory': inventory})
-                return True
-
-    # Create new inventory item
-    inventory_item = {
-        'id': str(get_next_id('inventory_items')),
-        'item_code': item_code,
-        'quantity': quantity,
-        'acquired_at': datetime.now().isoformat()
-    }
+def inventory_key(character_id):
+    """Redis key of a character's inventory hash (item id -> packed item)"""
+    return f'character:inventory:{character_id}'
 
-    # Add custom data if provided
-    if custom_data:
-        inventory_item['custom_data'] = custom_data
 
-    # Add to inventory
-    inventory.append(inventory_item)
+def stack_index_key(character_id):
+    """Redis key of a character's stack index (item code -> item id)"""
+    return f'character:inventory:stacks:{character_id}'
 
-    # Save inventory
-    character_data['inventory'] = inventory
-    save_entity('character', character_id, character_data)
 
-    return True
+def equipment_bonuses_key(character_id):
+    """Redis key of a character's aggregated equipment bonuses"""
+    return f'character:bonuses:{character_id}'
 
 
-def remove_item_from_inventory(character_id, inventory_item_id, quantity=1):
-    """Remove an item from a character's inventory"""
-    # Get character data
-    character_data = get_entity('character', character_id)
-    if not character_data:
-        return False
+def is_stackable(item, custom_data=None):
+    """Check if an item can be stacked (consumables and currency can be stacked)"""
+    return item.stackable and not custom_data
 
-    # Load inventory
-    inventory = character_data.get('inventory', [])
 
-    # Find item
-    for i, item in enumerate(inventory):
-        if item['id'] == inventory_item_id:
-            # Check quantity
-            if item['quantity'] <= quantity:
-                # Remove entire stack
-                inventory.pop(i)
-            else:
-                # Reduce quantity
-                inventory[i]['quantity'] -= quantity
-
-            # Save inventory
-            character_data['inventory'] = inventory
-            save_entity('character', character_id, character_data)
-            return True
-
-    return False
-
-
-def get_inventory(character_id):
-    """Get a character's inventory with expanded item definitions"""
-    # Get character data
-    character_data = get_entity('character', character_id)
-    if not character_data:
-        return []
-
-    # Load inventory
-    inventory = character_data.get('inventory', [])
+def pack_item(item):
+    """Pack an inventory item into its compact hash value"""
+    return serialization.dumps(
+        [item['item_code'], item['quantity'], item['acquired_at'], item.get('custom_data')]
+    )
 
-    # Expand items with their definitions
-    expanded_inventory = []
-    for item in inventory:
-        item_def = get_item_definition(item['item_code'])
-        if item_def:
-            expanded_item = {
-                **item,
-                'definition': item_def
-            }
-            expanded_inventory.append(expanded_item)
 
-    return expanded_inventory
+def unpack_item(inventory_item_id, packed):
+    """Unpack an inventory item from its hash value"""
+    item_code, quantity, acquired_at, custom_data = serialization.loads(packed)
 
+    item = {
+        'id': inventory_item_id,
+        'item_code': item_code,
+        'quantity': quantity,
+        'acquired_at': acquired_at
+    }
+    if custom_data:
+        item['custom_data'] = custom_data
+
+    return item
+
+
+def get_inventory_item(character_id, inventory_item_id):
+    """Get a single inventory item"""
+    inventory_item_id = str(inventory_item_id)
+    packed = database.redis_connection.hget(inventory_key(character_id), inventory_item_id)
+    if not packed:
+        return None
+
+    return unpack_item(inventory_item_id, packed)
+
+
+def get_equipment(character_id):
+    """Get a character's equipment (slot -> item id), or None if there is no character"""
+    equipment = database.redis_connection.hget(f'character:{character_id}', 'equipment')
+    if equipment is None:
+        return None
+
+    return serialization.loads(equipment) if equipment else {}
+
+
+class InventoryTransaction:
+    """Accumulates inventory, equipment and stat changes for one character
+    and commits them atomically.
+
+    Operations are checked against the state read at commit time, inside a
+    WATCH/MULTI block that is retried if another client changes the
+    character or its inventory in between. If any operation is invalid,
+    nothing is written.
+    """
+
+    def __init__(self, character_id):
+        self.character_id = character_id
+        self.operations = []
+
+    def add_item(self, item_code, quantity=1, custom_data=None):
+        """Add an item, stacking it if possible"""
+        self.operations.append(('add', item_code, quantity, custom_data))
+        return self
+
+    def remove_item(self, inventory_item_id, quantity=1):
+        """Remove a quantity of an item, dropping the stack when it runs out"""
+        self.operations.append(('remove', str(inventory_item_id), quantity))
+        return self
+
+    def equip(self, inventory_item_id):
+        """Equip an item into its definition's slot"""
+        self.operations.append(('equip', str(inventory_item_id)))
+        return self
+
+    def unequip(self, slot):
+        """Empty an equipment slot"""
+        self.operations.append(('unequip', slot))
+        return self
+
+    def adjust_stat(self, field, delta, max_field=None):
+        """Change a numeric character field, capped by another field if given.
+
+        Only plain hash fields can be adjusted, packed ones are not readable
+        on their own.
+        """
+        if field in PACKED_FIELDS or max_field in PACKED_FIELDS:
+            raise ValueError(f"Cannot adjust packed character field {field}")
+        self.operations.append(('stat', field, delta, max_field))
+        return self
+
+    def add_effect(self, effect_type, duration, data=None):
+        """Add a temporary effect to the character"""
+        self.operations.append(('effect', make_effect(effect_type, duration, data)))
+        return self
+
+    def _character_fields(self):
+        """Character hash fields read by the queued operations"""
+        fields = ['id', 'equipment']
+        for operation in self.operations:
+            if operation[0] == 'stat':
+                fields.append(operation[1])
+                if operation[3]:
+                    fields.append(operation[3])
+            elif operation[0] == 'effect':
+                fields.append('effects')
+        return list(dict.fromkeys(fields))
+
+    def _apply(self, character, items, stacks, new_ids):
+        """Apply the operations to the loaded state, returning False if one is invalid"""
+        for operation in self.operations:
+            op = operation[0]
+
+            if op == 'add':
+                _, item_code, quantity, custom_data = operation
+                item_def = get_item(item_code)
+                if not item_def:
+                    return False
+
+                stackable = is_stackable(item_def, custom_data)
+                stack_id = stacks.get(item_code) if stackable else None
+                if stack_id and items.get(stack_id):
+                    items[stack_id]['quantity'] += quantity
+                    continue
+
+                inventory_item = {
+                    'id': new_ids.pop(0),
+                    'item_code': item_code,
+                    'quantity': quantity,
+                    'acquired_at': datetime.now().isoformat()
+                }
+                if custom_data:
+                    inventory_item['custom_data'] = custom_data
+
+                items[inventory_item['id']] = inventory_item
+                if stackable:
+                    stacks[item_code] = inventory_item['id']
+
+            elif op == 'remove':
+                _, item_id, quantity = operation
+                item = items.get(item_id)
+                if not item:
+                    return False
+
+                if item['quantity'] <= quantity:
+                    items[item_id] = None
+                    item_def = get_item(item['item_code'])
+                    if item_def and is_stackable(item_def, item.get('custom_data')):
+                        stacks[item['item_code']] = None
+
+                    # Nothing stays equipped once it leaves the inventory
+                    for slot, equipped_id in list(character['equipment'].items()):
+                        if equipped_id == item_id:
+                            character['equipment'].pop(slot)
+                else:
+                    item['quantity'] -= quantity
+
+            elif op == 'equip':
+                item = items.get(operation[1])
+                item_def = get_item(item['item_code']) if item else None
+                if not item_def or not item_def.slot:
+                    return False
+
+                character['equipment'][item_def.slot] = item['id']
+
+            elif op == 'unequip':
+                if operation[1] not in character['equipment']:
+                    return False
+
+                character['equipment'].pop(operation[1])
+
+            elif op == 'stat':
+                _, field, delta, max_field = operation
+                value = int(character.get(field) or 0) + delta
+                if max_field:
+                    value = min(value, int(character.get(max_field) or 0))
+                character[field] = value
+
+            elif op == 'effect':
+                character['effects'].append(operation[1])
+
+        return True
+
+    def stage(self, pipe, new_ids):
+        """Watch and read the state the operations depend on.
+
+        pipe must not have started its MULTI block yet, and may already
+        watch other keys. Returns a function queuing the writes on pipe once
+        MULTI has started, or None if the character does not exist or an
+        operation is invalid. new_ids holds inventory item IDs reserved by
+        earlier attempts and is extended with the ones reserved now.
+        """
+        character_key = f'character:{self.character_id}'
+        items_key = inventory_key(self.character_id)
+        stacks_key = stack_index_key(self.character_id)
+
+        fields = self._character_fields()
+        item_ids = [operation[1] for operation in self.operations if operation[0] in ('remove', 'equip')]
+        item_codes = [operation[1] for operation in self.operations if operation[0] == 'add']
+        # Equipment bonuses are recomputed whenever equipment may change
+        touches_equipment = any(operation[0] in ('remove', 'equip', 'unequip') for operation in self.operations)
+
+        pipe.watch(character_key, items_key, stacks_key)
+
+        # Load the state the operations depend on
+        values = pipe.hmget(character_key, fields)
+        if values[0] is None:
+            return None
+
+        character = dict(zip(fields, values))
+        character['equipment'] = serialization.loads(character['equipment'] or '{}')
+        if 'effects' in character:
+            character['effects'] = serialization.loads(character['effects'] or '[]')
+
+        stacks = dict(zip(item_codes, pipe.hmget(stacks_key, item_codes))) if item_codes else {}
+        equipped_ids = list(character['equipment'].values()) if touches_equipment else []
+        wanted_ids = list(dict.fromkeys(
+            item_ids + equipped_ids + [item_id for item_id in stacks.values() if item_id]
+        ))
+        items = {}
+        loaded = {}
+        if wanted_ids:
+            for item_id, packed in zip(wanted_ids, pipe.hmget(items_key, wanted_ids)):
+                items[item_id] = unpack_item(item_id, packed) if packed else None
+                loaded[item_id] = packed
+
+        # Reserve IDs for items that may start a new stack, in one call
+        needed = 0
+        for operation in self.operations:
+            if operation[0] != 'add':
+                continue
+            _, item_code, _, custom_data = operation
+            item_def = get_item(item_code)
+            stack_id = stacks.get(item_code) if item_def and is_stackable(item_def, custom_data) else None
+            if not (stack_id and items.get(stack_id)):
+                needed += 1
+        missing = needed - len(new_ids)
+        if missing > 0:
+            last_id = database.redis_connection.incrby('id:inventory_items', missing)
+            new_ids.extend(str(i) for i in range(last_id - missing + 1, last_id + 1))
+
+        original_stacks = dict(stacks)
+        original_equipment = dict(character['equipment'])
+        if not self._apply(character, items, stacks, list(new_ids)):
+            return None
+
+        def write(pipe):
+            """Queue everything that changed"""
+            for item_id, item in items.items():
+                if item is None:
+                    if loaded.get(item_id):
+                        pipe.hdel(items_key, item_id)
+                else:
+                    packed = pack_item(item)
+                    if packed != loaded.get(item_id):
+                        pipe.hset(items_key, item_id, packed)
+            for item_code, item_id in stacks.items():
+                if item_id is None:
+                    pipe.hdel(stacks_key, item_code)
+                elif original_stacks.get(item_code) != item_id:
+                    pipe.hset(stacks_key, item_code, item_id)
+
+            updates = {
+                operation[1]: character[operation[1]]
+                for operation in self.operations
+                if operation[0] == 'stat'
+            }
+            if character['equipment'] != original_equipment:
+                updates['equipment'] = character['equipment']
+                bonuses = compute_equipment_bonuses(
+                    items[item_id]['item_code']
+                    for item_id in character['equipment'].values()
+                    if items.get(item_id)
+                )
+                pipe.hset(equipment_bonuses_key(self.character_id), mapping=bonuses)
+            if 'effects' in character:
+                # Drop expired effects while rewriting the list
+                updates['effects'] = active_effects(character['effects'])
+                for operation in self.operations:
+                    if operation[0] == 'effect':
+                        index_effect(pipe, self.character_id, operation[1])
+            if updates:
+                pipe.hset(character_key, mapping=database.dict_to_redis_hash(updates))
+                database.bump_version('character', self.character_id, pipe)
+            if 'equipment' in updates or 'effects' in updates:
+                pipe.hincrby(character_key, 'version', 1)
+            database.bump_version('inventory', self.character_id, pipe)
+
+        return write
+
+    def commit(self):
+        """Commit all operations atomically, returning True on success"""
+        new_ids = []
+
+        with database.redis_connection.pipeline() as pipe:
+            for _ in range(TRANSACTION_RETRIES):
+                try:
+                    write = self.stage(pipe, new_ids)
+                    if write is None:
+                        pipe.reset()
+                        return False
+
+                    # Write everything that changed in one MULTI block
+                    pipe.multi()
+                    write(pipe)
+                    pipe.execute()
+                    return True
+                except WatchError:
+                    # Someone else changed the character, start over
+                    continue
 
-def equip_item(character_id, inventory_item_id):
-    """Equip an item to a character"""
-    # Get character data
-    character_data = get_entity('character', character_id)
-    if not character_data:
         return False
 
-    # Load inventory and equipment
-    inventory = character_data.get('inventory', [])
-    equipment = character_data.get('equipment', {})
 
-    # Find item in inventory
-    item_to_equip = None
-    for item in inventory:
-        if item['id'] == inventory_item_id:
-            item_to_equip = item
-            break
+def add_item_to_inventory(character_id, item_code, quantity=1, custom_data=None):
+    """Add an item to a character's inventory"""
+    return InventoryTransaction(character_id).add_item(item_code, quantity, custom_data).commit()
 
-    if not item_to_equip:
-        return False
 
-    # Get item definition
-    item_def = get_item_definition(item_to_equip['item_code'])
-    if not item_def:
-        return False
+def remove_item_from_inventory(character_id, inventory_item_id, quantity=1):
+    """Remove an item from a character's inventory"""
+    return InventoryTransaction(character_id).remove_item(inventory_item_id, quantity).commit()
 
-    # Check if item is equipment
-    if 'slot' not in item_def:
-        return False
 
-    # Get slot
-    slot = item_def['slot']
+def unpack_inventory(packed_items):
+    """Decode an inventory hash into items, oldest first"""
+    inventory = sorted(
+        (unpack_item(item_id, packed) for item_id, packed in packed_items.items()),
+        key=lambda item: int(item['id'])
+    )
 
-    # Check if slot is already filled
-    if slot in equipment:
-        # Unequip current item
-        old_item_id = equipment[slot]
-        equipment.pop(slot)
+    # Skip items whose definition no longer exists
+    return [item for item in inventory if get_item(item['item_code'])]
 
-    # Equip new item
-    equipment[slot] = inventory_item_id
 
-    # Save equipment
-    character_data['equipment'] = equipment
-    save_entity('character', character_id, character_data)
+def with_definition(item):
+    """Copy an item with its full definition embedded"""
+    return {**item, 'definition': get_item_definition(item['item_code'])}
 
-    return True
 
+def get_inventory(character_id, expand=False):
+    """Get a character's inventory.
 
-def unequip_item(character_id, slot):
-    """Unequip an item from a character"""
-    # Get character data
-    character_data = get_entity('character', character_id)
-    if not character_data:
-        return False
+    Items reference their definition by item_code, clients resolve them from
+    the item catalog. With expand, every item embeds its full definition.
+    """
+    packed_items = database.redis_connection.hgetall(inventory_key(character_id))
+    inventory = unpack_inventory(packed_items)
+    if not expand:
+        return inventory
 
-    # Load equipment
-    equipment = character_data.get('equipment', {})
+    # Expand items with their definitions
+    return [with_definition(item) for item in inventory]
 
-    # Check if slot is filled
-    if slot not in equipment:
-        return False
 
-    # Unequip item
-    equipment.pop(slot)
+def equip_item(character_id, inventory_item_id):
+    """Equip an item to a character"""
+    return InventoryTransaction(character_id).equip(inventory_item_id).commit()
 
-    # Save equipment
-    character_data['equipment'] = equipment
-    save_entity('character', character_id, character_data)
 
-    return True
+def unequip_item(character_id, slot):
+    """Unequip an item from a character"""
+    return InventoryTransaction(character_id).unequip(slot).commit()
 
 
 def use_item(character_id, inventory_item_id):
     """Use a consumable item"""
-    # Get character data
-    character_data = get_entity('character', character_id)
-    if not character_data:
-        return False
-
-    # Load inventory
-    inventory = character_data.get('inventory', [])
-
     # Find item
-    item_to_use = None
-    for item in inventory:
-        if item['id'] == inventory_item_id:
-            item_to_use = item
-            break
-
+    item_to_use = get_inventory_item(character_id, inventory_item_id)
     if not item_to_use:
         return False
 
     # Get item definition
-    item_def = get_item_definition(item_to_use['item_code'])
+    item_def = get_item(item_to_use['item_code'])
     if not item_def:
         return False
 
     # Check if item is consumable
-    if item_def['type'] != 'consumable':
+    if item_def.type != 'consumable':
         return False
 
+    # Remove one item from stack
+    transaction = InventoryTransaction(character_id).remove_item(item_to_use['id'], 1)
+
     # Apply item effects
-    if 'use_effect' in item_def:
-        effect = item_def['use_effect']
+    if item_def.use_effect:
+        effect = item_def.use_effect
 
         # Health restoration
         if 'health' in effect:
-            current_health = character_data.get('health', 0)
-            max_health = character_data.get('max_health', 100)
-            new_health = min(current_health + effect['health'], max_health)
-            character_data['health'] = new_health
+            transaction.adjust_stat('health', effect['health'], 'max_health')
 
         # Temporary stat boosts
         if 'temporary_boost' in effect:
-            from models.character import add_effect_to_character
-            add_effect_to_character(
-                character_id,
+            transaction.add_effect(
                 'stat_boost',
                 effect['temporary_boost']['duration'],
                 effect['temporary_boost']['stats']
             )
 
-    # Remove one item from stack
-    remove_item_from_inventory(character_id, inventory_item_id, 1)
-
-    # Save character data
-    save_entity('character', character_id, character_data)
+    return transaction.commit()
 
-    return True
 
-
-def get_equipped_items(character_id):
-    """Get all equipped items with their definitions"""
-    # Get character data
-    character_data = get_entity('character', character_id)
-    if not character_data:
+def get_equipped_items(character_id, expand=False):
+    """Get all equipped items, with their definitions if expand is set"""
+    # Load equipment
+    equipment = get_equipment(character_id)
+    if not equipment:
         return {}
 
-    # Load equipment and inventory
-    equipment = character_data.get('equipment', {})
-    inventory = character_data.get('inventory', [])
-
-    # Create a dictionary to quickly look up inventory items
-    inventory_dict = {item['id']: item for item in inventory}
+    # Fetch only the equipped items
+    slots = list(equipment.keys())
+    packed_items = database.redis_connection.hmget(inventory_key(character_id), [equipment[slot] for slot in slots])
 
     # Build equipped items dictionary
     equipped_items = {}
-    for slot, item_id in equipment.items():
-        if item_id in inventory_dict:
-            inventory_item = inventory_dict[item_id]
+    for slot, packed in zip(slots, packed_items):
+        if packed:
+            inventory_item = unpack_item(equipment[slot], packed)
             item_def = get_item_definition(inventory_item['item_code'])
             if item_def:
-                equipped_items[slot] = {
-                    **inventory_item,
-                    'definition': item_def
-                }
-
-    return equipped_items
\ No newline at end of file
+                equipped_items[slot] = inventory_item
+                if expand:
+                    inventory_item['definition'] = item_def
+
+    return equipped_items
+
+
+def get_equipment_bonuses(character_id):
+    """Get a character's aggregated equipment bonuses.
+
+    The summary is rewritten by every transaction that changes equipment, so
+    reading it costs one hash lookup. Characters without one get it built
+    from their equipped items on first read.
+    """
+    bonuses = database.redis_connection.hgetall(equipment_bonuses_key(character_id))
+    if bonuses:
+        return {field: int(bonuses.get(field, 0)) for field in BONUS_FIELDS}
+
+    equipped_items = get_equipped_items(character_id)
+    bonuses = compute_equipment_bonuses(item['item_code'] for item in equipped_items.values())
+    database.redis_connection.hset(equipment_bonuses_key(character_id), mapping=bonuses)
+
+    return bonuses
+
+
+def migrate_legacy_inventory(character_id, inventory):
+    """Move an inventory embedded in the character hash into its own hash"""
+    pipe = database.redis_connection.pipeline()
+    for item in inventory or []:
+        pipe.hset(inventory_key(character_id), item['id'], pack_item(item))
+        item_def = get_item(item['item_code'])
+        if item_def and is_stackable(item_def, item.get('custom_data')):
+            pipe.hsetnx(stack_index_key(character_id), item['item_code'], item['id'])
+    pipe.hdel(f'character:{character_id}', 'inventory')
+    database.bump_version('inventory', character_id, pipe)
+    pipe.execute()
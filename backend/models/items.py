@@ -0,0 +1,221 @@
+import hashlib
+import json
+from types import MappingProxyType
+
+# Item definitions - in a real game, this would be in a separate database,
+# but for simplicity, we'll define them here
+ITEM_DEFINITIONS = {
+    # Communication
+    "basic_phone": {
+        "name": "Basic Phone",
+        "description": "A simple communication device.",
+        "type": "equipment",
+        "slot": "comm",
+        "value": 50,
+        "effects": {
+            "can_communicate": True
+        },
+        "icon": "phone"
+    },
+    "cyberdeck_basic": {
+        "name": "Basic Cyberdeck",
+        "description": "Entry-level hacking device.",
+        "type": "equipment",
+        "slot": "deck",
+        "value": 500,
+        "effects": {
+            "hacking_bonus": 1
+        },
+        "icon": "laptop-code"
+    },
+    # Weapons
+    "pistol": {
+        "name": "Pistol",
+        "description": "Standard semi-automatic pistol.",
+        "type": "weapon",
+        "slot": "weapon",
+        "value": 200,
+        "damage": 10,
+        "effects": {},
+        "icon": "gun"
+    },
+    "stun_baton": {
+        "name": "Stun Baton",
+        "description": "Non-lethal melee weapon.",
+        "type": "weapon",
+        "slot": "weapon",
+        "value": 150,
+        "damage": 5,
+        "effects": {
+            "stun_chance": 0.25
+        },
+        "icon": "bolt"
+    },
+    # Armor
+    "light_armor": {
+        "name": "Light Armor Jacket",
+        "description": "Provides basic protection.",
+        "type": "armor",
+        "slot": "body",
+        "value": 300,
+        "defense": 5,
+        "effects": {},
+        "icon": "vest"
+    },
+    # Consumables
+    "medkit": {
+        "name": "Medkit",
+        "description": "Heals injuries.",
+        "type": "consumable",
+        "value": 100,
+        "use_effect": {
+            "health": 25
+        },
+        "icon": "medkit"
+    },
+    "stim_pack": {
+        "name": "Stim Pack",
+        "description": "Temporarily boosts capabilities.",
+        "type": "consumable",
+        "value": 75,
+        "use_effect": {
+            "temporary_boost": {
+                "duration": 300,  # 5 minutes in seconds
+                "stats": {
+                    "strength": 2,
+                    "agility": 2
+                }
+            }
+        },
+        "icon": "syringe"
+    },
+    # Currency
+    "credits_chip": {
+        "name": "Credits Chip",
+        "description": "Digital currency storage.",
+        "type": "currency",
+        "value": 0,  # Value is stored in the quantity field
+        "icon": "credit-card"
+    },
+    # Quest/Special Items
+    "access_card": {
+        "name": "Access Card",
+        "description": "Grants access to restricted areas.",
+        "type": "key",
+        "value": 250,
+        "effects": {
+            "access_level": 1
+        },
+        "icon": "id-card"
+    },
+    "data_chip": {
+        "name": "Data Chip",
+        "description": "Contains encrypted data.",
+        "type": "quest",
+        "value": 500,
+        "effects": {},
+        "icon": "microchip"
+    }
+}
+
+# Equipment bonuses aggregated per character. Access level takes the highest
+# value, the others are summed over all equipped items.
+BONUS_FIELDS = ('damage', 'defense', 'hacking_bonus', 'access_level')
+
+
+class ItemDefinition:
+    """Immutable, compiled item definition"""
+
+    __slots__ = ('code', 'item_code', 'name', 'description', 'type', 'slot', 'value',
+                 'damage', 'defense', 'effects', 'use_effect', 'icon', 'stackable',
+                 'bonuses', 'definition')
+
+    def __init__(self, code, item_code, definition):
+        set_field = object.__setattr__
+        set_field(self, 'code', code)
+        set_field(self, 'item_code', item_code)
+        set_field(self, 'name', definition['name'])
+        set_field(self, 'description', definition.get('description', ''))
+        set_field(self, 'type', definition['type'])
+        set_field(self, 'slot', definition.get('slot'))
+        set_field(self, 'value', definition.get('value', 0))
+        set_field(self, 'damage', definition.get('damage', 0))
+        set_field(self, 'defense', definition.get('defense', 0))
+        set_field(self, 'effects', MappingProxyType(dict(definition.get('effects', {}))))
+        set_field(self, 'use_effect', definition.get('use_effect'))
+        set_field(self, 'icon', definition.get('icon'))
+        # Consumables and currency can be stacked
+        set_field(self, 'stackable', definition['type'] in ('consumable', 'currency'))
+        set_field(self, 'bonuses', MappingProxyType({
+            'damage': self.damage,
+            'defense': self.defense,
+            'hacking_bonus': self.effects.get('hacking_bonus', 0),
+            'access_level': self.effects.get('access_level', 0)
+        }))
+        # Source form for API responses, read-only like the other fields
+        set_field(self, 'definition', MappingProxyType(dict(definition)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Item definitions are read-only")
+
+    def __repr__(self):
+        return f"ItemDefinition({self.code}, {self.item_code!r})"
+
+
+class ItemRegistry:
+    """Item definitions compiled once, looked up by item code or integer code"""
+
+    def __init__(self, definitions):
+        # Integer codes follow definition order, so new items go at the end
+        self.items = [
+            ItemDefinition(code, item_code, definition)
+            for code, (item_code, definition) in enumerate(definitions.items(), start=1)
+        ]
+        self.by_item_code = {item.item_code: item for item in self.items}
+        self.by_code = {item.code: item for item in self.items}
+
+        # Client-side catalog, versioned by a hash of its contents
+        self.catalog = {
+            item.item_code: {**item.definition, 'code': item.code}
+            for item in self.items
+        }
+        catalog_json = json.dumps(self.catalog, sort_keys=True, separators=(',', ':'))
+        self.version = hashlib.sha1(catalog_json.encode()).hexdigest()[:16]
+
+    def get(self, item_code):
+        """Get an item by item code"""
+        return self.by_item_code.get(item_code)
+
+    def get_by_code(self, code):
+        """Get an item by integer code"""
+        return self.by_code.get(code)
+
+
+item_registry = ItemRegistry(ITEM_DEFINITIONS)
+
+
+def get_item(item_code):
+    """Get the compiled definition of an item"""
+    return item_registry.by_item_code.get(item_code)
+
+
+def get_item_catalog():
+    """Get the item catalog served to clients and its version"""
+    return item_registry.catalog, item_registry.version
+
+
+def compute_equipment_bonuses(item_codes):
+    """Aggregate the bonuses of a set of equipped items"""
+    bonuses = dict.fromkeys(BONUS_FIELDS, 0)
+    for item_code in item_codes:
+        item = item_registry.by_item_code.get(item_code)
+        if not item:
+            continue
+
+        for field, value in item.bonuses.items():
+            if field == 'access_level':
+                bonuses[field] = max(bonuses[field], value)
+            else:
+                bonuses[field] += value
+
+    return bonuses
@@ -0,0 +1,193 @@
+import random
+
+from models.items import ITEM_DEFINITIONS
+
+# Loot tables keyed by tile type and building type. Each entry has an item
+# code and a relative weight, plus an optional quantity range and, for
+# credits, an amount range.
+LOOT_TABLES = {
+    # Tile types
+    'corporate': [
+        {'item': 'credits_chip', 'weight': 5, 'amount': (20, 80)},
+        {'item': 'medkit', 'weight': 2},
+        {'item': 'access_card', 'weight': 1},
+        {'item': 'data_chip', 'weight': 1}
+    ],
+    'midtown': [
+        {'item': 'credits_chip', 'weight': 4, 'amount': (10, 50)},
+        {'item': 'medkit', 'weight': 3},
+        {'item': 'stim_pack', 'weight': 2},
+        {'item': 'basic_phone', 'weight': 1}
+    ],
+    'slums': [
+        {'item': 'credits_chip', 'weight': 3, 'amount': (5, 25)},
+        {'item': 'stim_pack', 'weight': 3},
+        {'item': 'medkit', 'weight': 2},
+        {'item': 'stun_baton', 'weight': 1}
+    ],
+    # Building types
+    'corp_office': [
+        {'item': 'credits_chip', 'weight': 4, 'amount': (30, 100)},
+        {'item': 'access_card', 'weight': 2},
+        {'item': 'data_chip', 'weight': 2},
+        {'item': 'cyberdeck_basic', 'weight': 1}
+    ],
+    'nightclub': [
+        {'item': 'stim_pack', 'weight': 4, 'quantity': (1, 2)},
+        {'item': 'credits_chip', 'weight': 3, 'amount': (10, 50)}
+    ],
+    'apartment': [
+        {'item': 'credits_chip', 'weight': 3, 'amount': (5, 30)},
+        {'item': 'medkit', 'weight': 2},
+        {'item': 'basic_phone', 'weight': 2}
+    ],
+    'tech_shop': [
+        {'item': 'basic_phone', 'weight': 3},
+        {'item': 'data_chip', 'weight': 2},
+        {'item': 'cyberdeck_basic', 'weight': 1}
+    ],
+    'clinic': [
+        {'item': 'medkit', 'weight': 5, 'quantity': (1, 2)},
+        {'item': 'stim_pack', 'weight': 3}
+    ],
+    'black_market': [
+        {'item': 'stim_pack', 'weight': 3},
+        {'item': 'stun_baton', 'weight': 2},
+        {'item': 'pistol', 'weight': 1},
+        {'item': 'light_armor', 'weight': 1},
+        {'item': 'data_chip', 'weight': 1}
+    ],
+    'bar': [
+        {'item': 'credits_chip', 'weight': 4, 'amount': (5, 30)},
+        {'item': 'stim_pack', 'weight': 2}
+    ],
+    'noodle_shop': [
+        {'item': 'credits_chip', 'weight': 3, 'amount': (5, 20)},
+        {'item': 'medkit', 'weight': 1}
+    ]
+}
+
+# Used for locations without a table of their own
+DEFAULT_LOOT_TABLE = [
+    {'item': 'medkit', 'weight': 1},
+    {'item': 'stim_pack', 'weight': 1},
+    {'item': 'credits_chip', 'weight': 1, 'amount': (10, 50)}
+]
+
+# Shared random generator for loot, seed it for deterministic results
+loot_rng = random.Random()
+
+# Compiled tables keyed like LOOT_TABLES
+COMPILED_LOOT_TABLES = {}
+
+
+class AliasSampler:
+    """Weighted sampler using Vose's alias method, O(1) per draw"""
+
+    def __init__(self, weights):
+        count = len(weights)
+        total = float(sum(weights))
+        if count == 0 or total <= 0:
+            raise ValueError("Sampler needs at least one positive weight")
+
+        self.count = count
+        self.probability = [0.0] * count
+        self.alias = [0] * count
+
+        # Scale weights so the average bucket holds exactly 1
+        scaled = [weight * count / total for weight in weights]
+        small = [i for i, weight in enumerate(scaled) if weight < 1.0]
+        large = [i for i, weight in enumerate(scaled) if weight >= 1.0]
+
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+
+        # Leftovers are full buckets, up to rounding error
+        for i in large + small:
+            self.probability[i] = 1.0
+
+    def sample(self, rng):
+        """Draw an index"""
+        # One random number picks both the bucket and the coin flip
+        position = rng.random() * self.count
+        bucket = int(position)
+        if position - bucket < self.probability[bucket]:
+            return bucket
+        return self.alias[bucket]
+
+
+class LootTable:
+    """Compiled loot table"""
+
+    def __init__(self, entries):
+        for entry in entries:
+            if entry['item'] not in ITEM_DEFINITIONS:
+                raise ValueError(f"Unknown item in loot table: {entry['item']}")
+
+        self.entries = [
+            (
+                entry['item'],
+                entry.get('quantity', (1, 1)),
+                entry.get('amount')
+            )
+            for entry in entries
+        ]
+        self.sampler = AliasSampler([entry['weight'] for entry in entries])
+
+    def roll(self, rng=None):
+        """Roll one drop, returning item_code, quantity and custom_data"""
+        rng = rng or loot_rng
+        item_code, quantity, amount = self.entries[self.sampler.sample(rng)]
+
+        drop = {
+            'item_code': item_code,
+            'quantity': rng.randint(*quantity),
+            'custom_data': None
+        }
+        if amount:
+            drop['custom_data'] = {'amount': rng.randint(*amount)}
+
+        return drop
+
+    def roll_many(self, count, rng=None):
+        """Roll several drops at once"""
+        rng = rng or loot_rng
+        return [self.roll(rng) for _ in range(count)]
+
+
+def compile_loot_tables():
+    """Compile every loot table into a sampler"""
+    from services.game_service import TILE_TYPES, BUILDING_TYPES
+
+    location_types = set(TILE_TYPES) | {building['type'] for building in BUILDING_TYPES}
+    for location_type in LOOT_TABLES:
+        if location_type not in location_types:
+            raise ValueError(f"Loot table for unknown location type: {location_type}")
+
+    COMPILED_LOOT_TABLES.clear()
+    for location_type, entries in LOOT_TABLES.items():
+        COMPILED_LOOT_TABLES[location_type] = LootTable(entries)
+    COMPILED_LOOT_TABLES[None] = LootTable(DEFAULT_LOOT_TABLE)
+
+
+def get_loot_table(location_type):
+    """Get the compiled loot table for a tile or building type"""
+    if not COMPILED_LOOT_TABLES:
+        compile_loot_tables()
+
+    return COMPILED_LOOT_TABLES.get(location_type) or COMPILED_LOOT_TABLES[None]
+
+
+def seed_loot_rng(seed):
+    """Seed the shared loot generator"""
+    loot_rng.seed(seed)
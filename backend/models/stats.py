@@ -0,0 +1,71 @@
+from collections import OrderedDict
+
+from config import Config
+from models.character import active_effects, effect_expires_at
+from models.inventory import get_equipment_bonuses
+
+# Effective stats per character ID, stored as (cache key, snapshot) and
+# evicted least recently used first
+_snapshots = OrderedDict()
+
+# Snapshot cache counters
+snapshot_hits = 0
+snapshot_misses = 0
+
+
+def next_effect_expiry(effects):
+    """Get the earliest expiry timestamp of a list of effects"""
+    return min((effect_expires_at(effect) for effect in effects), default=None)
+
+
+def compute_effective_stats(base_stats, effects, bonuses):
+    """Fold base stats, stat boost effects and equipment bonuses together"""
+    stats = dict(base_stats)
+    for effect in effects:
+        if effect['type'] == 'stat_boost':
+            for stat, boost in effect['data'].items():
+                stats[stat] = stats.get(stat, 0) + boost
+
+    return {
+        'stats': stats,
+        'bonuses': dict(bonuses)
+    }
+
+
+def get_effective_stats(character):
+    """Get a character's effective stats snapshot.
+
+    Snapshots are keyed by the character version, which changes with stats,
+    effects and equipment, and by the next effect expiry, which changes when
+    an effect runs out. Anything else reuses the cached snapshot, so only a
+    miss costs the equipment bonus lookup. Snapshots are shared and must not
+    be modified.
+    """
+    global snapshot_hits, snapshot_misses
+
+    effects = active_effects(character.effects)
+    key = (character.version, next_effect_expiry(effects))
+
+    cached = _snapshots.get(character.id)
+    if cached and cached[0] == key:
+        _snapshots.move_to_end(character.id)
+        snapshot_hits += 1
+        return cached[1]
+
+    snapshot_misses += 1
+    snapshot = compute_effective_stats(character.stats, effects, get_equipment_bonuses(character.id))
+
+    _snapshots[character.id] = (key, snapshot)
+    _snapshots.move_to_end(character.id)
+    if len(_snapshots) > Config.STATS_CACHE_SIZE:
+        _snapshots.popitem(last=False)
+
+    return snapshot
+
+
+def clear_stats_cache():
+    """Drop all cached snapshots"""
+    global snapshot_hits, snapshot_misses
+    _snapshots.clear()
+    snapshot_hits = 0
+    snapshot_misses = 0
@@ -1,21 +1,27 @@
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 import json
 
+import database
 from database import (
     get_next_id,
     save_entity,
     get_entity,
-    redis_connection,
     add_to_set,
     is_member_of_set
 )
+from models.base import Model
 from models.character import create_character
+from services.auth_service import hash_password, verify_password
 
 
-class User:
+class User(Model):
     """User account model"""
 
+    __slots__ = ('id', 'username', 'email', 'password_hash', 'is_active', 'is_admin',
+                 'last_login', 'created_at')
+
+    PRIVATE_FIELDS = ('password_hash',)
+
     def __init__(self, id=None, username=None, email=None, password_hash=None,
                  is_active=True, is_admin=False, last_login=None, created_at=None):
         self.id = id
@@ -43,17 +49,17 @@ class User:
             id=user_id,
             username=username,
             email=email,
-            password_hash=generate_password_hash(password)
+            password_hash=hash_password(password)
         )
 
         # Save user to Redis
-        save_entity('user', user_id, user.__dict__)
+        save_entity('user', user_id, user.to_hash())
 
         # Add username to set of usernames (case-insensitive)
         add_to_set('usernames', username.lower())
 
         # Link username to user ID
-        redis_connection.set(f'username:{username.lower()}', user_id)
+        database.redis_connection.set(f'username:{username.lower()}', user_id)
 
         # Create character for user
         character_name = character_name or username
@@ -68,12 +74,12 @@ class User:
         if not data:
             return None
 
-        return User(**data)
+        return User.from_hash(data)
 
     @staticmethod
     def get_by_username(username):
         """Get a user by username"""
-        user_id = redis_connection.get(f'username:{username.lower()}')
+        user_id = database.redis_connection.get(f'username:{username.lower()}')
         if not user_id:
             return None
 
@@ -86,31 +92,19 @@ class User:
         if not user or not user.is_active:
             return None
 
-        if not check_password_hash(user.password_hash, password):
+        if not verify_password(user.password_hash, password):
             return None
 
         # Update last login time
         user.last_login = datetime.now().isoformat()
-        save_entity('user', user.id, user.__dict__)
+        save_entity('user', user.id, user.to_hash())
 
         return user
 
     def update_password(self, new_password):
         """Update the user's password"""
-        self.password_hash = generate_password_hash(new_password)
-        save_entity('user', self.id, self.__dict__)
-
-    def to_dict(self):
-        """Convert user to dictionary"""
-        return {
-            'id': self.id,
-            'username': self.username,
-            'email': self.email,
-            'is_active': self.is_active,
-            'is_admin': self.is_admin,
-            'last_login': self.last_login,
-            'created_at': self.created_at
-        }
+        self.password_hash = hash_password(new_password)
+        save_entity('user', self.id, self.to_hash())
 
 
 # Create initial test user if needed
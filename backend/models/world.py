@@ -5,11 +5,14 @@ import random
 
 import database
 from config import Config
+from models.base import Model
 
 
-class WorldTile:
+class WorldTile(Model):
     """Model for a tile in the game world"""
 
+    __slots__ = ('x', 'y', 'name', 'description', 'tile_type', 'buildings', 'objects', 'npcs', 'flags')
+
     def __init__(self, x, y, name=None, description=None, tile_type='street',
                  buildings=None, objects=None, npcs=None, flags=None):
         self.x = x
@@ -22,24 +25,13 @@ class WorldTile:
         self.npcs = npcs or []
         self.flags = flags or {}
 
-    def to_dict(self):
-        """Convert to dictionary"""
-        return {
-            'x': self.x,
-            'y': self.y,
-            'name': self.name,
-            'description': self.description,
-            'tile_type': self.tile_type,
-            'buildings': self.buildings,
-            'objects': self.objects,
-            'npcs': self.npcs,
-            'flags': self.flags
-        }
-
-
-class Building:
+
+class Building(Model):
     """Model for a building in the game world"""
 
+    __slots__ = ('id', 'x', 'y', 'name', 'description', 'building_type', 'interior_description',
+                 'objects', 'npcs', 'flags', 'access_requirements')
+
     def __init__(self, id=None, x=None, y=None, name=None, description=None,
                  building_type=None, interior_description=None, objects=None,
                  npcs=None, flags=None, access_requirements=None):
@@ -55,26 +47,12 @@ class Building:
         self.flags = flags or {}
         self.access_requirements = access_requirements or {}
 
-    def to_dict(self):
-        """Convert to dictionary"""
-        return {
-            'id': self.id,
-            'x': self.x,
-            'y': self.y,
-            'name': self.name,
-            'description': self.description,
-            'building_type': self.building_type,
-            'interior_description': self.interior_description,
-            'objects': self.objects,
-            'npcs': self.npcs,
-            'flags': self.flags,
-            'access_requirements': self.access_requirements
-        }
-
-
-class WorldObject:
+
+class WorldObject(Model):
     """Model for an interactive object in the game world"""
 
+    __slots__ = ('id', 'name', 'description', 'object_type', 'interaction_data', 'flags')
+
     def __init__(self, id=None, name=None, description=None, object_type=None,
                  interaction_data=None, flags=None):
         self.id = id or str(uuid.uuid4())
@@ -84,16 +62,24 @@ class WorldObject:
         self.interaction_data = interaction_data or {}
         self.flags = flags or {}
 
-    def to_dict(self):
-        """Convert to dictionary"""
-        return {
-            'id': self.id,
-            'name': self.name,
-            'description': self.description,
-            'object_type': self.object_type,
-            'interaction_data': self.interaction_data,
-            'flags': self.flags
-        }
+
+# Model class of each world entity type
+ENTITY_MODELS = {
+    'tile': WorldTile,
+    'building': Building,
+    'object': WorldObject
+}
+
+
+def bump_world_version(entity_type, entity_id, client=None):
+    """Bump a world entity's version and the version of the world as a whole"""
+    database.bump_version(entity_type, entity_id, client)
+    database.bump_version('world', 'all', client)
+
+
+def get_world_version():
+    """Get the version of the world as a whole"""
+    return database.get_versions([('world', 'all')])[0]
 
 
 def create_tile(x, y, data):
@@ -107,7 +93,10 @@ def create_tile(x, y, data):
 
     # Save tile to Redis
     key = f"tile:{x}:{y}"
-    database.redis_connection.hmset(key, database.dict_to_redis_hash(tile.to_dict()))
+    pipe = database.redis_connection.pipeline()
+    pipe.hmset(key, database.dict_to_redis_hash(tile.to_hash()))
+    bump_world_version('tile', f"{x}:{y}", pipe)
+    pipe.execute()
 
     # Add to world tiles set
     database.add_to_set('world:tiles', f"{x}:{y}")
@@ -126,7 +115,7 @@ def get_tile(x, y):
     # Convert from Redis hash
     tile_data = database.redis_hash_to_dict(data)
 
-    return WorldTile(**tile_data)
+    return WorldTile.from_hash(tile_data)
 
 
 def create_building(x, y, data):
@@ -144,7 +133,10 @@ def create_building(x, y, data):
 
     # Save building to Redis
     key = f"building:{building_id}"
-    database.redis_connection.hmset(key, database.dict_to_redis_hash(building.to_dict()))
+    pipe = database.redis_connection.pipeline()
+    pipe.hmset(key, database.dict_to_redis_hash(building.to_hash()))
+    bump_world_version('building', building_id, pipe)
+    pipe.execute()
 
     # Add building ID to tile's buildings list
     tile = get_tile(x, y)
@@ -170,7 +162,7 @@ def get_building(building_id):
     # Convert from Redis hash
     building_data = database.redis_hash_to_dict(data)
 
-    return Building(**building_data)
+    return Building.from_hash(building_data)
 
 
 def create_object(data):
@@ -188,7 +180,10 @@ def create_object(data):
 
     # Save object to Redis
     key = f"object:{object_id}"
-    database.redis_connection.hmset(key, database.dict_to_redis_hash(world_object.to_dict()))
+    pipe = database.redis_connection.pipeline()
+    pipe.hmset(key, database.dict_to_redis_hash(world_object.to_hash()))
+    bump_world_version('object', object_id, pipe)
+    pipe.execute()
 
     # Add to objects set
     database.add_to_set('world:objects', object_id)
@@ -207,7 +202,7 @@ def get_object(object_id):
     # Convert from Redis hash
     object_data = database.redis_hash_to_dict(data)
 
-    return WorldObject(**object_data)
+    return WorldObject.from_hash(object_data)
 
 
 def add_object_to_tile(x, y, object_id):
@@ -231,67 +226,155 @@ def add_object_to_building(building_id, object_id):
 
     if object_id not in building.objects:
         building.objects.append(object_id)
-        database.redis_connection.hmset(
+        pipe = database.redis_connection.pipeline()
+        pipe.hmset(
             f"building:{building_id}",
             database.dict_to_redis_hash({'objects': building.objects})
         )
+        bump_world_version('building', building_id, pipe)
+        pipe.execute()
 
     return True
 
 
-def get_tile_with_contents(x, y):
-    """Get a tile with all its objects and buildings expanded"""
-    tile = get_tile(x, y)
+def get_entities(refs):
+    """Get several world entities in one round-trip.
+
+    refs are (entity_type, entity_id) pairs, where entity_type is 'tile',
+    'building' or 'object' and tile IDs are 'x:y'. Returns a dict of the
+    entities found, keyed by ref.
+    """
+    refs = list(dict.fromkeys(refs))
+    if not refs:
+        return {}
+
+    pipe = database.redis_connection.pipeline(transaction=False)
+    for entity_type, entity_id in refs:
+        pipe.hgetall(f"{entity_type}:{entity_id}")
+
+    entities = {}
+    for ref, data in zip(refs, pipe.execute()):
+        if data:
+            entities[ref] = ENTITY_MODELS[ref[0]].from_hash(database.redis_hash_to_dict(data))
+
+    return entities
+
+
+def get_location_ref(x, y, inside_building=False, building_id=None):
+    """Ref of the building or tile at a position"""
+    return ('building', building_id) if inside_building else ('tile', f"{x}:{y}")
+
+
+def get_location_entities(x, y, inside_building=False, building_id=None, loaded=None):
+    """Load a location with the buildings and objects it contains.
+
+    The location is the building when inside_building is set and the tile
+    otherwise. Entities already in loaded (as returned by get_entities) are
+    not fetched again. Returns a dict with tile, building, buildings and
+    objects, the last two keyed by ID, in at most two round-trips.
+    """
+    location_ref = get_location_ref(x, y, inside_building, building_id)
+    loaded = loaded or {}
+    if location_ref not in loaded:
+        loaded = {**loaded, **get_entities([location_ref])}
+
+    location = {
+        'tile': None,
+        'building': None,
+        'buildings': {},
+        'objects': {}
+    }
+
+    container = loaded.get(location_ref)
+    if not container:
+        return location
+
+    # Fetch the contents of the location
+    content_refs = [('object', object_id) for object_id in container.objects]
+    if inside_building:
+        location['building'] = container
+    else:
+        location['tile'] = container
+        content_refs += [('building', child_id) for child_id in container.buildings]
+
+    for (entity_type, entity_id), entity in get_entities(content_refs).items():
+        location['objects' if entity_type == 'object' else 'buildings'][entity_id] = entity
+
+    return location
+
+
+def build_location_payload(x, y, location):
+    """Build the expanded location data sent to clients"""
+    if location['building']:
+        building = location['building']
+        result = building.to_dict()
+        result['objects'] = [
+            location['objects'][object_id].to_dict()
+            for object_id in building.objects if object_id in location['objects']
+        ]
+        result['x'] = x
+        result['y'] = y
+        result['inside_building'] = True
+        return result
+
+    tile = location['tile']
     if not tile:
         return None
 
-    # Create result dictionary
     result = tile.to_dict()
+    result['buildings'] = [
+        location['buildings'][building_id].to_dict()
+        for building_id in tile.buildings if building_id in location['buildings']
+    ]
+    result['objects'] = [
+        location['objects'][object_id].to_dict()
+        for object_id in tile.objects if object_id in location['objects']
+    ]
+    result['inside_building'] = False
+    return result
 
-    # Expand buildings
-    expanded_buildings = []
-    for building_id in tile.buildings:
-        building = get_building(building_id)
-        if building:
-            expanded_buildings.append(building.to_dict())
-
-    result['buildings'] = expanded_buildings
-
-    # Expand objects
-    expanded_objects = []
-    for object_id in tile.objects:
-        obj = get_object(object_id)
-        if obj:
-            expanded_objects.append(obj.to_dict())
 
-    result['objects'] = expanded_objects
+def get_tile_with_contents(x, y):
+    """Get a tile with all its objects and buildings expanded"""
+    location = get_location_entities(x, y)
+    result = build_location_payload(x, y, location)
+    if result:
+        del result['inside_building']
 
     return result
 
 
 def get_building_with_contents(building_id):
     """Get a building with all its objects expanded"""
-    building = get_building(building_id)
-    if not building:
+    location = get_location_entities(None, None, True, building_id)
+    if not location['building']:
         return None
 
-    # Create result dictionary
-    result = building.to_dict()
+    building = location['building']
+    result = build_location_payload(building.x, building.y, location)
+    del result['inside_building']
+
+    return result
 
-    # Expand objects
-    expanded_objects = []
-    for object_id in building.objects:
-        obj = get_object(object_id)
-        if obj:
-            expanded_objects.append(obj.to_dict())
 
-    result['objects'] = expanded_objects
+def map_slice_refs(center_x, center_y, radius=1):
+    """Tile refs covered by a map slice"""
+    return [
+        ('tile', f"{x}:{y}")
+        for y in range(center_y - radius, center_y + radius + 1)
+        for x in range(center_x - radius, center_x + radius + 1)
+        if 0 <= x < Config.WORLD_SIZE_X and 0 <= y < Config.WORLD_SIZE_Y
+    ]
 
-    return result
 
+def get_map_slice(center_x, center_y, radius=1, loaded=None):
+    """Get a slice of the map centered on coordinates with radius.
+
+    Tiles are fetched in one round-trip, or taken from loaded if given.
+    """
+    if loaded is None:
+        loaded = get_entities(map_slice_refs(center_x, center_y, radius))
 
-def get_map_slice(center_x, center_y, radius=1):
-    """Get a slice of the map centered on coordinates with radius"""
     result = []
 
     for y in range(center_y - radius, center_y + radius + 1):
@@ -299,7 +382,7 @@ def get_map_slice(center_x, center_y, radius=1):
         for x in range(center_x - radius, center_x + radius + 1):
             # Ensure coordinates are within world boundaries
             if (0 <= x < Config.WORLD_SIZE_X and 0 <= y < Config.WORLD_SIZE_Y):
-                tile = get_tile(x, y)
+                tile = loaded.get(('tile', f"{x}:{y}"))
                 if tile:
                     row.append({
                         'x': x,
@@ -1,5 +1,7 @@
 from routes.auth import auth_bp, init_auth
 from routes.game import game_bp
+from routes.metrics import metrics_bp
+from routes.debug import debug_bp
 
 
 def register_blueprints(app):
@@ -12,6 +14,14 @@ def register_blueprints(app):
     app.register_blueprint(game_bp)
     print("Registered game routes")
 
+    # Register metrics blueprint
+    app.register_blueprint(metrics_bp)
+    print("Registered metrics routes")
+
+    # Register debug blueprint
+    app.register_blueprint(debug_bp)
+    print("Registered debug routes")
+
     # Initialize authentication system
     init_auth()
 
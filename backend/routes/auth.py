@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify, session, redirect, url_for
 from functools import wraps
-import time
 from models.user import User, create_test_user
+from services.rate_limiter import rate_limit
+from services.auth_service import PasswordHashBusy
+from services.session_context import get_session_user, remember_user
 
 # Create blueprint
 auth_bp = Blueprint('auth', __name__)
@@ -22,40 +24,42 @@ def login_required(f):
     return decorated_function
 
 
-# Rate limiter for authentication routes
-def rate_limiter(f):
-    """Basic rate limiter to prevent abuse."""
+def admin_required(f):
+    """Decorator to ensure the logged in user is an admin."""
 
     @wraps(f)
+    @login_required
     def decorated_function(*args, **kwargs):
-        req_key = f"{request.remote_addr}:{request.path}"
-        current_time = time.time()
-
-        # This would normally be stored in Redis/Memcached in a production system
-        if hasattr(rate_limiter, 'cache'):
-            last_request_time = rate_limiter.cache.get(req_key, 0)
-            if current_time - last_request_time < 1:  # 1 second limit
-                return jsonify({'success': False, 'message': 'Rate limit exceeded'}), 429
-        else:
-            rate_limiter.cache = {}
-
-        rate_limiter.cache[req_key] = current_time
+        # Checked against the stored user, so revoking admin takes effect at once
+        user = User.get_by_id(session['user_id'])
+        if not user or not user.is_admin:
+            return jsonify({'success': False, 'message': 'Admin access required'}), 403
         return f(*args, **kwargs)
 
     return decorated_function
 
 
+def load_user_dict(user_id):
+    """Load a user's public data"""
+    user = User.get_by_id(user_id)
+    return user.to_dict() if user else None
+
+
+# Rate limiter for authentication routes, per address and route
+rate_limiter = rate_limit('auth', key=lambda: f"{request.remote_addr}:{request.path}")
+
+
 @auth_bp.route('/api/auth/status')
 def auth_status():
     """Check authentication status"""
     if 'user_id' in session:
-        user_id = session['user_id']
-        user = User.get_by_id(user_id)
+        # Cached in process after the first lookup
+        user = get_session_user(load_user_dict)
 
         if user:
             return jsonify({
                 'authenticated': True,
-                'user': user.to_dict()
+                'user': user
             })
 
     return jsonify({
@@ -81,7 +85,13 @@ def login():
     password = data['password']
 
     # Authenticate user
-    user = User.authenticate(username, password)
+    try:
+        user = User.authenticate(username, password)
+    except PasswordHashBusy as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 503
 
     if not user:
         return jsonify({
@@ -90,13 +100,17 @@ def login():
         }), 401
 
     # Set session
+    session.clear()
     session.permanent = True
     session['user_id'] = user.id
 
+    user_data = user.to_dict()
+    remember_user(user_data)
+
     return jsonify({
         'success': True,
         'message': 'Login successful',
-        'user': user.to_dict()
+        'user': user_data
     })
 
 
@@ -138,6 +152,7 @@ def signup():
         user_id = User.create(username, password, email, character_name)
 
         # Set session
+        session.clear()
         session.permanent = True
         session['user_id'] = user_id
 
@@ -153,6 +168,12 @@ def signup():
             'message': str(e)
         }), 400
 
+    except PasswordHashBusy as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 503
+
     except Exception as e:
         return jsonify({
             'success': False,
@@ -176,10 +197,8 @@ def logout():
 @login_required
 def me():
     """Get current user info"""
-    user_id = session.get('user_id')
-
-    # Get user
-    user = User.get_by_id(user_id)
+    # Get user, cached in process after the first lookup
+    user = get_session_user(load_user_dict)
 
     if not user:
         session.clear()
@@ -190,7 +209,7 @@ def me():
 
     return jsonify({
         'success': True,
-        'user': user.to_dict()
+        'user': user
     })
 
 
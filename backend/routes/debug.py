@@ -0,0 +1,82 @@
+from flask import Blueprint, request, jsonify, send_from_directory
+
+from config import Config
+from routes.auth import admin_required
+from services.redis_stats import get_redis_stats
+from services.profiler import settings, update_settings, list_captures, get_capture
+
+# Create blueprint
+debug_bp = Blueprint('debug', __name__)
+
+
+@debug_bp.route('/api/game/debug/redis')
+@admin_required
+def get_redis_usage():
+    """Get the Redis commands made per endpoint"""
+    return jsonify({
+        'success': True,
+        'redis': get_redis_stats()
+    })
+
+
+@debug_bp.route('/api/game/debug/profiles')
+@admin_required
+def get_profiles():
+    """List the saved profiles, newest first"""
+    return jsonify({
+        'success': True,
+        'profiling': settings,
+        'profiles': list_captures()
+    })
+
+
+@debug_bp.route('/api/game/debug/profiles/<name>')
+@admin_required
+def get_profile(name):
+    """Get a profile summary, or the pstats file with ?format=prof"""
+    capture = get_capture(name)
+
+    if not capture:
+        return jsonify({
+            'success': False,
+            'message': 'Profile not found'
+        }), 404
+
+    if request.args.get('format') == 'prof':
+        if not capture['profile']:
+            return jsonify({
+                'success': False,
+                'message': 'Only the timing of this request was captured'
+            }), 404
+        return send_from_directory(Config.PROFILING_DIR, capture['profile'], as_attachment=True)
+
+    return jsonify({
+        'success': True,
+        'profile': capture
+    })
+
+
+@debug_bp.route('/api/game/debug/profiling', methods=['POST'])
+@admin_required
+def set_profiling():
+    """Change the profiling settings of this process"""
+    data = request.get_json(silent=True)
+
+    if not isinstance(data, dict):
+        return jsonify({
+            'success': False,
+            'message': 'No settings provided'
+        }), 400
+
+    try:
+        profiling = update_settings(data)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+
+    return jsonify({
+        'success': True,
+        'profiling': profiling
+    })
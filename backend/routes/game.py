@@ -1,22 +1,60 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, make_response
 from routes.auth import login_required
-from models.character import get_character_by_user_id
-from models.inventory import get_inventory, get_equipped_items
+from services.rate_limiter import rate_limit
+from services.session_context import get_session_context
+from services.redis_stats import describe_request
+from services.game_state import get_game_state, parse_state_fields
+from models.inventory import get_inventory, get_equipped_items, get_equipment_bonuses
+from models.items import get_item_catalog
+from models.stats import get_effective_stats
 from models.world import get_map_slice, get_tile_with_contents, get_building_with_contents
-from models.actions import get_available_actions, process_action, get_action_logs
+from models.actions import ACTION_TYPES, get_available_actions, process_action, get_action_logs
+from database import get_versions
+from services.action_queue import enqueue_actions, enqueue_path, enqueue_travel, get_queue, clear_queue
 
 # Create blueprint
 game_bp = Blueprint('game', __name__)
 
 
+def expand_requested():
+    """Check if the client asked for items with embedded definitions"""
+    return request.args.get('expand', '').lower() in ('1', 'true', 'yes')
+
+
+def make_etag(*parts):
+    """Build an ETag from version counters and request options"""
+    return '-'.join(str(part) for part in parts)
+
+
+def etag_matches(etag):
+    """Check If-None-Match against an ETag built by make_etag"""
+    return request.if_none_match.contains_weak(etag)
+
+
+def not_modified(etag):
+    """Empty 304 response for a matching If-None-Match"""
+    response = make_response('', 304)
+    return with_etag(response, etag)
+
+
+def with_etag(response, etag):
+    """Tag a response so clients revalidate it on every poll.
+
+    The tag is weak: it names the data, and compression may send that data
+    as different bytes.
+    """
+    response.set_etag(etag, weak=True)
+    response.cache_control.no_cache = True
+    return response
+
+
 @game_bp.route('/api/game/character')
 @login_required
 def get_character():
     """Get the current character's information"""
-    user_id = session.get('user_id')
-
     # Get character
-    character = get_character_by_user_id(user_id)
+    context = get_session_context()
+    character = context.get_character()
 
     if not character:
         return jsonify({
@@ -24,12 +62,50 @@ def get_character():
             'message': 'Character not found'
         }), 404
 
-    # Return character data as dictionary
-    character_dict = character.__dict__
+    return jsonify({
+        'success': True,
+        'character': character.to_dict(),
+        'effective_stats': get_effective_stats(character)
+    })
+
+
+@game_bp.route('/api/game/state')
+@login_required
+def get_state():
+    """Get the character, inventory, equipment, map, location, actions and logs at once"""
+    # Resolve the character ID, the state loads the character itself
+    context = get_session_context()
+
+    if not context.character_id:
+        return jsonify({
+            'success': False,
+            'message': 'Character not found'
+        }), 404
+
+    # Parse the field selector
+    try:
+        fields = parse_state_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+
+    # Validate radius and log limit like the individual endpoints
+    radius = max(1, min(request.args.get('radius', 1, type=int), 5))
+    log_limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+
+    state = get_game_state(context.character_id, fields, radius, log_limit, expand_requested())
+
+    if state is None:
+        return jsonify({
+            'success': False,
+            'message': 'Character not found'
+        }), 404
 
     return jsonify({
         'success': True,
-        'character': character_dict
+        **state
     })
 
 
@@ -37,60 +113,88 @@ def get_character():
 @login_required
 def get_character_inventory():
     """Get the current character's inventory"""
-    user_id = session.get('user_id')
-
-    # Get character
-    character = get_character_by_user_id(user_id)
+    # Resolve the character ID without loading the character
+    context = get_session_context()
 
-    if not character:
+    if not context.character_id:
         return jsonify({
             'success': False,
             'message': 'Character not found'
         }), 404
 
+    # Answer polls from the version counter before loading anything
+    expand = expand_requested()
+    catalog_version = get_item_catalog()[1]
+    etag = make_etag('inventory', *get_versions([('inventory', context.character_id)]), catalog_version, int(expand))
+    if etag_matches(etag):
+        return not_modified(etag)
+
     # Get inventory
-    inventory = get_inventory(character.id)
+    inventory = get_inventory(context.character_id, expand=expand)
 
-    return jsonify({
+    return with_etag(jsonify({
         'success': True,
-        'inventory': inventory
-    })
+        'inventory': inventory,
+        'catalog_version': catalog_version
+    }), etag)
 
 
 @game_bp.route('/api/game/equipment')
 @login_required
 def get_character_equipment():
     """Get the current character's equipped items"""
-    user_id = session.get('user_id')
+    # Resolve the character ID without loading the character
+    context = get_session_context()
 
-    # Get character
-    character = get_character_by_user_id(user_id)
-
-    if not character:
+    if not context.character_id:
         return jsonify({
             'success': False,
             'message': 'Character not found'
         }), 404
 
+    # Equipment only changes in inventory transactions, which bump the
+    # inventory version
+    expand = expand_requested()
+    catalog_version = get_item_catalog()[1]
+    etag = make_etag('equipment', *get_versions([('inventory', context.character_id)]), catalog_version, int(expand))
+    if etag_matches(etag):
+        return not_modified(etag)
+
     # Get equipped items
-    equipment = get_equipped_items(character.id)
+    equipment = get_equipped_items(context.character_id, expand=expand)
 
-    return jsonify({
+    return with_etag(jsonify({
         'success': True,
-        'equipment': equipment
-    })
+        'equipment': equipment,
+        'bonuses': get_equipment_bonuses(context.character_id),
+        'catalog_version': catalog_version
+    }), etag)
+
+
+@game_bp.route('/api/game/items')
+@login_required
+def get_items():
+    """Get the item catalog, revalidated by ETag"""
+    catalog, version = get_item_catalog()
+
+    # The catalog only changes with a deploy
+    if etag_matches(version):
+        return not_modified(version)
+
+    return with_etag(jsonify({
+        'success': True,
+        'version': version,
+        'items': catalog
+    }), version)
 
 
 @game_bp.route('/api/game/map')
 @login_required
 def get_map():
     """Get the map around the character"""
-    user_id = session.get('user_id')
+    context = get_session_context()
 
-    # Get character
-    character = get_character_by_user_id(user_id)
-
-    if not character:
+    if not context.character_id:
         return jsonify({
             'success': False,
             'message': 'Character not found'
@@ -102,10 +206,24 @@ def get_map():
     # Validate radius
     radius = max(1, min(radius, 5))  # Between 1 and 5
 
+    # The map only changes when the character moves or the world changes
+    etag = make_etag('map', *get_versions([('character', context.character_id), ('world', 'all')]), radius)
+    if etag_matches(etag):
+        return not_modified(etag)
+
+    # Get character
+    character = context.get_character()
+
+    if not character:
+        return jsonify({
+            'success': False,
+            'message': 'Character not found'
+        }), 404
+
     # Get map slice
     map_slice = get_map_slice(character.x, character.y, radius)
 
-    return jsonify({
+    return with_etag(jsonify({
         'success': True,
         'map': map_slice,
         'character_position': {
@@ -113,17 +231,28 @@ def get_map():
             'y': character.y,
             'inside_building': character.inside_building
         }
-    })
+    }), etag)
 
 
 @game_bp.route('/api/game/location')
 @login_required
 def get_location():
     """Get the current character's location"""
-    user_id = session.get('user_id')
+    context = get_session_context()
+
+    if not context.character_id:
+        return jsonify({
+            'success': False,
+            'message': 'Character not found'
+        }), 404
+
+    # The location only changes when the character moves or the world changes
+    etag = make_etag('location', *get_versions([('character', context.character_id), ('world', 'all')]))
+    if etag_matches(etag):
+        return not_modified(etag)
 
     # Get character
-    character = get_character_by_user_id(user_id)
+    character = context.get_character()
 
     if not character:
         return jsonify({
@@ -158,29 +287,27 @@ def get_location():
 
         location['inside_building'] = False
 
-    return jsonify({
+    return with_etag(jsonify({
         'success': True,
         'location': location
-    })
+    }), etag)
 
 
 @game_bp.route('/api/game/actions')
 @login_required
 def get_actions():
     """Get available actions for the current character"""
-    user_id = session.get('user_id')
-
-    # Get character
-    character = get_character_by_user_id(user_id)
+    # Resolve the character ID without loading the character
+    context = get_session_context()
 
-    if not character:
+    if not context.character_id:
         return jsonify({
             'success': False,
             'message': 'Character not found'
         }), 404
 
     # Get available actions
-    actions = get_available_actions(character.id)
+    actions = get_available_actions(context.character_id)
 
     return jsonify({
         'success': True,
@@ -190,14 +317,13 @@ def get_actions():
 
 @game_bp.route('/api/game/action', methods=['POST'])
 @login_required
+@rate_limit('action')
 def perform_action():
     """Perform an action with the current character"""
-    user_id = session.get('user_id')
+    # Resolve the character ID, the character is loaded after the action
+    context = get_session_context()
 
-    # Get character
-    character = get_character_by_user_id(user_id)
-
-    if not character:
+    if not context.character_id:
         return jsonify({
             'success': False,
             'message': 'Character not found'
@@ -215,34 +341,97 @@ def perform_action():
     action_type = data['action_type']
     action_data = data.get('action_data', {})
 
+    # Account Redis usage per action type
+    if action_type in ACTION_TYPES:
+        describe_request(action_type)
+
     # Process action
-    result = process_action(character.id, action_type, action_data)
+    result = process_action(context.character_id, action_type, action_data)
 
     # If action was successful, get updated character and actions
     if result['success']:
         # Get updated character
-        updated_character = get_character_by_user_id(user_id)
-        result['character'] = updated_character.__dict__
+        updated_character = context.get_character()
+        result['character'] = updated_character.to_dict()
 
         # Get updated actions
-        updated_actions = get_available_actions(character.id)
+        updated_actions = get_available_actions(context.character_id)
         result['available_actions'] = updated_actions
 
         # Get recent logs
-        logs = get_action_logs(character.id, 10)
+        logs = get_action_logs(context.character_id, 10)
         result['logs'] = logs
 
     return jsonify(result)
 
 
-@game_bp.route('/api/game/logs')
+@game_bp.route('/api/game/queue')
 @login_required
-def get_logs():
-    """Get action logs for the current character"""
-    user_id = session.get('user_id')
+def get_action_queue():
+    """Get the current character's pending actions"""
+    # Resolve the character ID without loading the character
+    context = get_session_context()
+
+    if not context.character_id:
+        return jsonify({
+            'success': False,
+            'message': 'Character not found'
+        }), 404
+
+    return jsonify({
+        'success': True,
+        'queue': get_queue(context.character_id)
+    })
+
+
+@game_bp.route('/api/game/queue', methods=['POST'])
+@login_required
+@rate_limit('action')
+def queue_actions():
+    """Queue a sequence of actions or a path for the current character"""
+    # Resolve the character ID without loading the character
+    context = get_session_context()
+
+    if not context.character_id:
+        return jsonify({
+            'success': False,
+            'message': 'Character not found'
+        }), 404
+
+    # Get queue data
+    data = request.get_json()
+
+    if not isinstance(data, dict) or ('actions' not in data and 'path' not in data):
+        return jsonify({
+            'success': False,
+            'message': 'Actions or path are required'
+        }), 400
+
+    try:
+        if 'path' in data:
+            length = enqueue_path(context.character_id, data['path'])
+        else:
+            length = enqueue_actions(context.character_id, data['actions'])
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+
+    return jsonify({
+        'success': True,
+        'remaining': length
+    })
 
+
+@game_bp.route('/api/game/travel', methods=['POST'])
+@login_required
+@rate_limit('action')
+def travel():
+    """Queue the moves to travel to a tile"""
     # Get character
-    character = get_character_by_user_id(user_id)
+    context = get_session_context()
+    character = context.get_character()
 
     if not character:
         return jsonify({
@@ -250,6 +439,70 @@ def get_logs():
             'message': 'Character not found'
         }), 404
 
+    # Get destination
+    data = request.get_json()
+
+    if not isinstance(data, dict) or 'x' not in data or 'y' not in data:
+        return jsonify({
+            'success': False,
+            'message': 'Destination is required'
+        }), 400
+
+    try:
+        x, y = int(data['x']), int(data['y'])
+    except (TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'message': 'Invalid destination'
+        }), 400
+
+    try:
+        route = enqueue_travel(character, x, y)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+
+    return jsonify({
+        'success': True,
+        'route': route
+    })
+
+
+@game_bp.route('/api/game/queue', methods=['DELETE'])
+@login_required
+def delete_action_queue():
+    """Drop the current character's pending actions"""
+    # Resolve the character ID without loading the character
+    context = get_session_context()
+
+    if not context.character_id:
+        return jsonify({
+            'success': False,
+            'message': 'Character not found'
+        }), 404
+
+    clear_queue(context.character_id)
+
+    return jsonify({
+        'success': True
+    })
+
+
+@game_bp.route('/api/game/logs')
+@login_required
+def get_logs():
+    """Get action logs for the current character"""
+    # Resolve the character ID without loading the character
+    context = get_session_context()
+
+    if not context.character_id:
+        return jsonify({
+            'success': False,
+            'message': 'Character not found'
+        }), 404
+
     # Get limit from query parameters (default: 20)
     limit = request.args.get('limit', 20, type=int)
 
@@ -257,9 +510,9 @@ def get_logs():
     limit = max(1, min(limit, 100))  # Between 1 and 100
 
     # Get logs
-    logs = get_action_logs(character.id, limit)
+    logs = get_action_logs(context.character_id, limit)
 
     return jsonify({
         'success': True,
         'logs': logs
-    })
\ No newline at end of file
+    })
@@ -0,0 +1,135 @@
+import ipaddress
+
+from flask import Blueprint, Response, jsonify, request
+
+import database
+from config import Config
+from models import stats
+from services import pathfinding, rate_limiter, redis_stats, session_context
+from services.metrics import registry, Collected, CONTENT_TYPE
+
+# Create blueprint
+metrics_bp = Blueprint('metrics', __name__)
+
+# Socket.IO room name prefixes reported as room kinds
+ROOM_KINDS = ('user', 'location', 'building', 'global')
+
+
+def metrics_allowed(address):
+    """Check a client address is in one of METRICS_ALLOWED_NETWORKS"""
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False)
+               for network in Config.METRICS_ALLOWED_NETWORKS)
+
+
+@metrics_bp.route('/metrics')
+def get_metrics():
+    """Get runtime metrics in the Prometheus text format"""
+    # Hidden rather than forbidden outside the allowed networks
+    if not Config.METRICS_ENABLED or not metrics_allowed(request.remote_addr):
+        return jsonify({
+            'success': False,
+            'message': 'Not found'
+        }), 404
+
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
+def room_kind(room):
+    """Kind of a Socket.IO room from its name, or None for per-client rooms"""
+    if not isinstance(room, str):
+        return None
+    kind = room.split('_', 1)[0]
+    return kind if kind in ROOM_KINDS else None
+
+
+def collect_rooms(socketio):
+    """Room and member counts by room kind"""
+    rooms = {(kind,): 0 for kind in ROOM_KINDS}
+    members = {(kind,): 0 for kind in ROOM_KINDS}
+    for namespace_rooms in list(socketio.server.manager.rooms.values()):
+        for room, participants in list(namespace_rooms.items()):
+            kind = room_kind(room)
+            if kind:
+                rooms[(kind,)] += 1
+                members[(kind,)] += len(participants)
+    return rooms, members
+
+
+def collect_emit_queues(socketio):
+    """Packets waiting to be sent, in total and to the most backed up client"""
+    sizes = [socket.queue.qsize() for socket in list(socketio.server.eio.sockets.values())]
+    return {('total',): sum(sizes), ('max',): max(sizes, default=0)}
+
+
+def collect_redis_pool():
+    """Connections of the Redis pool by state.
+
+    redis-py keeps these as private attributes of ConnectionPool.
+    """
+    pool = database.redis_connection.connection_pool
+    in_use = len(getattr(pool, '_in_use_connections', ()))
+    available = len(getattr(pool, '_available_connections', ()))
+    return {('in_use',): in_use, ('available',): available}
+
+
+def collect_redis_commands(field):
+    """A per-command total from the Redis instrumentation"""
+    return {
+        (name,): totals[field]
+        for name, totals in list(redis_stats.process_stats.commands.items())
+    }
+
+
+def register_metric_collectors(socketio):
+    """Register the metrics read from sockets, Redis and caches on scrape"""
+    collected = [
+        # Sockets
+        Collected('pbbg_socket_connections', 'Connected Socket.IO clients', 'gauge',
+                  lambda: len(socketio.server.eio.sockets)),
+        Collected('pbbg_socket_rooms', 'Socket.IO rooms by kind', 'gauge',
+                  lambda: collect_rooms(socketio)[0], ('kind',)),
+        Collected('pbbg_socket_room_members', 'Clients in Socket.IO rooms by room kind', 'gauge',
+                  lambda: collect_rooms(socketio)[1], ('kind',)),
+        Collected('pbbg_socket_emit_queue_packets', 'Outgoing packets waiting to be sent', 'gauge',
+                  lambda: collect_emit_queues(socketio), ('scope',)),
+
+        # Redis
+        Collected('pbbg_redis_pool_connections', 'Redis pool connections by state', 'gauge',
+                  collect_redis_pool, ('state',)),
+        Collected('pbbg_redis_pool_max_connections', 'Redis pool connection limit', 'gauge',
+                  lambda: database.redis_connection.connection_pool.max_connections),
+        Collected('pbbg_redis_round_trips_total', 'Redis round-trips', 'counter',
+                  lambda: redis_stats.process_stats.round_trips),
+        Collected('pbbg_redis_commands_total', 'Redis commands by command', 'counter',
+                  lambda: collect_redis_commands(0), ('command',)),
+        Collected('pbbg_redis_command_seconds_total', 'Time spent in Redis by command', 'counter',
+                  lambda: collect_redis_commands(3), ('command',)),
+
+        # Caches. World tiles, buildings and objects have no in-process
+        # cache, they are read from Redis and show up in the Redis metrics;
+        # the route cache is the only world-derived one
+        Collected('pbbg_cache_hits_total', 'In-process cache hits', 'counter', lambda: {
+            ('stats_snapshot',): stats.snapshot_hits,
+            ('route',): pathfinding.route_cache.hits,
+            ('rate_limit_blocked',): rate_limiter.blocked_hits
+        }, ('cache',)),
+        Collected('pbbg_cache_misses_total', 'In-process cache misses', 'counter', lambda: {
+            ('stats_snapshot',): stats.snapshot_misses,
+            ('route',): pathfinding.route_cache.misses,
+            ('rate_limit_blocked',): rate_limiter.bucket_checks
+        }, ('cache',)),
+        Collected('pbbg_cache_entries', 'In-process cache entries', 'gauge', lambda: {
+            ('stats_snapshot',): len(stats._snapshots),
+            ('route',): len(pathfinding.route_cache.routes),
+            ('rate_limit_blocked',): len(rate_limiter._blocked),
+            ('session',): len(session_context._character_ids),
+            ('session_user',): len(session_context._users)
+        }, ('cache',))
+    ]
+
+    for metric in collected:
+        registry.register(metric)
@@ -1,8 +1,21 @@
 from flask import session, request
 from flask_socketio import emit, join_room, leave_room, rooms
-from models.character import get_character_by_user_id
-from models.actions import get_available_actions, process_action, get_action_logs
+from models.actions import ACTION_TYPES, get_available_actions, process_action, get_action_logs
 from models.world import get_map_slice, get_tile_with_contents, get_building_with_contents
+from services.rate_limiter import socket_rate_limit
+from services.profiler import profiled
+from services.redis_stats import describe_request
+from services.session_context import get_session_context
+from services.game_state import get_game_state, parse_state_fields
+from services.socket_codec import start_client_codec
+from services.action_queue import (
+    enqueue_actions,
+    enqueue_path,
+    enqueue_travel,
+    clear_queue,
+    get_queue,
+    process_character_queue
+)
 
 # Active user rooms mapping
 user_rooms = {}
@@ -12,8 +25,13 @@ def register_socket_events(socketio):
     """Register WebSocket event handlers"""
 
     @socketio.on('connect')
-    def handle_connect():
+    @profiled
+    def handle_connect(auth=None):
         """Handle client connection"""
+        # Switch to the client's preferred codec before sending anything else
+        requested = (auth or {}).get('codec') or request.args.get('codec')
+        start_client_codec(socketio, request.sid, requested)
+
         if 'user_id' in session:
             user_id = session['user_id']
 
@@ -26,7 +44,7 @@ def register_socket_events(socketio):
             join_room('global')
 
             # Get character
-            character = get_character_by_user_id(user_id)
+            character = get_session_context().get_character()
 
             if character:
                 # Join location room
@@ -39,7 +57,7 @@ def register_socket_events(socketio):
                     join_room(building_room)
 
                 # Send initial data to client
-                emit('character_update', character.__dict__, room=user_room)
+                emit('character_update', character.to_dict(), room=user_room)
 
                 # Send available actions
                 actions = get_available_actions(character.id)
@@ -74,6 +92,7 @@ def register_socket_events(socketio):
                 }, room=user_room)
 
     @socketio.on('disconnect')
+    @profiled
     def handle_disconnect():
         """Handle client disconnection"""
         sid = request.sid
@@ -88,6 +107,8 @@ def register_socket_events(socketio):
             del user_rooms[sid]
 
     @socketio.on('action')
+    @profiled
+    @socket_rate_limit('action')
     def handle_action(data):
         """Handle character action"""
         if 'user_id' not in session:
@@ -104,8 +125,12 @@ def register_socket_events(socketio):
         action_type = data['action_type']
         action_data = data.get('action_data', {})
 
+        # Account Redis usage per action type
+        if action_type in ACTION_TYPES:
+            describe_request(action_type)
+
         # Get character
-        character = get_character_by_user_id(user_id)
+        character = get_session_context().get_character()
 
         if not character:
             emit('error', {'message': 'Character not found'})
@@ -124,16 +149,17 @@ def register_socket_events(socketio):
 
         if result['success']:
             # Get updated character
-            updated_character = get_character_by_user_id(user_id)
+            updated_character = get_session_context().get_character(refresh=True)
 
             # Update character data
-            emit('character_update', updated_character.__dict__, room=user_room)
+            emit('character_update', updated_character.to_dict(), room=user_room)
 
-            # Check if location changed
+            # Check if location changed, using the compact state returned by the action
+            new_location = result['character_state']
             location_changed = (
-                    updated_character.x != old_location['x'] or
-                    updated_character.y != old_location['y'] or
-                    updated_character.inside_building != old_location['inside_building']
+                    new_location['x'] != old_location['x'] or
+                    new_location['y'] != old_location['y'] or
+                    new_location['inside_building'] != old_location['inside_building']
             )
 
             if location_changed:
@@ -147,12 +173,12 @@ def register_socket_events(socketio):
                     leave_room(old_building_room)
 
                 # Join new location room
-                new_location_room = f"location_{updated_character.x}_{updated_character.y}"
+                new_location_room = f"location_{new_location['x']}_{new_location['y']}"
                 join_room(new_location_room)
 
                 # Join new building room if applicable
-                if updated_character.inside_building and updated_character.building_id:
-                    new_building_room = f"building_{updated_character.building_id}"
+                if new_location['inside_building'] and new_location['building_id']:
+                    new_building_room = f"building_{new_location['building_id']}"
                     join_room(new_building_room)
 
                 # Get location information
@@ -205,7 +231,154 @@ def register_socket_events(socketio):
             # Send error message
             emit('error', {'message': result['message']}, room=user_room)
 
+    @socketio.on('request_state')
+    @profiled
+    def handle_request_state(data=None):
+        """Send the game state, or the selected fields of it"""
+        if 'user_id' not in session:
+            emit('error', {'message': 'Not authenticated'})
+            return
+
+        data = data or {}
+
+        # Resolve the character ID, the state loads the character itself
+        context = get_session_context()
+
+        if not context.character_id:
+            emit('error', {'message': 'Character not found'})
+            return
+
+        try:
+            fields = data.get('fields')
+            fields = parse_state_fields(','.join(fields) if isinstance(fields, list) else fields)
+            radius = max(1, min(int(data.get('radius', 1)), 5))
+        except (TypeError, ValueError) as e:
+            emit('error', {'message': str(e)})
+            return
+
+        state = get_game_state(context.character_id, fields, radius)
+
+        if state is None:
+            emit('error', {'message': 'Character not found'})
+            return
+
+        emit('state', state)
+
+    @socketio.on('queue_actions')
+    @profiled
+    @socket_rate_limit('action')
+    def handle_queue_actions(data):
+        """Queue a sequence of actions or a path for the character"""
+        if 'user_id' not in session:
+            emit('error', {'message': 'Not authenticated'})
+            return
+
+        user_id = session['user_id']
+
+        if not isinstance(data, dict) or ('actions' not in data and 'path' not in data):
+            emit('error', {'message': 'Actions or path are required'})
+            return
+
+        # Resolve the character ID without loading the character
+        context = get_session_context()
+
+        if not context.character_id:
+            emit('error', {'message': 'Character not found'})
+            return
+
+        try:
+            if 'path' in data:
+                enqueue_path(context.character_id, data['path'])
+            else:
+                enqueue_actions(context.character_id, data['actions'])
+        except ValueError as e:
+            emit('error', {'message': str(e)})
+            return
+
+        # Run the first steps right away, the scheduler picks up the rest
+        process_character_queue(socketio, context.character_id)
+
+    @socketio.on('travel')
+    @profiled
+    @socket_rate_limit('action')
+    def handle_travel(data):
+        """Queue the moves to travel to a tile"""
+        if 'user_id' not in session:
+            emit('error', {'message': 'Not authenticated'})
+            return
+
+        user_id = session['user_id']
+
+        if not isinstance(data, dict) or 'x' not in data or 'y' not in data:
+            emit('error', {'message': 'Destination is required'})
+            return
+
+        try:
+            x, y = int(data['x']), int(data['y'])
+        except (TypeError, ValueError):
+            emit('error', {'message': 'Invalid destination'})
+            return
+
+        # Get character
+        character = get_session_context().get_character()
+
+        if not character:
+            emit('error', {'message': 'Character not found'})
+            return
+
+        try:
+            route = enqueue_travel(character, x, y)
+        except ValueError as e:
+            emit('error', {'message': str(e)})
+            return
+
+        emit('route', route)
+
+        # Run the first steps right away, the scheduler picks up the rest
+        process_character_queue(socketio, character.id)
+
+    @socketio.on('clear_queue')
+    @profiled
+    def handle_clear_queue():
+        """Drop the character's pending actions"""
+        if 'user_id' not in session:
+            emit('error', {'message': 'Not authenticated'})
+            return
+
+        user_id = session['user_id']
+
+        # Resolve the character ID without loading the character
+        context = get_session_context()
+
+        if not context.character_id:
+            emit('error', {'message': 'Character not found'})
+            return
+
+        clear_queue(context.character_id)
+        emit('queue_update', {'results': [], 'remaining': 0}, room=f"user_{user_id}")
+
+    @socketio.on('request_queue')
+    @profiled
+    def handle_request_queue():
+        """Send the character's pending actions"""
+        if 'user_id' not in session:
+            emit('error', {'message': 'Not authenticated'})
+            return
+
+        user_id = session['user_id']
+
+        # Resolve the character ID without loading the character
+        context = get_session_context()
+
+        if not context.character_id:
+            emit('error', {'message': 'Character not found'})
+            return
+
+        emit('queue', {'queue': get_queue(context.character_id)})
+
     @socketio.on('chat')
+    @profiled
+    @socket_rate_limit('chat')
     def handle_chat(data):
         """Handle chat messages"""
         if 'user_id' not in session:
@@ -222,7 +395,7 @@ def register_socket_events(socketio):
         channel = data.get('channel', 'location')
 
         # Get character
-        character = get_character_by_user_id(user_id)
+        character = get_session_context().get_character()
 
         if not character:
             emit('error', {'message': 'Character not found'})
@@ -267,6 +440,7 @@ def register_socket_events(socketio):
             emit('error', {'message': 'Invalid chat channel'})
 
     @socketio.on('request_players_in_location')
+    @profiled
     def handle_request_players_in_location():
         """Handle request for players in current location"""
         if 'user_id' not in session:
@@ -276,7 +450,7 @@ def register_socket_events(socketio):
         user_id = session['user_id']
 
         # Get character
-        character = get_character_by_user_id(user_id)
+        character = get_session_context().get_character()
 
         if not character:
             emit('error', {'message': 'Character not found'})
@@ -0,0 +1,388 @@
+import uuid
+
+import database
+from config import Config
+from models.actions import (
+    ACTION_TYPES,
+    DIRECTIONS,
+    process_action,
+    get_available_actions,
+    get_action_logs
+)
+from models.character import get_character_by_id
+from models.world import get_map_slice, get_tile_with_contents, get_building_with_contents
+from services.pathfinding import plan_route
+from utils import serialization
+
+# Set of character IDs with a non-empty action queue
+ACTIVE_QUEUES_KEY = 'action_queues:active'
+
+# Seconds a queue stays locked while it is being executed
+QUEUE_LOCK_TIMEOUT = 30
+
+# Types allowed as action data values, actions only take scalar arguments
+ACTION_DATA_TYPES = (str, int, float)
+
+# Append steps to a queue, or replace its steps, unless that would take it
+# over the limit, so concurrent enqueues cannot both pass the length check.
+# Queued steps end any travel order still waiting for its next segment.
+#
+# KEYS[1] queue list, KEYS[2] set of active queues, KEYS[3] travel destination
+# ARGV[1] character ID, ARGV[2] maximum length, ARGV[3] '1' to replace the
+# queued steps, ARGV[4...] steps
+ENQUEUE_SCRIPT = """
+local steps = #ARGV - 3
+local length = 0
+if ARGV[3] ~= '1' then
+    length = redis.call('LLEN', KEYS[1])
+end
+if length + steps > tonumber(ARGV[2]) then
+    return -1
+end
+
+if ARGV[3] == '1' then
+    redis.call('DEL', KEYS[1])
+end
+length = redis.call('RPUSH', KEYS[1], unpack(ARGV, 4))
+redis.call('SADD', KEYS[2], ARGV[1])
+redis.call('DEL', KEYS[3])
+return length
+"""
+
+# Release a queue lock only if it is still held with our token, so a runner
+# whose lock expired cannot remove the lock of the next one.
+#
+# KEYS[1] lock key
+# ARGV[1] token
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Registered scripts, created on first use
+_scripts = {}
+
+
+def get_script(source):
+    """Get the compiled script for a source"""
+    if source not in _scripts:
+        _scripts[source] = database.redis_connection.register_script(source)
+    return _scripts[source]
+
+
+def queue_key(character_id):
+    """Redis key of a character's action queue"""
+    return f'character:queue:{character_id}'
+
+
+def travel_key(character_id):
+    """Redis key of the destination of a travel order with segments left"""
+    return f'{queue_key(character_id)}:travel'
+
+
+def enqueue_actions(character_id, actions, replace=False):
+    """Append a sequence of actions to a character's queue.
+
+    Each action is a dict with action_type and optional action_data. With
+    replace the pending actions are dropped first. Returns the new queue
+    length.
+    """
+    if not isinstance(actions, list):
+        raise ValueError('Actions must be a list')
+
+    steps = []
+    for action in actions:
+        if not isinstance(action, dict) or action.get('action_type') not in ACTION_TYPES:
+            raise ValueError('Invalid action in queue')
+
+        # Checked now, a step that cannot run would stop the queue later
+        action_data = action.get('action_data') or {}
+        if not isinstance(action_data, dict) or not all(
+                isinstance(value, ACTION_DATA_TYPES) for value in action_data.values()):
+            raise ValueError('Invalid action data in queue')
+
+        steps.append(serialization.dumps({
+            'action_type': action['action_type'],
+            'action_data': action_data
+        }))
+
+    if not steps:
+        raise ValueError('No actions to queue')
+
+    length = get_script(ENQUEUE_SCRIPT)(
+        keys=[queue_key(character_id), ACTIVE_QUEUES_KEY, travel_key(character_id)],
+        args=[character_id, Config.ACTION_QUEUE_MAX_LENGTH, int(replace), *steps],
+        client=database.redis_connection
+    )
+    if length < 0:
+        raise ValueError(f'Action queue is limited to {Config.ACTION_QUEUE_MAX_LENGTH} steps')
+
+    return length
+
+
+def enqueue_path(character_id, directions):
+    """Queue a path given as a list of movement directions"""
+    actions = []
+    for direction in directions or []:
+        direction = str(direction).lower()
+        if direction not in DIRECTIONS:
+            raise ValueError('Invalid direction in path')
+
+        actions.append({'action_type': 'MOVE', 'action_data': {'direction': direction}})
+
+    return enqueue_actions(character_id, actions)
+
+
+def queue_route(character_id, x, y, actions):
+    """Queue the first segment of a route to a tile.
+
+    Routes longer than the queue are queued in segments: the destination is
+    kept and the next segment is planned from wherever the character is
+    once the queue runs out, see continue_travel.
+    """
+    limit = Config.ACTION_QUEUE_MAX_LENGTH
+    enqueue_actions(character_id, actions[:limit], replace=True)
+    if len(actions) > limit:
+        database.redis_connection.set(travel_key(character_id), f'{x}:{y}')
+
+
+def continue_travel(character_id):
+    """Queue the next segment of a travel order.
+
+    Returns True if one was queued, False if there is no travel order or
+    the destination was reached or cannot be reached any more.
+    """
+    destination = database.redis_connection.get(travel_key(character_id))
+    if not destination:
+        return False
+
+    x, y = (int(value) for value in destination.split(':'))
+    position = database.redis_connection.hmget(f'character:{character_id}', ['x', 'y'])
+    route = None
+    if None not in position and (int(position[0]), int(position[1])) != (x, y):
+        route = plan_route((int(position[0]), int(position[1])), (x, y))
+
+    if not route:
+        database.redis_connection.delete(travel_key(character_id))
+        return False
+
+    queue_route(character_id, x, y, [
+        {'action_type': 'MOVE', 'action_data': {'direction': direction}}
+        for direction in route['directions']
+    ])
+    return True
+
+
+def enqueue_travel(character, x, y):
+    """Queue the moves to travel to a tile, exiting the current building first.
+
+    The route is planned from the character's position, so it replaces any
+    pending actions rather than following them. Long routes are queued in
+    segments, see queue_route. Returns the planned route.
+    """
+    if (character.x, character.y) == (x, y):
+        raise ValueError('Already at destination')
+
+    route = plan_route((character.x, character.y), (x, y))
+    if not route:
+        raise ValueError('No route to destination')
+
+    actions = []
+    if character.inside_building:
+        actions.append({'action_type': 'EXIT_BUILDING'})
+
+    actions.extend(
+        {'action_type': 'MOVE', 'action_data': {'direction': direction}}
+        for direction in route['directions']
+    )
+    queue_route(character.id, x, y, actions)
+
+    return route
+
+
+def get_queue(character_id):
+    """Get the pending actions of a character"""
+    steps = database.redis_connection.lrange(queue_key(character_id), 0, -1)
+    return [serialization.loads(step) for step in steps]
+
+
+def clear_queue(character_id):
+    """Drop all pending actions of a character"""
+    pipe = database.redis_connection.pipeline()
+    pipe.delete(queue_key(character_id), travel_key(character_id))
+    pipe.srem(ACTIVE_QUEUES_KEY, character_id)
+    pipe.execute()
+
+
+def get_ap(character_id):
+    """Read a character's current AP"""
+    return int(database.redis_connection.hget(f'character:{character_id}', 'ap') or 0)
+
+
+def run_character_queue(character_id, max_steps=None):
+    """Execute queued actions while the character has AP for them.
+
+    Every step goes through process_action. A failed step drops the rest of
+    the queue, since later steps usually depend on it, unless it only failed
+    for lack of AP, in which case it waits for regeneration. A step that
+    raises counts as failed, so it cannot block the queue. Returns the
+    results of the executed steps.
+    """
+    max_steps = max_steps or Config.ACTION_QUEUE_STEPS_PER_TICK
+    key = queue_key(character_id)
+    lock_key = f'{key}:lock'
+
+    # The scheduler and socket handlers can both run a queue
+    token = uuid.uuid4().hex
+    if not database.redis_connection.set(lock_key, token, nx=True, ex=QUEUE_LOCK_TIMEOUT):
+        return []
+
+    results = []
+    try:
+        while len(results) < max_steps:
+            step_json = database.redis_connection.lindex(key, 0)
+            if step_json is None:
+                # Travel orders queue their next segment once one is done
+                if continue_travel(character_id):
+                    continue
+                database.redis_connection.srem(ACTIVE_QUEUES_KEY, character_id)
+                break
+
+            step = serialization.loads(step_json)
+            action_details = ACTION_TYPES.get(step['action_type'])
+            ap_cost = action_details['ap_cost'] if action_details else 0
+
+            # Wait for AP regeneration instead of failing the step. AP is read
+            # before every step, direct actions can spend it between steps.
+            if get_ap(character_id) < ap_cost:
+                break
+
+            try:
+                result = process_action(character_id, step['action_type'], step['action_data'])
+            except Exception as e:
+                # It would raise again on every tick, drop it like a failed step
+                print(f"Error running queued {step['action_type']} for character {character_id}: {e}")
+                name = action_details['name'] if action_details else step['action_type']
+                result = {'success': False, 'message': f'{name} could not be run'}
+            else:
+                if not result['success'] and get_ap(character_id) < ap_cost:
+                    # The AP was spent after the check, keep the step for later
+                    break
+
+            database.redis_connection.lpop(key)
+
+            results.append({
+                'action_type': step['action_type'],
+                'success': result['success'],
+                'message': result['message']
+            })
+
+            if not result['success']:
+                clear_queue(character_id)
+                break
+    finally:
+        get_script(RELEASE_LOCK_SCRIPT)(keys=[lock_key], args=[token], client=database.redis_connection)
+
+    return results
+
+
+def get_location_payload(character):
+    """Build the location data sent to clients"""
+    if character.inside_building:
+        location = get_building_with_contents(character.building_id)
+        if location:
+            location['x'] = character.x
+            location['y'] = character.y
+            location['inside_building'] = True
+    else:
+        location = get_tile_with_contents(character.x, character.y)
+        if location:
+            location['inside_building'] = False
+
+    return location
+
+
+def sync_location_rooms(socketio, user_room, character, old_state):
+    """Move a user's sockets from the old location rooms to the new ones"""
+    old_location_room = f"location_{old_state['x']}_{old_state['y']}"
+    new_location_room = f"location_{character.x}_{character.y}"
+
+    for sid, _ in list(socketio.server.manager.get_participants('/', user_room)):
+        socketio.server.leave_room(sid, old_location_room, namespace='/')
+        if old_state['inside_building'] and old_state['building_id']:
+            socketio.server.leave_room(sid, f"building_{old_state['building_id']}", namespace='/')
+
+        socketio.server.enter_room(sid, new_location_room, namespace='/')
+        if character.inside_building and character.building_id:
+            socketio.server.enter_room(sid, f"building_{character.building_id}", namespace='/')
+
+    player = {'character_id': character.id, 'character_name': character.name}
+    socketio.emit('player_left', player, room=old_location_room)
+    socketio.emit('player_entered', player, room=new_location_room)
+
+
+def process_character_queue(socketio, character_id):
+    """Run a character's queue and emit the results as one batched update"""
+    character = get_character_by_id(character_id)
+    if not character:
+        clear_queue(character_id)
+        return []
+
+    # Store old location for room management
+    old_state = {
+        'x': character.x,
+        'y': character.y,
+        'inside_building': character.inside_building,
+        'building_id': character.building_id
+    }
+
+    results = run_character_queue(character_id)
+    if not results:
+        return results
+
+    character = get_character_by_id(character_id)
+    user_room = f"user_{character.user_id}"
+
+    payload = {
+        'results': results,
+        'remaining': database.redis_connection.llen(queue_key(character_id)),
+        'character': character.to_dict(),
+        'actions': get_available_actions(character_id),
+        'logs': get_action_logs(character_id, 10)
+    }
+
+    location_changed = (
+            character.x != old_state['x'] or
+            character.y != old_state['y'] or
+            character.inside_building != old_state['inside_building']
+    )
+
+    if location_changed:
+        sync_location_rooms(socketio, user_room, character, old_state)
+
+        payload['location'] = get_location_payload(character)
+        payload['map'] = {
+            'map': get_map_slice(character.x, character.y, 1),
+            'character_position': {
+                'x': character.x,
+                'y': character.y,
+                'inside_building': character.inside_building
+            }
+        }
+
+    socketio.emit('queue_update', payload, room=user_room)
+
+    return results
+
+
+def process_action_queues(socketio):
+    """Advance every non-empty action queue"""
+    character_ids = database.redis_connection.smembers(ACTIVE_QUEUES_KEY)
+
+    for character_id in character_ids:
+        try:
+            process_character_queue(socketio, int(character_id))
+        except Exception as e:
+            print(f"Error processing action queue for character {character_id}: {e}")
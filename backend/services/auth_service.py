@@ -0,0 +1,100 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from config import Config
+
+try:
+    from eventlet import tpool
+    import greenlet
+except ImportError:
+    tpool = None
+
+# Password hashing is CPU-bound PBKDF2, which would block the eventlet hub
+# and stall every socket while it runs. It is run on real OS threads instead,
+# where hashlib releases the GIL, through eventlet's thread pool when it is
+# available and a plain thread pool otherwise. Waiting on a plain pool's
+# future blocks the whole OS thread, so green threads always use tpool.
+
+_executor = None
+_lock = threading.Lock()
+
+# Hashing pool counters
+hash_pool_stats = {
+    'submitted': 0,
+    'completed': 0,
+    'rejected': 0,
+    'in_flight': 0,
+    'max_in_flight': 0,
+    'total_seconds': 0.0
+}
+
+
+class PasswordHashBusy(Exception):
+    """Raised when too many password hashes are already queued"""
+
+
+def in_green_thread():
+    """Check if the caller is a green thread run by the eventlet hub"""
+    return greenlet.getcurrent().parent is not None
+
+
+def use_tpool():
+    """Check if hashing should go through eventlet's thread pool"""
+    if tpool is None:
+        return False
+    return Config.PASSWORD_HASH_POOL == 'tpool' or in_green_thread()
+
+
+def get_executor():
+    """Get the thread pool used without eventlet"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=Config.PASSWORD_HASH_WORKERS,
+                                       thread_name_prefix='password-hash')
+    return _executor
+
+
+def run_in_hash_pool(func, *args):
+    """Run a hashing function in the pool and wait for its result.
+
+    Raises PasswordHashBusy when the queue is full, so a login storm is
+    turned away instead of piling up behind the workers.
+    """
+    with _lock:
+        if hash_pool_stats['in_flight'] >= Config.PASSWORD_HASH_QUEUE_LIMIT:
+            hash_pool_stats['rejected'] += 1
+            raise PasswordHashBusy('Server busy, please try again')
+
+        hash_pool_stats['submitted'] += 1
+        hash_pool_stats['in_flight'] += 1
+        hash_pool_stats['max_in_flight'] = max(hash_pool_stats['max_in_flight'], hash_pool_stats['in_flight'])
+
+    started = time.perf_counter()
+    try:
+        if use_tpool():
+            return tpool.execute(func, *args)
+        return get_executor().submit(func, *args).result()
+    finally:
+        with _lock:
+            hash_pool_stats['in_flight'] -= 1
+            hash_pool_stats['completed'] += 1
+            hash_pool_stats['total_seconds'] += time.perf_counter() - started
+
+
+def hash_password(password):
+    """Hash a password in the hashing pool"""
+    return run_in_hash_pool(generate_password_hash, password)
+
+
+def verify_password(password_hash, password):
+    """Check a password against its hash in the hashing pool"""
+    return run_in_hash_pool(check_password_hash, password_hash, password)
+
+
+def get_hash_pool_stats():
+    """Get a copy of the hashing pool counters"""
+    with _lock:
+        return dict(hash_pool_stats)
@@ -1,6 +1,7 @@
 import random
 from config import Config
 import database
+from services.pathfinding import landmark_tiles, warm_route_cache
 from models.world import (
     create_tile,
     create_building,
@@ -232,6 +233,9 @@ def initialize_game_world():
     mark_world_initialized()
     print("Game world initialized successfully")
 
+    # There were no landmarks to route between when models were initialized
+    warm_route_cache(landmark_tiles())
+
 
 def reset_game_world():
     """Reset the game world (for development/testing)"""
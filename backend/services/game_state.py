@@ -0,0 +1,119 @@
+import database
+from models.character import build_character
+from models.inventory import inventory_key, unpack_inventory, with_definition
+from models.items import get_item_catalog, compute_equipment_bonuses
+from models.world import (
+    get_entities,
+    get_location_ref,
+    get_location_entities,
+    build_location_payload,
+    map_slice_refs,
+    get_map_slice
+)
+from models.actions import build_available_actions
+from models.stats import get_effective_stats
+from utils import serialization
+
+# Parts of the game state a client can ask for
+STATE_FIELDS = ('character', 'inventory', 'equipment', 'map', 'location', 'actions', 'logs')
+
+
+def parse_state_fields(value):
+    """Parse a comma separated field selector, all fields if empty"""
+    if not value:
+        return list(STATE_FIELDS)
+
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in STATE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown state fields: {', '.join(unknown)}")
+
+    return fields
+
+
+def get_game_state(character_id, fields=None, radius=1, log_limit=10, expand=False):
+    """Compose the state a client needs to render the game.
+
+    The character is loaded once. Everything keyed by the character ID comes
+    in the first round-trip, map tiles and the current location in the
+    second, and the buildings and objects at the location in the third,
+    whatever the map radius. Returns None if the character does not exist.
+    """
+    fields = set(fields or STATE_FIELDS)
+    wants_items = bool(fields & {'inventory', 'equipment'})
+
+    # Character, inventory and logs
+    pipe = database.redis_connection.pipeline(transaction=False)
+    pipe.hgetall(f'character:{character_id}')
+    if wants_items:
+        pipe.hgetall(inventory_key(character_id))
+    if 'logs' in fields:
+        pipe.zrevrange(f'character:logs:{character_id}', 0, log_limit - 1)
+    results = pipe.execute()
+
+    character_data = database.redis_hash_to_dict(results.pop(0))
+    if not character_data:
+        return None
+
+    # Legacy characters have their inventory moved out while being built
+    legacy_inventory = 'inventory' in character_data
+    character = build_character(character_data)
+
+    state = {}
+
+    if 'character' in fields:
+        state['character'] = character.to_dict()
+        state['effective_stats'] = get_effective_stats(character)
+
+    if wants_items:
+        packed_items = results.pop(0)
+        if legacy_inventory:
+            packed_items = database.redis_connection.hgetall(inventory_key(character_id))
+        inventory = unpack_inventory(packed_items)
+
+        if 'inventory' in fields:
+            state['inventory'] = [with_definition(item) for item in inventory] if expand else inventory
+
+        if 'equipment' in fields:
+            items_by_id = {item['id']: item for item in inventory}
+            equipment = {
+                slot: items_by_id[str(item_id)]
+                for slot, item_id in character.equipment.items()
+                if str(item_id) in items_by_id
+            }
+            state['bonuses'] = compute_equipment_bonuses(item['item_code'] for item in equipment.values())
+            state['equipment'] = {
+                slot: with_definition(item) for slot, item in equipment.items()
+            } if expand else equipment
+
+        state['catalog_version'] = get_item_catalog()[1]
+
+    if 'logs' in fields:
+        state['logs'] = [serialization.loads(log) for log in results.pop(0)]
+
+    if fields & {'map', 'location', 'actions'}:
+        position = (character.x, character.y, character.inside_building, character.building_id)
+
+        # Map tiles and the current location together
+        refs = map_slice_refs(character.x, character.y, radius) if 'map' in fields else []
+        loaded = get_entities(refs + [get_location_ref(*position)])
+
+        if 'map' in fields:
+            state['map'] = {
+                'map': get_map_slice(character.x, character.y, radius, loaded),
+                'character_position': {
+                    'x': character.x,
+                    'y': character.y,
+                    'inside_building': character.inside_building
+                }
+            }
+
+        if fields & {'location', 'actions'}:
+            location = get_location_entities(*position, loaded=loaded)
+
+            if 'location' in fields:
+                state['location'] = build_location_payload(character.x, character.y, location)
+            if 'actions' in fields:
+                state['actions'] = build_available_actions(character, location)
+
+    return state
@@ -0,0 +1,239 @@
+"""In-process metrics in the Prometheus text format.
+
+Counters and histograms are plain Python numbers updated without locks.
+Histograms have fixed buckets, so an observation is a bisect and two
+additions. Green threads never switch in the middle of an update; an
+update racing one from a scheduler thread can very rarely be lost, which
+is acceptable for metrics and much cheaper than taking a lock on every
+action.
+
+Values owned by other modules, like socket counts or cache hit counters,
+are read through collect callbacks when /metrics is scraped, so they cost
+nothing in between.
+"""
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from functools import wraps
+
+from config import Config
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+ACTION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def escape_label(value):
+    """Escape a label value for the text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=None):
+    """Render {name="value",...}, or nothing without labels"""
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    """Render a sample value"""
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """A named metric with one child per combination of label values"""
+
+    type = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.children = {}
+        if not self.label_names:
+            self.children[()] = self.new_child()
+
+    @abstractmethod
+    def new_child(self):
+        """Create the value of one combination of label values"""
+
+    def labels(self, *values):
+        """Get the child for some label values, creating it on first use"""
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self.new_child()
+        return child
+
+    @abstractmethod
+    def samples(self):
+        """(suffix, label values, extra label, value) of every sample"""
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        for suffix, values, extra, value in self.samples():
+            lines.append(f'{self.name}{suffix}{format_labels(self.label_names, values, extra)} {format_value(value)}')
+        return lines
+
+
+class CounterValue:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Counter(Metric):
+    """A count that only goes up"""
+
+    type = 'counter'
+
+    def new_child(self):
+        return CounterValue()
+
+    def inc(self, amount=1):
+        self.children[()].inc(amount)
+
+    def samples(self):
+        for values, child in list(self.children.items()):
+            yield '', values, None, child.value
+
+
+class HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One count per bucket and one for values above the last bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(Metric):
+    """Observations counted into fixed buckets"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=ACTION_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def new_child(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.children[()].observe(value)
+
+    def samples(self):
+        for values, child in list(self.children.items()):
+            counts = list(child.counts)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield '_bucket', values, f'le="{format_value(float(bound))}"', cumulative
+            cumulative += counts[-1]
+            yield '_bucket', values, 'le="+Inf"', cumulative
+            yield '_sum', values, None, child.sum
+            yield '_count', values, None, cumulative
+
+
+class Collected(Metric):
+    """A metric read from elsewhere when scraped.
+
+    collect returns a number, or a dict of label value tuples to numbers.
+    """
+
+    def __init__(self, name, help, type, collect, labels=()):
+        self.type = type
+        self.collect = collect
+        super().__init__(name, help, labels)
+
+    def new_child(self):
+        return None
+
+    def samples(self):
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            yield '', label_values, None, value
+
+
+class Registry:
+    """The metrics rendered by /metrics, in registration order"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """Render every metric in the Prometheus text format"""
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # A broken collector should not hide the other metrics
+                print(f"Error collecting metric {metric.name}: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+actions_total = registry.register(Counter(
+    'pbbg_actions_total', 'Actions processed, by type and result', ('action_type', 'result')))
+action_duration = registry.register(Histogram(
+    'pbbg_action_duration_seconds', 'Time to process an action', ('action_type',), ACTION_BUCKETS))
+job_duration = registry.register(Histogram(
+    'pbbg_scheduler_job_duration_seconds', 'Time to run a scheduled job', ('job',), JOB_BUCKETS))
+job_errors = registry.register(Counter(
+    'pbbg_scheduler_job_errors_total', 'Scheduled job runs that raised', ('job',)))
+
+
+def prepare_action_metrics(action_types):
+    """Create the children of every action type up front.
+
+    They are reported from the start, and recording never inserts.
+    """
+    for action_type in action_types:
+        action_duration.labels(action_type)
+        for result in ('success', 'failure', 'error'):
+            actions_total.labels(action_type, result)
+
+
+def record_action(action_type, result, seconds):
+    """Count a processed action and its duration"""
+    if not Config.METRICS_ENABLED:
+        return
+    actions_total.labels(action_type, result).inc()
+    action_duration.labels(action_type).observe(seconds)
+
+
+def timed_job(job_id, func):
+    """Wrap a scheduled job to record how long each run takes"""
+    duration = job_duration.labels(job_id)
+    errors = job_errors.labels(job_id)
+
+    @wraps(func)
+    def run(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            duration.observe(time.perf_counter() - started)
+
+    return run
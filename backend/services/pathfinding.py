@@ -0,0 +1,217 @@
+import heapq
+from collections import OrderedDict
+
+import database
+from config import Config
+from models.actions import ACTION_TYPES, DIRECTIONS
+
+# Direction name for each coordinate delta
+DELTA_DIRECTIONS = {delta: direction for direction, delta in DIRECTIONS.items()}
+
+
+class Grid:
+    """In-memory 8-connected grid of world tiles"""
+
+    def __init__(self, width, height, blocked=None, step_cost=None):
+        self.width = width
+        self.height = height
+        self.blocked = set(blocked or ())
+        # Straight and diagonal moves cost the same AP
+        self.step_cost = ACTION_TYPES['MOVE']['ap_cost'] if step_cost is None else step_cost
+
+    def passable(self, x, y):
+        """Check if a tile is inside the grid and not blocked"""
+        return 0 <= x < self.width and 0 <= y < self.height and (x, y) not in self.blocked
+
+    def neighbors(self, x, y):
+        """Passable tiles adjacent to a tile"""
+        for dx, dy in DELTA_DIRECTIONS:
+            nx, ny = x + dx, y + dy
+            if self.passable(nx, ny):
+                yield nx, ny
+
+
+class RouteCache:
+    """LRU cache of planned routes"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.routes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Get a route and mark it as recently used"""
+        route = self.routes.get(key)
+        if route is None:
+            self.misses += 1
+            return None
+
+        self.routes.move_to_end(key)
+        self.hits += 1
+        return route
+
+    def put(self, key, route):
+        """Store a route, evicting the least recently used one if full"""
+        self.routes[key] = route
+        self.routes.move_to_end(key)
+        if len(self.routes) > self.maxsize:
+            self.routes.popitem(last=False)
+
+    def clear(self):
+        """Drop all routes"""
+        self.routes.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def octile_distance(dx, dy, straight_cost, diagonal_cost):
+    """Octile distance between tiles dx and dy apart"""
+    return straight_cost * (dx + dy) + (diagonal_cost - 2 * straight_cost) * min(dx, dy)
+
+
+def find_path(grid, start, goal):
+    """Find the shortest path between two tiles with A*.
+
+    Returns the list of (x, y) tiles from start to goal, or None if the goal
+    cannot be reached.
+    """
+    if not grid.passable(*start) or not grid.passable(*goal):
+        return None
+
+    if start == goal:
+        return [start]
+
+    cost = grid.step_cost
+    goal_x, goal_y = goal
+
+    def heuristic(x, y):
+        return octile_distance(abs(x - goal_x), abs(y - goal_y), cost, cost)
+
+    # Heap entries are (f, h, tile); ties on f prefer tiles closer to the goal,
+    # which keeps open grids from expanding whole diamonds of equal-cost tiles
+    start_h = heuristic(*start)
+    open_heap = [(start_h, start_h, start)]
+    came_from = {}
+    g_score = {start: 0}
+    closed = set()
+
+    while open_heap:
+        _, _, current = heapq.heappop(open_heap)
+        if current == goal:
+            break
+
+        if current in closed:
+            continue
+        closed.add(current)
+
+        next_g = g_score[current] + cost
+        for neighbor in grid.neighbors(*current):
+            if neighbor in closed or next_g >= g_score.get(neighbor, float('inf')):
+                continue
+
+            came_from[neighbor] = current
+            g_score[neighbor] = next_g
+            h = heuristic(*neighbor)
+            heapq.heappush(open_heap, (next_g + h, h, neighbor))
+    else:
+        return None
+
+    # Walk back from the goal
+    path = [goal]
+    while path[-1] != start:
+        path.append(came_from[path[-1]])
+    path.reverse()
+
+    return path
+
+
+def path_to_directions(path):
+    """Convert a list of tiles into MOVE directions"""
+    return [
+        DELTA_DIRECTIONS[(x2 - x1, y2 - y1)]
+        for (x1, y1), (x2, y2) in zip(path, path[1:])
+    ]
+
+
+# World grid and route cache, built on first use
+_world_grid = None
+route_cache = RouteCache(Config.PATH_CACHE_SIZE)
+
+
+def get_world_grid():
+    """Get the grid for the configured world size"""
+    global _world_grid
+    if _world_grid is None:
+        _world_grid = Grid(Config.WORLD_SIZE_X, Config.WORLD_SIZE_Y)
+    return _world_grid
+
+
+def reset_world_grid(blocked=None):
+    """Rebuild the world grid and drop cached routes"""
+    global _world_grid
+    _world_grid = Grid(Config.WORLD_SIZE_X, Config.WORLD_SIZE_Y, blocked)
+    route_cache.clear()
+
+
+def plan_route(start, goal):
+    """Plan a route on the world grid.
+
+    Returns a dict with the path, its MOVE directions and the total AP cost,
+    or None if there is no route.
+    """
+    start = tuple(start)
+    goal = tuple(goal)
+    key = (start, goal)
+
+    route = route_cache.get(key)
+    if route is not None:
+        return route
+
+    grid = get_world_grid()
+    path = find_path(grid, start, goal)
+    if path is None:
+        return None
+
+    route = {
+        'path': [list(tile) for tile in path],
+        'directions': path_to_directions(path),
+        'ap_cost': (len(path) - 1) * grid.step_cost
+    }
+    route_cache.put(key, route)
+
+    return route
+
+
+def landmark_tiles():
+    """Tiles holding a building of one of the PATH_LANDMARK_TYPES"""
+    building_ids = list(database.redis_connection.smembers('world:buildings'))
+    if not building_ids:
+        return []
+
+    pipe = database.redis_connection.pipeline(transaction=False)
+    for building_id in building_ids:
+        pipe.hmget(f'building:{building_id}', 'building_type', 'x', 'y')
+
+    return sorted({
+        (int(x), int(y))
+        for building_type, x, y in pipe.execute()
+        if building_type in Config.PATH_LANDMARK_TYPES and x and y
+    })
+
+
+def warm_route_cache(landmarks):
+    """Precompute routes between pairs of landmark tiles.
+
+    Stops once the cache is full, since further routes would only evict
+    the first ones. Returns the number of routes planned.
+    """
+    planned = 0
+    for start in landmarks:
+        for goal in landmarks:
+            if planned >= route_cache.maxsize:
+                return planned
+            if start != goal:
+                plan_route(start, goal)
+                planned += 1
+    return planned
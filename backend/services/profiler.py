@@ -0,0 +1,253 @@
+"""Sampling profiler for routes and socket events.
+
+While profiling is on, a share of requests and socket events is run under
+cProfile. With slow capture on, every request is profiled and the profile
+is kept if it took longer than the threshold, which costs more and is
+meant to be switched on while chasing a slowdown. Requests over the
+threshold that were not profiled are still listed with their timing.
+
+Captures are written to PROFILING_DIR as a pstats file and a JSON summary
+with the time spent in Redis and the top functions, and the directory
+keeps the newest PROFILING_MAX_FILES captures. Settings live in this
+process and can be changed at runtime with update_settings.
+
+cProfile follows the OS thread, so only one request is profiled at a time,
+and a profile also covers other green threads that ran while the request
+waited on I/O. The wall time and Redis figures are the request's own.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import time
+from datetime import datetime
+from functools import wraps
+
+from flask import g
+
+from config import Config
+from services.redis_stats import endpoint_name
+
+# Summaries list this many functions, by cumulative time
+TOP_FUNCTIONS = 15
+
+settings = {
+    'enabled': Config.PROFILING_ENABLED,
+    'sample_rate': Config.PROFILING_SAMPLE_RATE,
+    'slow_ms': Config.PROFILING_SLOW_MS,
+    'capture_slow': Config.PROFILING_CAPTURE_SLOW
+}
+
+# The profile being recorded, only one runs at a time
+_active = None
+
+
+class ProfileCapture:
+    """A request being timed, and profiled if it was picked"""
+
+    __slots__ = ('endpoint', 'started', 'sampled', 'profile')
+
+    def __init__(self, sampled, profile):
+        self.endpoint = None
+        self.started = time.perf_counter()
+        self.sampled = sampled
+        self.profile = profile
+
+
+def update_settings(values):
+    """Change profiling settings at runtime.
+
+    Raises ValueError for unknown settings or invalid values.
+    """
+    unknown = set(values) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown profiling settings: {', '.join(sorted(unknown))}")
+
+    updated = dict(settings)
+    for name in ('enabled', 'capture_slow'):
+        if name in values:
+            if not isinstance(values[name], bool):
+                raise ValueError(f"{name} must be true or false")
+            updated[name] = values[name]
+    for name in ('sample_rate', 'slow_ms'):
+        if name in values:
+            if isinstance(values[name], bool) or not isinstance(values[name], (int, float)):
+                raise ValueError(f"{name} must be a number")
+            updated[name] = values[name]
+
+    if not 0 <= updated['sample_rate'] <= 100:
+        raise ValueError("sample_rate must be a percentage between 0 and 100")
+    if updated['slow_ms'] < 0:
+        raise ValueError("slow_ms must not be negative")
+
+    settings.update(updated)
+    return dict(settings)
+
+
+def start_profile():
+    """Start timing the current request, profiling it if it is picked"""
+    global _active
+
+    if not settings['enabled']:
+        return
+
+    sampled = random.random() * 100 < settings['sample_rate']
+    profile = None
+    if (sampled or settings['capture_slow']) and _active is None:
+        profile = _active = cProfile.Profile()
+        profile.enable()
+
+    g.profile_capture = ProfileCapture(sampled, profile)
+
+
+def finish_profile(exc=None):
+    """Stop timing the current request and save it if it is worth keeping"""
+    global _active
+
+    capture = g.pop('profile_capture', None)
+    if capture is None:
+        return
+
+    elapsed_ms = (time.perf_counter() - capture.started) * 1000
+    if capture.profile is not None:
+        capture.profile.disable()
+        _active = None
+
+    # Named at the end, once handlers have described the request
+    capture.endpoint = endpoint_name()
+
+    slow = settings['slow_ms'] and elapsed_ms >= settings['slow_ms']
+    if not (slow or (capture.sampled and capture.profile is not None)):
+        return
+
+    try:
+        save_capture(capture, elapsed_ms, 'slow' if slow else 'sampled')
+    except OSError as e:
+        print(f"Error saving profile of {capture.endpoint}: {e}")
+
+
+def redis_summary():
+    """Round-trips and time spent in Redis by the current request"""
+    stats = g.get('redis_stats')
+    if stats is None:
+        return None
+    commands, size, seconds = stats.totals()
+    return {'round_trips': stats.round_trips, 'commands': commands, 'bytes': size,
+            'ms': round(seconds * 1000, 3)}
+
+
+def top_functions(profile):
+    """The most expensive functions of a profile, by cumulative time"""
+    stats = pstats.Stats(profile, stream=io.StringIO())
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS]
+    return [
+        {
+            'function': f"{os.path.basename(filename)}:{line}({name})",
+            'calls': calls,
+            'own_ms': round(own * 1000, 3),
+            'total_ms': round(total * 1000, 3)
+        }
+        for (filename, line, name), (_, calls, own, total, _) in rows
+    ]
+
+
+def save_capture(capture, elapsed_ms, reason):
+    """Write a capture to the profile directory and rotate old ones out"""
+    os.makedirs(Config.PROFILING_DIR, exist_ok=True)
+
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', capture.endpoint).strip('-').lower()
+    name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{slug}-{int(elapsed_ms)}ms"
+
+    summary = {
+        'name': name,
+        'endpoint': capture.endpoint,
+        'reason': reason,
+        'ms': round(elapsed_ms, 3),
+        'redis': redis_summary(),
+        'profile': None,
+        'top_functions': [],
+        'captured_at': datetime.now().isoformat()
+    }
+
+    if capture.profile is not None:
+        capture.profile.dump_stats(os.path.join(Config.PROFILING_DIR, f"{name}.prof"))
+        summary['profile'] = f"{name}.prof"
+        summary['top_functions'] = top_functions(capture.profile)
+
+    with open(os.path.join(Config.PROFILING_DIR, f"{name}.json"), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    rotate_captures()
+
+
+def rotate_captures():
+    """Delete the oldest captures beyond PROFILING_MAX_FILES"""
+    names = sorted(
+        filename[:-len('.json')]
+        for filename in os.listdir(Config.PROFILING_DIR)
+        if filename.endswith('.json')
+    )
+    for name in names[:max(0, len(names) - Config.PROFILING_MAX_FILES)]:
+        for extension in ('.json', '.prof'):
+            path = os.path.join(Config.PROFILING_DIR, name + extension)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def list_captures():
+    """Summaries of the saved captures, newest first, without top functions"""
+    if not os.path.isdir(Config.PROFILING_DIR):
+        return []
+
+    captures = []
+    for filename in sorted(os.listdir(Config.PROFILING_DIR), reverse=True):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(Config.PROFILING_DIR, filename)) as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            continue
+        summary.pop('top_functions', None)
+        captures.append(summary)
+    return captures
+
+
+def get_capture(name):
+    """Full summary of a saved capture, or None"""
+    if not re.fullmatch(r'[A-Za-z0-9-]+', name):
+        return None
+    try:
+        with open(os.path.join(Config.PROFILING_DIR, f"{name}.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def profiled(f):
+    """Decorator timing and sampling a socket event handler.
+
+    Routes are covered by the hooks added in register_profiler.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        start_profile()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            finish_profile()
+
+    return decorated_function
+
+
+def register_profiler(app):
+    """Time and sample the routes of an app.
+
+    Register after the Redis instrumentation, so captures can still read
+    the request's Redis stats when they are saved.
+    """
+    app.before_request(start_profile)
+    app.teardown_request(finish_profile)
@@ -0,0 +1,153 @@
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session, jsonify
+from flask_socketio import emit
+
+import database
+from config import Config
+
+# Token bucket stored in a hash with the token count and last refill time.
+# The server clock is used so every worker sees the same time, and buckets
+# expire once they would be full again, which keeps memory bounded.
+#
+# KEYS[1] bucket hash
+# ARGV[1] tokens per second, ARGV[2] bucket capacity, ARGV[3] cost
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+
+return {allowed, tostring(retry_after)}
+"""
+
+# Registered script, created on first use
+_script = None
+
+# Keys known to be out of tokens, with the time they may retry. Repeated
+# requests from a throttled client are rejected here without a round-trip.
+_blocked = OrderedDict()
+
+# Rejections answered from _blocked, and checks that went to Redis
+blocked_hits = 0
+bucket_checks = 0
+
+
+def get_token_bucket_script():
+    """Get the compiled token bucket script"""
+    global _script
+    if _script is None:
+        _script = database.redis_connection.register_script(TOKEN_BUCKET_SCRIPT)
+    return _script
+
+
+def check_rate_limit(name, identity, cost=1):
+    """Take tokens from a client's bucket for a named limit.
+
+    Returns (allowed, retry_after) with retry_after in seconds.
+    """
+    global blocked_hits, bucket_checks
+
+    if not Config.RATE_LIMIT_ENABLED:
+        return True, 0
+
+    limit, period = Config.RATE_LIMITS[name]
+    key = f'ratelimit:{name}:{identity}'
+
+    # Fast path for clients that are already throttled
+    blocked_until = _blocked.get(key)
+    if blocked_until:
+        now = time.time()
+        if now < blocked_until:
+            blocked_hits += 1
+            return False, blocked_until - now
+        del _blocked[key]
+
+    bucket_checks += 1
+    try:
+        allowed, retry_after = get_token_bucket_script()(
+            keys=[key],
+            args=[limit / period, limit, cost],
+            client=database.redis_connection
+        )
+    except Exception as e:
+        # Do not lock everyone out when Redis is unavailable
+        print(f"Error checking rate limit {key}: {e}")
+        return True, 0
+
+    retry_after = float(retry_after)
+    if allowed:
+        return True, 0
+
+    _blocked[key] = time.time() + retry_after
+    _blocked.move_to_end(key)
+    if len(_blocked) > Config.RATE_LIMIT_CACHE_SIZE:
+        _blocked.popitem(last=False)
+
+    return False, retry_after
+
+
+def client_identity():
+    """Identify the client by user, falling back to the remote address"""
+    return session.get('user_id') or request.remote_addr
+
+
+def rate_limit(name, key=None):
+    """Decorator applying a named rate limit to a route.
+
+    key is a function returning the client identity, by default the user ID
+    or the remote address.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            allowed, retry_after = check_rate_limit(name, (key or client_identity)())
+            if not allowed:
+                response = jsonify({'success': False, 'message': 'Rate limit exceeded'})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+                return response
+            return f(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
+
+
+def socket_rate_limit(name):
+    """Decorator applying a named rate limit to a socket event handler"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            identity = session.get('user_id') or request.sid
+            allowed, retry_after = check_rate_limit(name, identity)
+            if not allowed:
+                emit('error', {'message': 'Rate limit exceeded', 'retry_after': round(retry_after, 2)})
+                return
+            return f(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
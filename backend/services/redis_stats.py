@@ -0,0 +1,280 @@
+"""Redis command accounting per request and socket event.
+
+The Redis client is replaced by InstrumentedRedis, which counts commands,
+payload bytes and time per command type. Commands run while handling a
+request or socket event are also attributed to it, and when it finishes its
+totals are added to a per-endpoint summary. A pipeline is one round-trip
+however many commands it sends.
+
+Bytes are the size of the command arguments and of the decoded replies,
+which is close to, but not exactly, what goes over the wire.
+"""
+import time
+
+import redis
+from flask import g, request, has_request_context
+
+from config import Config
+
+
+class RoundTripBudgetExceeded(AssertionError):
+    """A request or socket event made more round-trips than its budget"""
+
+
+class RedisStats:
+    """Command counts, bytes and time spent in Redis"""
+
+    __slots__ = ('round_trips', 'commands')
+
+    def __init__(self):
+        self.round_trips = 0
+        # Command name to [count, bytes sent, bytes received, seconds]
+        self.commands = {}
+
+    def record(self, name, sent, received, seconds):
+        """Count one command"""
+        totals = self.commands.get(name)
+        if totals is None:
+            totals = self.commands[name] = [0, 0, 0, 0.0]
+        totals[0] += 1
+        totals[1] += sent
+        totals[2] += received
+        totals[3] += seconds
+
+    def merge(self, other):
+        """Add another set of stats to these"""
+        self.round_trips += other.round_trips
+        for name, (count, sent, received, seconds) in other.commands.items():
+            totals = self.commands.get(name)
+            if totals is None:
+                totals = self.commands[name] = [0, 0, 0, 0.0]
+            totals[0] += count
+            totals[1] += sent
+            totals[2] += received
+            totals[3] += seconds
+
+    def totals(self):
+        """Commands, bytes and seconds over all command types"""
+        commands = sum(totals[0] for totals in self.commands.values())
+        sent = sum(totals[1] for totals in self.commands.values())
+        received = sum(totals[2] for totals in self.commands.values())
+        seconds = sum(totals[3] for totals in self.commands.values())
+        return commands, sent + received, seconds
+
+    def to_dict(self):
+        commands, size, seconds = self.totals()
+        return {
+            'round_trips': self.round_trips,
+            'commands': commands,
+            'bytes': size,
+            'ms': round(seconds * 1000, 3),
+            'by_command': {
+                name: {'count': count, 'bytes_sent': sent, 'bytes_received': received,
+                       'ms': round(seconds * 1000, 3)}
+                for name, (count, sent, received, seconds) in sorted(self.commands.items())
+            }
+        }
+
+
+class EndpointStats(RedisStats):
+    """Stats of every request to one endpoint"""
+
+    __slots__ = ('requests', 'max_round_trips')
+
+    def __init__(self):
+        super().__init__()
+        self.requests = 0
+        self.max_round_trips = 0
+
+    def add_request(self, stats):
+        """Add the stats of one finished request"""
+        self.requests += 1
+        self.max_round_trips = max(self.max_round_trips, stats.round_trips)
+        self.merge(stats)
+
+    def to_dict(self):
+        result = super().to_dict()
+        result['requests'] = self.requests
+        result['max_round_trips'] = self.max_round_trips
+        result['round_trips_per_request'] = round(self.round_trips / self.requests, 2) if self.requests else 0
+        return result
+
+
+# Everything since startup, and per endpoint
+process_stats = RedisStats()
+endpoint_stats = {}
+
+
+def payload_size(value):
+    """Approximate size in bytes of a command argument or reply"""
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, (list, tuple, set)):
+        return sum(payload_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(payload_size(key) + payload_size(item) for key, item in value.items())
+    if value is None:
+        return 0
+    return len(str(value))
+
+
+def current_stats():
+    """Stats of the request or socket event being handled, if any"""
+    if not has_request_context():
+        return None
+    if 'redis_stats' not in g:
+        g.redis_stats = RedisStats()
+    return g.redis_stats
+
+
+def record_round_trip(commands, seconds):
+    """Record one round-trip carrying (name, args, reply) commands.
+
+    The time of a pipeline is split evenly between its commands.
+    """
+    stats = current_stats()
+    share = seconds / len(commands)
+
+    process_stats.round_trips += 1
+    if stats is not None:
+        stats.round_trips += 1
+
+    for name, args, reply in commands:
+        name = str(name).upper()
+        sent = payload_size(args)
+        received = payload_size(reply)
+        process_stats.record(name, sent, received, share)
+        if stats is not None:
+            stats.record(name, sent, received, share)
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    """Pipeline recording each execute, and each command run while watching"""
+
+    def immediate_execute_command(self, *args, **options):
+        started = time.perf_counter()
+        reply = None
+        try:
+            reply = super().immediate_execute_command(*args, **options)
+            return reply
+        finally:
+            record_round_trip([(args[0], args, reply)], time.perf_counter() - started)
+
+    def execute(self, raise_on_error=True):
+        stack = [args for args, _ in self.command_stack]
+        started = time.perf_counter()
+        replies = ()
+        try:
+            replies = super().execute(raise_on_error)
+            return replies
+        finally:
+            # A failed transaction still cost the round-trip
+            if stack:
+                replies = list(replies) + [None] * (len(stack) - len(replies))
+                record_round_trip(
+                    [(args[0], args, reply) for args, reply in zip(stack, replies)],
+                    time.perf_counter() - started
+                )
+
+
+class InstrumentedRedis(redis.Redis):
+    """Redis client recording every command it sends"""
+
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        reply = None
+        try:
+            reply = super().execute_command(*args, **options)
+            return reply
+        finally:
+            record_round_trip([(args[0], args, reply)], time.perf_counter() - started)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def describe_request(detail):
+    """Summarise the current request under its endpoint plus a detail.
+
+    Handlers use it to split an endpoint by action type.
+    """
+    g.endpoint_detail = detail
+
+
+def endpoint_name():
+    """Name a request or socket event for the summary"""
+    event = getattr(request, 'event', None)
+    if event is not None:
+        name = f"socket {event['message']}"
+    elif request.url_rule is not None:
+        name = f"{request.method} {request.url_rule.rule}"
+    else:
+        return 'unmatched'
+
+    detail = g.get('endpoint_detail')
+    return f"{name} {detail}" if detail else name
+
+
+def round_trip_budget(endpoint):
+    """Round-trips an endpoint may make, or 0 for no limit"""
+    return Config.REDIS_ROUND_TRIP_BUDGETS.get(endpoint, Config.REDIS_ROUND_TRIP_BUDGET)
+
+
+def add_stats_header(response):
+    """after_request hook adding the request's Redis stats as a header"""
+    if Config.REDIS_STATS_HEADER:
+        stats = g.get('redis_stats') or RedisStats()
+        commands, size, seconds = stats.totals()
+        response.headers['X-Redis-Stats'] = (
+            f"round-trips={stats.round_trips}; commands={commands}; bytes={size}; ms={seconds * 1000:.2f}"
+        )
+    return response
+
+
+def finish_request_stats(exc=None):
+    """teardown_request hook adding the request's stats to the summary.
+
+    Runs for socket events too, since Flask-SocketIO handles each event in
+    a request context. Over budget requests are logged, or raise
+    RoundTripBudgetExceeded in strict mode.
+    """
+    stats = g.pop('redis_stats', None)
+    if stats is None:
+        return
+
+    endpoint = endpoint_name()
+    summary = endpoint_stats.get(endpoint)
+    if summary is None:
+        summary = endpoint_stats[endpoint] = EndpointStats()
+    summary.add_request(stats)
+
+    budget = round_trip_budget(endpoint)
+    if budget and stats.round_trips > budget:
+        message = f"{endpoint} made {stats.round_trips} Redis round-trips, the budget is {budget}"
+        if Config.REDIS_STATS_STRICT and exc is None:
+            raise RoundTripBudgetExceeded(message)
+        print(f"Warning: {message}")
+
+
+def get_redis_stats():
+    """Summary of Redis usage since startup, per endpoint and overall"""
+    return {
+        'total': process_stats.to_dict(),
+        'endpoints': {
+            endpoint: stats.to_dict()
+            for endpoint, stats in sorted(endpoint_stats.items())
+        }
+    }
+
+
+def reset_redis_stats():
+    """Forget everything recorded so far"""
+    global process_stats
+    process_stats = RedisStats()
+    endpoint_stats.clear()
+
+
+def register_redis_stats(app):
+    """Attribute Redis commands to the requests and socket events of an app"""
+    app.after_request(add_stats_header)
+    app.teardown_request(finish_request_stats)
@@ -1,30 +1,49 @@
 from datetime import datetime
-from database import redis_connection
-from models.character import regen_ap
+import database
+from models.character import regen_ap, expire_effects
 from config import Config
+from services.action_queue import process_action_queues
+from services.metrics import timed_job
 
 
-def register_scheduled_tasks(scheduler):
-    """Register scheduled tasks with APScheduler"""
+def register_scheduled_tasks(scheduler, socketio):
+    """Register scheduled tasks with APScheduler and the Socket.IO server"""
 
     # AP Regeneration task
     scheduler.add_job(
-        regenerate_ap_for_all_characters,
+        timed_job('ap_regeneration', regenerate_ap_for_all_characters),
         'interval',
         minutes=Config.AP_REGEN_INTERVAL,
         id='ap_regeneration',
         replace_existing=True
     )
 
+    # Action queue task, on the Socket.IO server rather than APScheduler's
+    # thread, because it emits to sockets and moves them between rooms
+    socketio.start_background_task(run_action_queue_worker, socketio)
+
+    # Effect expiry task
+    scheduler.add_job(
+        timed_job('effect_expiry', clean_expired_effects),
+        'interval',
+        seconds=Config.EFFECT_EXPIRY_INTERVAL,
+        id='effect_expiry',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+
     # Other scheduled tasks can be added here
 
-    print(f"Scheduled tasks registered: AP regeneration every {Config.AP_REGEN_INTERVAL} minutes")
+    print(f"Scheduled tasks registered: AP regeneration every {Config.AP_REGEN_INTERVAL} minutes, "
+          f"action queues every {Config.ACTION_QUEUE_INTERVAL} seconds, "
+          f"effect expiry every {Config.EFFECT_EXPIRY_INTERVAL} seconds")
 
 
 def regenerate_ap_for_all_characters():
     """Regenerate AP for all characters"""
     # Get all character IDs
-    character_keys = redis_connection.keys('character:*')
+    character_keys = database.redis_connection.keys('character:*')
 
     # Skip if no characters
     if not character_keys:
@@ -55,8 +74,26 @@ def regenerate_ap_for_all_characters():
     print(f"AP regeneration complete: {processed_count} characters processed at {datetime.now()}")
 
 
+def run_action_queue_worker(socketio):
+    """Advance the action queues every ACTION_QUEUE_INTERVAL seconds, forever"""
+    process_queues = timed_job('action_queues', process_action_queues)
+    while True:
+        socketio.sleep(Config.ACTION_QUEUE_INTERVAL)
+        try:
+            process_queues(socketio)
+        except Exception as e:
+            print(f"Error processing action queues: {e}")
+
+
 def clean_expired_effects():
     """Clean up expired character effects"""
-    # This would loop through all characters and remove any expired effects
-    # For brevity, not fully implemented
-    pass
\ No newline at end of file
+    # Work through due effects in batches until none are left
+    removed_count = 0
+    while True:
+        removed = expire_effects(batch_size=Config.EFFECT_EXPIRY_BATCH_SIZE)
+        removed_count += removed
+        if removed < Config.EFFECT_EXPIRY_BATCH_SIZE:
+            break
+
+    if removed_count:
+        print(f"Effect expiry complete: {removed_count} effects removed at {datetime.now()}")
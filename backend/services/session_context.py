@@ -0,0 +1,107 @@
+from collections import OrderedDict
+
+from flask import g, session
+
+import database
+from config import Config
+from models.character import get_character_by_id
+
+# User ID to character ID, which never changes once the character exists
+_character_ids = OrderedDict()
+
+# User ID to the user's public data. Kept in process rather than in the
+# session, which is a cookie the client can read.
+_users = OrderedDict()
+
+
+class SessionContext:
+    """IDs of the logged in user and their character.
+
+    The character itself is only loaded when a handler asks for it, and then
+    at most once per request or socket event.
+    """
+
+    def __init__(self, user_id, character_id):
+        self.user_id = user_id
+        self.character_id = character_id
+        self._character = None
+
+    def get_character(self, refresh=False):
+        """Load the character, reusing the loaded one unless refresh is set"""
+        if self.character_id and (self._character is None or refresh):
+            self._character = get_character_by_id(self.character_id)
+        return self._character
+
+
+def resolve_character_id(user_id):
+    """Get the character ID of a user from the session, the cache or Redis"""
+    if session.get('character_user_id') == user_id and session.get('character_id'):
+        return session['character_id']
+
+    character_id = _character_ids.get(user_id)
+    if character_id is None:
+        character_id = database.redis_connection.get(f'user:character:{user_id}')
+        if not character_id:
+            return None
+
+        character_id = int(character_id)
+        cache_put(_character_ids, user_id, character_id)
+    else:
+        _character_ids.move_to_end(user_id)
+
+    remember_character(user_id, character_id)
+    return character_id
+
+
+def cache_put(cache, key, value):
+    """Add an entry to one of the session caches, evicting the oldest"""
+    cache[key] = value
+    if len(cache) > Config.SESSION_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def remember_character(user_id, character_id):
+    """Store a user's character ID in the session"""
+    session['character_user_id'] = user_id
+    session['character_id'] = character_id
+
+
+def get_session_context():
+    """Get the context of the current request or socket event.
+
+    Returns None if nobody is logged in.
+    """
+    if 'session_context' in g:
+        return g.session_context
+
+    user_id = session.get('user_id')
+    context = SessionContext(user_id, resolve_character_id(user_id)) if user_id else None
+    g.session_context = context
+
+    return context
+
+
+def remember_user(user):
+    """Cache a user's public data, e.g. after login refreshed it"""
+    cache_put(_users, user['id'], user)
+
+
+def get_session_user(load_user):
+    """Get the public data of the logged in user, cached in process.
+
+    load_user is called with the user ID on a miss and returns the user
+    dict, or None if the user no longer exists.
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return None
+
+    user = _users.get(user_id)
+    if user is not None:
+        _users.move_to_end(user_id)
+        return user
+
+    user = load_user(user_id)
+    if user:
+        remember_user(user)
+    return user
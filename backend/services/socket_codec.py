@@ -0,0 +1,219 @@
+"""MessagePack transport for Socket.IO clients that ask for it.
+
+A client opts in by connecting with auth {'codec': 'msgpack'} (or a
+?codec=msgpack query parameter). The server answers with a 'codec' event,
+always sent as JSON, naming the codec in use and listing the shared key
+dictionary. From then on every event to that client carries a single
+binary argument: the payload packed with MessagePack, with dictionary keys
+replaced by their index in SOCKET_KEYS. Other keys that could be mistaken
+for an index, all digits or starting with KEY_ESCAPE, are sent with
+KEY_ESCAPE in front. Everyone else keeps getting JSON.
+
+Clients keep sending their events as JSON, they are small.
+"""
+import socketio
+from flask.json.provider import DefaultJSONProvider
+
+from config import Config
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+CODEC_JSON = 'json'
+CODEC_MSGPACK = 'msgpack'
+
+# Field names shared by most payloads. Clients decode with the list they
+# were sent at connect, so it can grow, but append to keep indexes stable.
+SOCKET_KEYS = (
+    # Characters
+    'id', 'user_id', 'name', 'health', 'max_health', 'stamina', 'max_stamina',
+    'ap', 'max_ap', 'money', 'experience', 'level', 'x', 'y', 'inside_building',
+    'building_id', 'stats', 'skills', 'attributes', 'effects', 'equipment',
+    'version', 'created_at',
+    # Stats and skills
+    'strength', 'agility', 'intelligence', 'charisma', 'perception', 'tech',
+    'hacking', 'combat', 'stealth', 'engineering', 'medicine', 'persuasion',
+    # World
+    'description', 'tile_type', 'buildings', 'objects', 'npcs', 'flags',
+    'has_buildings', 'building_type', 'interior_description',
+    'access_requirements', 'object_type', 'interaction_data',
+    'map', 'character_position', 'location',
+    # Actions and logs
+    'type', 'ap_cost', 'data', 'options', 'direction', 'label', 'object_id',
+    'action_type', 'character_id', 'character_name', 'message', 'timestamp',
+    'success', 'results', 'remaining', 'logs', 'actions', 'character',
+    # Items
+    'item_code', 'quantity', 'acquired_at', 'definition', 'slot', 'value',
+    'icon', 'damage', 'defense', 'hacking_bonus', 'access_level',
+    'channel', 'text'
+)
+
+KEY_INDEX = {key: index for index, key in enumerate(SOCKET_KEYS)}
+
+# Prefix of keys that are not dictionary indexes but look like one once
+# decoded, clients strip it
+KEY_ESCAPE = '~'
+
+# Key tuples of the dicts seen so far, mapped to their packed keys. Payloads
+# are built from a handful of shapes, so each is only translated once. Dicts
+# keyed by IDs add a shape per combination of IDs, so past MAX_SHAPES new
+# shapes are translated every time instead.
+MAX_SHAPES = 1024
+_shapes = {}
+
+_CONTAINERS = (dict, list, tuple)
+
+
+def msgpack_available():
+    """Check if MessagePack can be offered to clients"""
+    return msgpack is not None and Config.SOCKET_MSGPACK_ENABLED
+
+
+def negotiate_codec(requested):
+    """Pick the codec for a client, falling back to JSON"""
+    if requested == CODEC_MSGPACK and msgpack_available():
+        return CODEC_MSGPACK
+    return CODEC_JSON
+
+
+def codec_info(codec):
+    """Payload of the 'codec' event telling a client how to decode"""
+    if codec == CODEC_MSGPACK:
+        return {'codec': codec, 'keys': list(SOCKET_KEYS)}
+    return {'codec': codec}
+
+
+def compact_key(key):
+    """Get the packed form of a dictionary key.
+
+    Keys that are not strings are converted to strings as JSON would. Keys
+    outside the dictionary that are all digits or start with KEY_ESCAPE get
+    KEY_ESCAPE in front, so only a bare integer means a dictionary index.
+    """
+    if not isinstance(key, str):
+        key = str(key)
+
+    index = KEY_INDEX.get(key)
+    if index is not None:
+        return index
+    if key.isdigit() or key.startswith(KEY_ESCAPE):
+        return KEY_ESCAPE + key
+    return key
+
+
+def compact_keys(obj):
+    """Replace dictionary keys with their SOCKET_KEYS index, see compact_key"""
+    if type(obj) is dict:
+        shape = tuple(obj)
+        packed_keys = _shapes.get(shape)
+        if packed_keys is None:
+            packed_keys = tuple(map(compact_key, shape))
+            if len(_shapes) < MAX_SHAPES:
+                _shapes[shape] = packed_keys
+        return dict(zip(packed_keys, [
+            compact_keys(value) if value and type(value) in _CONTAINERS else value
+            for value in obj.values()
+        ]))
+
+    return [
+        compact_keys(value) if value and type(value) in _CONTAINERS else value
+        for value in obj
+    ]
+
+
+def expand_key(key, keys=SOCKET_KEYS):
+    """Undo compact_key"""
+    if isinstance(key, int):
+        return keys[key]
+    if key.startswith(KEY_ESCAPE):
+        return key[len(KEY_ESCAPE):]
+    return key
+
+
+def expand_keys(obj, keys=SOCKET_KEYS):
+    """Undo compact_keys, for Python clients and benchmarks"""
+    if isinstance(obj, dict):
+        return {expand_key(key, keys): expand_keys(value, keys) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [expand_keys(value, keys) for value in obj]
+    return obj
+
+
+def pack_payload(data):
+    """Pack an event argument for a MessagePack client"""
+    if isinstance(data, _CONTAINERS):
+        data = compact_keys(data)
+    return msgpack.packb(data, default=DefaultJSONProvider.default)
+
+
+def unpack_payload(packed, keys=SOCKET_KEYS):
+    """Unpack an event argument packed by pack_payload"""
+    return expand_keys(msgpack.unpackb(packed, strict_map_key=False), keys)
+
+
+class CodecManager(socketio.BaseManager):
+    """Client manager encoding events with each client's codec.
+
+    An event sent to a room is packed once and the packed bytes are shared
+    by every MessagePack client in it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.codecs = {}
+
+    def set_codec(self, sid, codec):
+        """Record the codec of a connected client"""
+        if codec == CODEC_MSGPACK:
+            self.codecs[sid] = codec
+        else:
+            self.codecs.pop(sid, None)
+
+    def disconnect(self, sid, namespace, **kwargs):
+        self.codecs.pop(sid, None)
+        return super().disconnect(sid, namespace, **kwargs)
+
+    def emit(self, event, data, namespace, room=None, skip_sid=None,
+             callback=None, **kwargs):
+        if not self.codecs:
+            return super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                                callback=callback, **kwargs)
+
+        if namespace not in self.rooms:
+            return
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+
+        packed = None
+        for sid, eio_sid in self.get_participants(namespace, room):
+            if sid in skip_sid:
+                continue
+
+            payload = data
+            if sid in self.codecs:
+                if packed is None:
+                    packed = tuple(map(pack_payload, data)) if isinstance(data, tuple) else pack_payload(data)
+                payload = packed
+
+            ack_id = self._generate_ack_id(sid, callback) if callback is not None else None
+            self.server._emit_internal(eio_sid, event, payload, namespace, ack_id)
+
+
+def start_client_codec(socketio_app, sid, requested):
+    """Negotiate a client's codec, tell the client and switch to it.
+
+    Returns the codec in use. Clients that did not ask for a codec are not
+    told anything, and the 'codec' event itself always goes out as JSON since
+    the client cannot decode anything else yet.
+    """
+    manager = socketio_app.server.manager
+    codec = negotiate_codec(requested) if isinstance(manager, CodecManager) else CODEC_JSON
+
+    if requested:
+        socketio_app.emit('codec', codec_info(codec), to=sid)
+    if isinstance(manager, CodecManager):
+        manager.set_codec(sid, codec)
+
+    return codec
@@ -0,0 +1,57 @@
+"""Response compression for large REST payloads.
+
+Brotli is offered when the brotli package is installed and the client
+accepts it, gzip otherwise. Responses below COMPRESSION_MIN_SIZE go out as
+they are, compressing them costs more than sending the bytes.
+"""
+import gzip
+
+from flask import request
+
+from config import Config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript')
+
+
+def supported_encodings():
+    """List the encodings this server can produce, preferred first"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress(data, encoding):
+    """Compress bytes with an encoding from supported_encodings"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=Config.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=Config.COMPRESSION_GZIP_LEVEL)
+
+
+def compress_response(response):
+    """after_request hook compressing large responses the client accepts"""
+    if not Config.COMPRESSION_ENABLED:
+        return response
+
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    data = response.get_data()
+    if len(data) < Config.COMPRESSION_MIN_SIZE:
+        return response
+
+    encoding = request.accept_encodings.best_match(supported_encodings())
+    if not encoding:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+
+    return response
@@ -0,0 +1,154 @@
+"""JSON encoding shared by routes, socket emits and the Redis codec.
+
+The backend is picked once from Config.JSON_BACKEND. 'auto' prefers orjson,
+then msgspec, and falls back to the standard library, so the game runs the
+same without either package installed, only slower.
+"""
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+from config import Config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+JSON_BACKENDS = ('orjson', 'msgspec', 'json')
+
+# Name of the backend in use, set by set_json_backend
+json_backend = None
+
+_dumps = None
+_loads = None
+
+
+def available_backends():
+    """List the JSON backends that can be imported here, fastest first"""
+    installed = {'orjson': orjson, 'msgspec': msgspec, 'json': json}
+    return [name for name in JSON_BACKENDS if installed[name] is not None]
+
+
+def make_codec(name):
+    """Build (dumps, loads) for a backend.
+
+    dumps(obj, default=None, pretty=False) returns UTF-8 bytes and
+    loads accepts bytes or str. Dict keys that are not strings are
+    converted to strings, as the standard library does.
+    """
+    if name == 'orjson':
+        def dumps(obj, default=None, pretty=False):
+            options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+            if pretty:
+                options |= orjson.OPT_INDENT_2
+            return orjson.dumps(obj, default=default, option=options)
+
+        return dumps, orjson.loads
+
+    if name == 'msgspec':
+        encoders = {}
+        decoder = msgspec.json.Decoder()
+
+        def dumps(obj, default=None, pretty=False):
+            encoder = encoders.get(default)
+            if encoder is None:
+                encoder = encoders[default] = msgspec.json.Encoder(enc_hook=default)
+            data = encoder.encode(obj)
+            return msgspec.json.format(data, indent=2) if pretty else data
+
+        def loads(data):
+            try:
+                return decoder.decode(data)
+            except msgspec.DecodeError as e:
+                raise ValueError(str(e)) from e
+
+        return dumps, loads
+
+    if name == 'json':
+        def dumps(obj, default=None, pretty=False):
+            if pretty:
+                return json.dumps(obj, default=default, indent=2).encode()
+            return json.dumps(obj, default=default, separators=(',', ':')).encode()
+
+        return dumps, json.loads
+
+    raise ValueError(f"Unknown JSON backend: {name}")
+
+
+def set_json_backend(name='auto'):
+    """Switch the JSON backend, 'auto' picks the fastest one installed"""
+    global json_backend, _dumps, _loads
+
+    if name == 'auto':
+        name = available_backends()[0]
+    elif name not in available_backends():
+        raise ValueError(f"JSON backend {name} is not installed")
+
+    _dumps, _loads = make_codec(name)
+    json_backend = name
+
+
+def dumps_bytes(obj, default=None, pretty=False):
+    """Encode an object as JSON bytes"""
+    return _dumps(obj, default=default, pretty=pretty)
+
+
+def dumps(obj, default=None):
+    """Encode an object as a JSON string"""
+    return _dumps(obj, default=default).decode()
+
+
+def loads(data):
+    """Decode a JSON string or bytes.
+
+    Raises ValueError on invalid input, whatever the backend.
+    """
+    return _loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider encoding with the selected backend.
+
+    Keys are not sorted, clients do not depend on the order and sorting
+    large payloads costs more than encoding them.
+    """
+
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        """Encode for json.dumps compatible callers"""
+        if kwargs.get('sort_keys') or kwargs.get('cls'):
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj, default=self.default, pretty=bool(kwargs.get('indent'))).decode()
+
+    def loads(self, s, **kwargs):
+        """Decode request bodies"""
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        """Build a JSON response without decoding the encoded bytes"""
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        body = dumps_bytes(obj, default=self.default, pretty=pretty)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+class SocketJSON:
+    """JSON module interface python-socketio encodes packets with"""
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return dumps(obj, default=DefaultJSONProvider.default)
+
+    @staticmethod
+    def loads(s, **kwargs):
+        return loads(s)
+
+
+set_json_backend(Config.JSON_BACKEND)
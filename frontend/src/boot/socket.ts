@@ -1,6 +1,11 @@
 import { boot } from 'quasar/wrappers';
 import { io, Socket } from 'socket.io-client';
 import { Notify } from 'quasar';
+import { decode } from '@msgpack/msgpack';
+
+// Key dictionary of the MessagePack codec, sent by the server on connect.
+// Empty while the server talks JSON.
+let socketKeys: string[] = [];
 
 // Create a Socket.io instance
 const socket: Socket = io(process.env.API_URL || 'http://localhost:5000', {
@@ -11,6 +16,54 @@ const socket: Socket = io(process.env.API_URL || 'http://localhost:5000', {
   reconnectionDelayMax: 5000,
   timeout: 20000, // 20 seconds
   withCredentials: true, // Important for session cookies
+  auth: { codec: 'msgpack' }, // Ask for binary events, the server may answer JSON
+});
+
+// Prefix the server puts on keys that would otherwise look like an index
+const KEY_ESCAPE = '~';
+
+// Replace dictionary indexes with the key names they stand for. Keys that
+// are numbers or start with KEY_ESCAPE are sent escaped, so a numeric key is
+// always an index.
+const expandKey = (key: string): string => {
+  if (/^\d+$/.test(key)) {
+    return socketKeys[Number(key)];
+  }
+  return key.startsWith(KEY_ESCAPE) ? key.slice(KEY_ESCAPE.length) : key;
+};
+
+const expandKeys = (value: any): any => {
+  if (Array.isArray(value)) {
+    return value.map(expandKeys);
+  }
+
+  if (value !== null && typeof value === 'object') {
+    const result: Record<string, any> = {};
+    Object.entries(value).forEach(([key, item]) => {
+      result[expandKey(key)] = expandKeys(item);
+    });
+    return result;
+  }
+
+  return value;
+};
+
+// Decode an event payload, packed payloads arrive as binary
+const decodePayload = (data: any): any => {
+  if (data instanceof ArrayBuffer || ArrayBuffer.isView(data)) {
+    return expandKeys(decode(data as ArrayBuffer));
+  }
+  return data;
+};
+
+// Listen to a server event with its payload decoded
+const onEvent = (event: string, handler: (data: any) => void) => {
+  socket.on(event, (data: any) => handler(decodePayload(data)));
+};
+
+// The server tells which codec it picked before sending anything else
+socket.on('codec', (data) => {
+  socketKeys = data.codec === 'msgpack' ? data.keys : [];
 });
 
 // Handle socket events
@@ -33,7 +86,7 @@ socket.on('connect_error', (error) => {
   });
 });
 
-socket.on('error', (error) => {
+onEvent('error', (error) => {
   console.error('Socket error:', error);
 
   Notify.create({
@@ -66,4 +119,4 @@ const disconnectSocket = () => {
 };
 
 // Export the socket for use in other files
-export { socket, connectSocket, disconnectSocket };
\ No newline at end of file
+export { socket, onEvent, connectSocket, disconnectSocket };
\ No newline at end of file
@@ -1,7 +1,7 @@
 import { defineStore } from 'pinia';
 import { api } from 'src/boot/axios';
 import { Notify } from 'quasar';
-import { socket } from 'src/boot/socket';
+import { socket, onEvent } from 'src/boot/socket';
 
 // Define interfaces for game data
 interface Character {
@@ -26,7 +26,6 @@ interface Character {
   attributes: Record<string, number>;
   effects: any[];
   equipment: Record<string, string>;
-  inventory: any[];
   created_at: string;
 }
 
@@ -82,6 +81,9 @@ interface GameState {
   chatMessages: ChatMessage[];
   inventory: any[];
   equipment: Record<string, any>;
+  itemCatalog: Record<string, any>;
+  catalogVersion: string | null;
+  queueRemaining: number;
   isLoading: boolean;
   error: string | null;
   socketConnected: boolean;
@@ -97,6 +99,9 @@ export const useGameStore = defineStore('game', {
     chatMessages: [],
     inventory: [],
     equipment: {},
+    itemCatalog: {},
+    catalogVersion: null,
+    queueRemaining: 0,
     isLoading: false,
     error: null,
     socketConnected: false
@@ -150,16 +155,8 @@ export const useGameStore = defineStore('game', {
         // Set up socket listeners
         this.setupSocketListeners();
 
-        // Load initial data via REST
-        await Promise.all([
-          this.loadCharacter(),
-          this.loadMap(),
-          this.loadLocation(),
-          this.loadActions(),
-          this.loadLogs(),
-          this.loadInventory(),
-          this.loadEquipment()
-        ]);
+        // Load initial data via REST in a single request
+        await this.loadState();
 
         return true;
       } catch (error: any) {
@@ -193,28 +190,63 @@ export const useGameStore = defineStore('game', {
       });
 
       // Game data updates
-      socket.on('character_update', (data) => {
+      onEvent('character_update', (data) => {
         this.character = data;
       });
 
-      socket.on('map_update', (data) => {
+      onEvent('map_update', (data) => {
         this.map = data.map;
       });
 
-      socket.on('location_update', (data) => {
+      onEvent('location_update', (data) => {
         this.location = data;
       });
 
-      socket.on('actions_update', (data) => {
+      onEvent('actions_update', (data) => {
         this.actions = data;
       });
 
-      socket.on('logs_update', (data) => {
+      onEvent('logs_update', (data) => {
         this.logs = data;
       });
 
+      // Batched results of queued actions
+      onEvent('queue_update', (data) => {
+        this.queueRemaining = data.remaining;
+
+        if (data.character) {
+          this.character = data.character;
+        }
+
+        if (data.actions) {
+          this.actions = data.actions;
+        }
+
+        if (data.logs) {
+          this.logs = data.logs;
+        }
+
+        if (data.location) {
+          this.location = data.location;
+        }
+
+        if (data.map) {
+          this.map = data.map.map;
+        }
+
+        const failed = data.results.find((result: any) => !result.success);
+        if (failed) {
+          Notify.create({
+            type: 'negative',
+            message: failed.message,
+            position: 'top',
+            timeout: 3000
+          });
+        }
+      });
+
       // Chat messages
-      socket.on('chat_message', (data) => {
+      onEvent('chat_message', (data) => {
         this.chatMessages.push(data);
 
         // Limit chat history to 100 messages
@@ -224,7 +256,7 @@ export const useGameStore = defineStore('game', {
       });
 
       // Messages and errors
-      socket.on('message', (data) => {
+      onEvent('message', (data) => {
         Notify.create({
           type: 'info',
           message: data.text,
@@ -233,7 +265,7 @@ export const useGameStore = defineStore('game', {
         });
       });
 
-      socket.on('error', (data) => {
+      onEvent('error', (data) => {
         Notify.create({
           type: 'negative',
           message: data.message,
@@ -243,7 +275,7 @@ export const useGameStore = defineStore('game', {
       });
 
       // Player presence events
-      socket.on('player_entered', (data) => {
+      onEvent('player_entered', (data) => {
         Notify.create({
           type: 'info',
           message: `${data.character_name} entered the area`,
@@ -252,7 +284,7 @@ export const useGameStore = defineStore('game', {
         });
       });
 
-      socket.on('player_left', (data) => {
+      onEvent('player_left', (data) => {
         Notify.create({
           type: 'info',
           message: `${data.character_name} left the area`,
@@ -262,6 +294,37 @@ export const useGameStore = defineStore('game', {
       });
     },
 
+    // Load the whole game state, or the given parts of it
+    async loadState(fields?: string[]) {
+      try {
+        const response = await api.get('/api/game/state', {
+          params: fields ? { fields: fields.join(',') } : {}
+        });
+
+        if (!response.data.success) {
+          throw new Error(response.data.message || 'Failed to load game state');
+        }
+
+        const state = response.data;
+        if (state.character) this.character = state.character;
+        if (state.map) this.map = state.map.map;
+        if (state.location) this.location = state.location;
+        if (state.actions) this.actions = state.actions;
+        if (state.logs) this.logs = state.logs;
+        if (state.inventory) {
+          this.inventory = await this.resolveItems(state.inventory, state.catalog_version);
+        }
+        if (state.equipment) {
+          const slots = Object.keys(state.equipment);
+          const items = await this.resolveItems(Object.values(state.equipment), state.catalog_version);
+          this.equipment = Object.fromEntries(slots.map((slot, index) => [slot, items[index]]));
+        }
+      } catch (error: any) {
+        console.error('Error loading game state:', error);
+        throw new Error(error.response?.data?.message || error.message || 'Failed to load game state');
+      }
+    },
+
     // Load character data
     async loadCharacter() {
       try {
@@ -342,13 +405,42 @@ export const useGameStore = defineStore('game', {
       }
     },
 
+    // Load item catalog, the browser revalidates it by ETag
+    async loadItemCatalog() {
+      try {
+        const response = await api.get('/api/game/items');
+
+        if (response.data.success) {
+          this.itemCatalog = response.data.items;
+          this.catalogVersion = response.data.version;
+        } else {
+          throw new Error(response.data.message || 'Failed to load item catalog');
+        }
+      } catch (error: any) {
+        console.error('Error loading item catalog:', error);
+        throw new Error(error.response?.data?.message || error.message || 'Failed to load item catalog');
+      }
+    },
+
+    // Attach catalog definitions to items that reference them by code
+    async resolveItems(items: any[], catalogVersion: string) {
+      if (catalogVersion !== this.catalogVersion) {
+        await this.loadItemCatalog();
+      }
+
+      return items.map((item) => ({
+        ...item,
+        definition: this.itemCatalog[item.item_code]
+      }));
+    },
+
     // Load inventory
     async loadInventory() {
       try {
         const response = await api.get('/api/game/inventory');
 
         if (response.data.success) {
-          this.inventory = response.data.inventory;
+          this.inventory = await this.resolveItems(response.data.inventory, response.data.catalog_version);
         } else {
           throw new Error(response.data.message || 'Failed to load inventory');
         }
@@ -364,7 +456,9 @@ export const useGameStore = defineStore('game', {
         const response = await api.get('/api/game/equipment');
 
         if (response.data.success) {
-          this.equipment = response.data.equipment;
+          const slots = Object.keys(response.data.equipment);
+          const items = await this.resolveItems(Object.values(response.data.equipment), response.data.catalog_version);
+          this.equipment = Object.fromEntries(slots.map((slot, index) => [slot, items[index]]));
         } else {
           throw new Error(response.data.message || 'Failed to load equipment');
         }
@@ -442,6 +536,30 @@ export const useGameStore = defineStore('game', {
       }
     },
 
+    // Queue a sequence of actions or a path of directions
+    queueActions(queue: { actions?: any[]; path?: string[] }) {
+      if (!this.socketConnected) return false;
+
+      socket.emit('queue_actions', queue);
+      return true;
+    },
+
+    // Travel to a tile along a server-planned route
+    travelTo(x: number, y: number) {
+      if (!this.socketConnected) return false;
+
+      socket.emit('travel', { x, y });
+      return true;
+    },
+
+    // Drop pending queued actions
+    clearQueue() {
+      if (!this.socketConnected) return false;
+
+      socket.emit('clear_queue');
+      return true;
+    },
+
     // Send chat message
     sendChatMessage(message: string, channel: string = 'location') {
       if (!message.trim()) return false;